@@ -3,12 +3,17 @@ from typing import List, Optional, AsyncGenerator, Tuple
 from dropbox.exceptions import AuthError
 from dropbox_service import DropboxService, TokenExpiredError, InvalidTokenError
 from file_processor import FileProcessor
-from config import logger, ALL_FILE_EXTENSIONS, AUDIO_EXTENSIONS, VIDEO_EXTENSIONS
+from job_scheduler import JobScheduler, LinkJob
+from pipeline import LinkPipeline
+from sharded_runner import ShardedRunner
+from progress import ProgressTracker, subscribe_logging
+from config import logger, ALL_FILE_EXTENSIONS, AUDIO_EXTENSIONS, VIDEO_EXTENSIONS, DROPBOX_BACKEND, METRICS_FILE
 
 class AppController:
-    def __init__(self):
-        self.dropbox_service = DropboxService()
+    def __init__(self, dropbox_service: Optional[DropboxService] = None):
+        self.dropbox_service = dropbox_service or DropboxService()
         self.file_processor = None
+        self.last_output_file = None  # Where the last generate_links run wrote; a delta file for delta runs
         logger.debug("AppController initialized")
 
     def set_access_token(self, access_token: str):
@@ -20,28 +25,111 @@ class AppController:
         else:
             raise InvalidTokenError("The provided access token is invalid")
 
-    async def generate_links(self, folder_path, output_file, output_format, file_types):
+    async def generate_links(self, folder_path, output_file, output_format, file_types, incremental=False,
+                             resume=False, file_filter=None, concurrency=None,
+                             progress: Optional[ProgressTracker] = None, metrics_file: Optional[str] = METRICS_FILE):
         if not self.file_processor:
             raise ValueError("Access token not set or invalid. Call set_access_token() first.")
         
         logger.info(f"Generating links for folder: {folder_path}")
         logger.info(f"File types: {file_types}")
-        files = await self.file_processor.collect_files(folder_path, file_types)
-        if not files:
-            logger.warning("No files collected")
-            yield 0, 0
-            return
+        if incremental:
+            logger.info("Incremental run: only changes since the last completed run will be written")
+        # Listing, filtering, link creation and writing overlap; the total grows while listing continues.
+        pipeline = LinkPipeline(self.file_processor, concurrency=concurrency)
+        self.last_output_file = output_file
+        # Subscribers get coalesced snapshots; the per-file yields below stay cheap.
+        progress = progress or ProgressTracker()
+        unsubscribe_log = subscribe_logging(progress)
+        progress.attach(pipeline, self.dropbox_service.rate_limiter)
+        progress.start()
+        # Metrics cover one job; dump them even when it fails, that is when they are most useful.
+        metrics = self.dropbox_service.metrics
+        metrics.reset()
+        try:
+            async for processed_count, discovered_count in pipeline.run(
+                    folder_path, output_file, output_format, file_types, incremental, resume, file_filter):
+                yield processed_count, discovered_count
+        finally:
+            progress.stop()
+            unsubscribe_log()
+            self.last_output_file = pipeline.output_file or output_file
+            logger.info(f"API calls: {metrics.summary()}")
+            if metrics_file:
+                try:
+                    metrics.write(metrics_file)
+                except OSError as e:
+                    logger.error(f"Could not write API metrics to {metrics_file}: {str(e)}")
 
-        total_files = sum(len(folder_files) for folder_files in files.values())
-        logger.info(f"Total files collected: {total_files}")
-        if total_files == 0:
-            logger.warning("No files to process")
+        if pipeline.discovered == 0:
+            if pipeline.deleted_paths:
+                logger.info(f"No new or changed files; {len(pipeline.deleted_paths)} deletions written")
+            else:
+                logger.warning("No files to process")
             yield 0, 0
             return
 
-        logger.info(f"Collected {total_files} files from {len(files)} folders. Starting processing...")
-        async for processed_count, total_files in self.file_processor.process_files(files, output_file, output_format):
-            yield processed_count, total_files
+        logger.info(f"Processed {pipeline.processed} files ({pipeline.skipped} already done, {pipeline.errors} failed) "
+                    f"out of {pipeline.listed} listed entries")
+        logger.info(f"Link cache stats: {self.dropbox_service.link_cache.stats()}")
+
+    async def run_jobs(self, jobs: List[LinkJob], concurrency: Optional[int] = None, order: str = 'path',
+                       progress: Optional[ProgressTracker] = None, metrics_file: Optional[str] = METRICS_FILE):
+        """Run several roots as one scheduled batch; see JobScheduler. Yields ``(processed, total)``."""
+        if not self.file_processor:
+            raise ValueError("Access token not set or invalid. Call set_access_token() first.")
+        scheduler = JobScheduler(self.file_processor, jobs, concurrency=concurrency, order=order)
+        progress = progress or ProgressTracker()
+        unsubscribe_log = subscribe_logging(progress)
+        progress.attach(scheduler, self.dropbox_service.rate_limiter)
+        progress.start()
+        metrics = self.dropbox_service.metrics
+        metrics.reset()
+        try:
+            async for processed_count, total in scheduler.run():
+                yield processed_count, total
+        finally:
+            progress.stop()
+            unsubscribe_log()
+            logger.info(f"API calls: {metrics.summary()}")
+            if metrics_file:
+                try:
+                    metrics.write(metrics_file)
+                except OSError as e:
+                    logger.error(f"Could not write API metrics to {metrics_file}: {str(e)}")
+        for job in scheduler.jobs:
+            logger.info(f"{job.root or '/'}: {job.written} of {job.matched} links written to {job.output_file}")
+
+    async def generate_links_sharded(self, folder_path, output_file, output_format, file_types, processes: int,
+                                     file_filter=None, concurrency=None, backend: str = DROPBOX_BACKEND,
+                                     progress: Optional[ProgressTracker] = None,
+                                     metrics_file: Optional[str] = METRICS_FILE):
+        """Like ``generate_links``, but resolves links in ``processes`` worker processes; see ShardedRunner."""
+        if not self.file_processor:
+            raise ValueError("Access token not set or invalid. Call set_access_token() first.")
+        logger.info(f"Generating links for folder: {folder_path} with {processes} processes")
+        runner = ShardedRunner(self.file_processor, processes, concurrency=concurrency, backend=backend)
+        self.last_output_file = output_file
+        progress = progress or ProgressTracker()
+        unsubscribe_log = subscribe_logging(progress)
+        progress.attach(runner, runner)
+        progress.start()
+        metrics = self.dropbox_service.metrics
+        metrics.reset()
+        try:
+            async for processed_count, total in runner.run(folder_path, output_file, output_format, file_types,
+                                                           file_filter):
+                yield processed_count, total
+        finally:
+            progress.stop()
+            unsubscribe_log()
+            logger.info(f"API calls: {metrics.summary()}")
+            if metrics_file:
+                try:
+                    metrics.write(metrics_file)
+                except OSError as e:
+                    logger.error(f"Could not write API metrics to {metrics_file}: {str(e)}")
+        logger.info(f"Processed {runner.processed} files ({runner.errors} failed) in {processes} processes")
 
     def is_token_valid(self):
         return self.dropbox_service and self.dropbox_service.is_token_valid()
@@ -0,0 +1,96 @@
+import asyncio
+from typing import (
+    AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Set, Tuple, TypeVar, Union
+)
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def _next_item(items: Union[Iterable[T], AsyncIterable[T]]) -> Callable[[], Awaitable[T]]:
+    """An async ``next()`` over a sync or async iterable, raising StopAsyncIteration at the end."""
+    if hasattr(items, '__aiter__'):
+        return items.__aiter__().__anext__
+    iterator = iter(items)
+
+    async def next_item():
+        try:
+            return next(iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    return next_item
+
+
+class _Reorderer:
+    """Launches the workers of one ``ordered_map`` call and releases their results in order."""
+
+    def __init__(self, worker: Callable[[T], Awaitable[R]], next_item: Callable[[], Awaitable[T]],
+                 concurrency: int, window: int):
+        self.worker = worker
+        self.next_item = next_item
+        self.concurrency = concurrency
+        self.window = window
+        self.pending: Dict[int, Tuple[T, asyncio.Future]] = {}  # index -> (item, task), in launch order
+        self.in_flight: Set[asyncio.Future] = set()
+        self.launched = 0
+        self.released = 0
+        self.exhausted = False
+
+    @property
+    def finished(self) -> bool:
+        return self.exhausted and not self.pending
+
+    def drain(self) -> Iterator[Tuple[T, R]]:
+        """Release finished results from the front of the reorder buffer."""
+        while self.released in self.pending and self.pending[self.released][1].done():
+            item, task = self.pending.pop(self.released)
+            self.released += 1
+            yield item, task.result()
+
+    async def fill(self) -> None:
+        """Start workers until the concurrency limit, the window or the end of the items is reached."""
+        while (not self.exhausted and len(self.in_flight) < self.concurrency
+               and self.launched - self.released < self.window):
+            try:
+                item = await self.next_item()
+            except StopAsyncIteration:
+                self.exhausted = True
+                return
+            task = asyncio.ensure_future(self.worker(item))
+            self.pending[self.launched] = (item, task)
+            self.in_flight.add(task)
+            self.launched += 1
+
+    async def wait(self) -> None:
+        if self.in_flight:
+            _, self.in_flight = await asyncio.wait(self.in_flight, return_when=asyncio.FIRST_COMPLETED)
+
+    def cancel(self) -> None:
+        for _, task in self.pending.values():
+            task.cancel()
+
+
+async def ordered_map(worker: Callable[[T], Awaitable[R]], items: Union[Iterable[T], AsyncIterable[T]],
+                      concurrency: int, window: Optional[int] = None) -> AsyncIterator[Tuple[T, R]]:
+    """Run ``worker`` over ``items`` concurrently and yield ``(item, result)`` in input order.
+
+    At most ``concurrency`` workers are in flight. Finished results wait in a reorder
+    buffer until every earlier item has been yielded; ``window`` (default four times
+    ``concurrency``) caps how far ahead of the oldest unfinished item work may start,
+    which bounds the buffer when one call is slow. Outstanding workers are cancelled
+    if the consumer stops iterating early.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    reorderer = _Reorderer(worker, _next_item(items), concurrency, max(window or concurrency * 4, concurrency))
+    try:
+        while True:
+            for item, result in reorderer.drain():
+                yield item, result
+            await reorderer.fill()
+            if reorderer.finished:
+                return
+            await reorderer.wait()
+    finally:
+        reorderer.cancel()
@@ -0,0 +1,234 @@
+"""Throughput of collection, link generation, link caching and output at scale.
+
+Runs the real ``FileProcessor`` and output writers against ``FakeDropbox``
+accounts of each requested size, with simulated per-call latency. Each size runs
+in a fresh interpreter so peak RSS is not inflated by an earlier, larger run.
+The stages, in order, are:
+
+- collect: ``FileProcessor.collect_files`` over the whole account;
+- process: ``FileProcessor.process_files`` into a txt file, starting from an
+  empty link cache, so existing links come from the shared link index and the
+  rest are created;
+- cached_links: ``DropboxService.get_cached_share_link`` for every file again,
+  now served by the link cache;
+- output_<format>: each registered output writer writing every record.
+
+For each stage the wall time, API calls issued, files/s and peak RSS so far are
+reported. Results are saved as JSON; ``--compare`` flags stages whose files/s
+dropped against an earlier results file.
+
+    python benchmarks/scale_benchmark.py [--sizes 1k 100k 1m] [--latency 0.005]
+        [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+FILE_TYPES = ['Audio', 'Video', 'Image', 'Document']
+SIZE_SUFFIXES = {'k': 1_000, 'm': 1_000_000}
+
+
+def parse_size(text: str) -> int:
+    text = text.lower().replace('_', '')
+    if text[-1:] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Stage:
+    """Times one stage and counts the fake's API calls during it."""
+
+    def __init__(self, fake, results: Dict, name: str):
+        self.fake = fake
+        self.results = results
+        self.name = name
+        self.files = 0
+
+    def __enter__(self) -> 'Stage':
+        self.calls = sum(self.fake.calls.values())
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        seconds = time.perf_counter() - self.started
+        self.results[self.name] = {
+            'seconds': seconds,
+            'files': self.files,
+            'files_per_second': self.files / seconds if seconds > 0 else 0.0,
+            'api_calls': sum(self.fake.calls.values()) - self.calls,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+
+
+async def run_size(files: int, args: argparse.Namespace, workdir: str) -> Dict:
+    from async_utils import ordered_map
+    from config import logger
+    from dropbox_service import DropboxService
+    from fake_dropbox import FakeDropbox
+    from file_processor import FileProcessor
+    from link_cache import create_link_cache
+    from output_writers import OUTPUT_WRITERS, OutputRecord, create_writer
+    from rate_limiter import TokenBucketRateLimiter
+
+    logger.setLevel(logging.WARNING)
+    fake = FakeDropbox(files=files, depth=args.depth, fanout=args.fanout, latency=args.latency,
+                       existing_link_ratio=args.existing_links, seed=args.seed)
+    # The fake stands in for the API's latency; the client-side limit is lifted so it does not dominate.
+    service = DropboxService(client=fake, rate_limiter=TokenBucketRateLimiter(1e6, 1000),
+                             link_cache=create_link_cache(db_path=os.path.join(workdir, 'links.sqlite3')))
+    service.set_access_token('fake')
+    processor = FileProcessor(service)
+    results: Dict = {}
+
+    with Stage(fake, results, 'collect') as stage:
+        collected = await processor.collect_files('', FILE_TYPES, traversal=args.traversal)
+        stage.files = len(collected)
+
+    with Stage(fake, results, 'process') as stage:
+        async for processed, _ in processor.process_files(collected, os.path.join(workdir, 'links.txt'), 'txt',
+                                                          concurrency=args.concurrency):
+            stage.files = processed
+
+    paths = list(collected)
+    with Stage(fake, results, 'cached_links') as stage:
+        async for _, url in ordered_map(lambda item: service.get_cached_share_link(item[1]), paths, args.concurrency):
+            stage.files += 1
+
+    records = [OutputRecord(folder, path, f'https://dl.dropboxusercontent.com/s/{i:016x}/x?raw=1')
+               for i, (folder, path) in enumerate(paths)]
+    for output_format in OUTPUT_WRITERS:
+        with Stage(fake, results, f'output_{output_format}') as stage:
+            writer = create_writer(output_format, os.path.join(workdir, f'links.{output_format}'))
+            await writer.open()
+            for record in records:
+                await writer.write(record)
+            await writer.close()
+            stage.files = len(records)
+    return results
+
+
+def run_child(files: int, args: argparse.Namespace) -> Dict:
+    """Run one size in a fresh interpreter and return its results."""
+    command = [sys.executable, os.path.abspath(__file__), '--child', str(files),
+               '--latency', str(args.latency), '--concurrency', str(args.concurrency),
+               '--traversal', args.traversal, '--depth', str(args.depth), '--fanout', str(args.fanout),
+               '--existing-links', str(args.existing_links), '--seed', str(args.seed)]
+    result = subprocess.run(command, capture_output=True, text=True, cwd=REPO_DIR)
+    if result.returncode != 0:
+        raise RuntimeError(f"{files} files failed:\n{result.stderr.strip()}")
+    return json.loads(result.stdout)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        result = subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                                cwd=REPO_DIR)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    regressions = []
+    for size, stages in results['results'].items():
+        for name, stage in stages.items():
+            before = baseline.get('results', {}).get(size, {}).get(name)
+            if before and before['files_per_second'] > 0:
+                change = stage['files_per_second'] / before['files_per_second'] - 1
+                if change < -threshold:
+                    regressions.append(f"{size} files, {name}: {before['files_per_second']:.0f} -> "
+                                       f"{stage['files_per_second']:.0f} files/s ({change:+.0%})")
+    return regressions
+
+
+def print_table(results: Dict) -> None:
+    print(f"{'files':>9}  {'stage':<16}{'seconds':>10}{'files/s':>12}{'API calls':>11}{'peak RSS MB':>13}")
+    for size, stages in results['results'].items():
+        for name, stage in stages.items():
+            rss = f"{stage['peak_rss_mb']:.0f}" if stage['peak_rss_mb'] is not None else '-'
+            print(f"{size:>9}  {name:<16}{stage['seconds']:>10.2f}{stage['files_per_second']:>12.0f}"
+                  f"{stage['api_calls']:>11}{rss:>13}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Collection, link generation, caching and output at scale")
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=[1_000, 100_000, 1_000_000],
+                        help="Account sizes in files, e.g. 1k 100k 1m")
+    parser.add_argument('--latency', type=float, default=0.005, help="Mean simulated seconds per API call")
+    parser.add_argument('--concurrency', type=int, default=50, help="Share-link requests in flight")
+    parser.add_argument('--traversal', choices=['recursive', 'concurrent'], default='recursive')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fanout', type=int, default=5)
+    parser.add_argument('--existing-links', type=float, default=0.9,
+                        help="Fraction of files that already have a shared link")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Results file (default: benchmarks/results/scale-<timestamp>.json)")
+    parser.add_argument('--compare', help="Earlier results file to check for files/s regressions")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Slowdown reported as a regression")
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        with tempfile.TemporaryDirectory() as workdir:
+            print(json.dumps(asyncio.run(run_size(args.child, args, workdir))))
+        return 0
+
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {key: getattr(args, key) for key in
+                       ('latency', 'concurrency', 'traversal', 'depth', 'fanout', 'existing_links', 'seed')},
+        'results': {},
+    }
+    for files in args.sizes:
+        print(f"Running {files} files...", file=sys.stderr)
+        try:
+            results['results'][str(files)] = run_child(files, args)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            return 1
+
+    output = args.output or os.path.join(
+        REPO_DIR, 'benchmarks', 'results', f"scale-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print_table(results)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
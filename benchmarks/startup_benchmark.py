@@ -0,0 +1,93 @@
+"""Measure cold and warm import time of the application's modules.
+
+Each module is imported in a fresh interpreter with ``-X importtime`` from an
+empty scratch directory, so any file the import creates shows up as a side
+effect. Cold runs start from an empty bytecode cache; warm runs reuse one that
+an earlier import has filled in and report the median of several runs.
+
+    python benchmarks/startup_benchmark.py [--runs 5] [--json] [module ...]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Optional
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = [
+    'config', 'rate_limiter', 'link_cache', 'async_utils', 'cursor_store', 'job_journal',
+    'file_filter', 'dropbox_service', 'file_processor', 'pipeline', 'app_controller', 'cli', 'gui',
+]
+
+
+def _list_files(root: str) -> List[str]:
+    found = []
+    for dirpath, _, filenames in os.walk(root):
+        found.extend(os.path.relpath(os.path.join(dirpath, name), root) for name in filenames)
+    return sorted(found)
+
+
+def import_once(module: str, pycache_prefix: str) -> Dict:
+    """Import ``module`` in a new interpreter; return its self-reported import time and side effects."""
+    with tempfile.TemporaryDirectory() as cwd:
+        env = dict(os.environ, PYTHONPATH=REPO_DIR, PYTHONPYCACHEPREFIX=pycache_prefix)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=cwd, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr.strip()}")
+        cumulative_us = None
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            parts = line.split('|')
+            if line.startswith('import time:') and len(parts) == 3 and parts[2].strip() == module:
+                cumulative_us = int(parts[1])
+        return {'seconds': (cumulative_us or 0) / 1e6, 'side_effects': _list_files(cwd)}
+
+
+def benchmark(module: str, runs: int) -> Dict:
+    with tempfile.TemporaryDirectory() as pycache_prefix:
+        cold = import_once(module, pycache_prefix)
+        warm = [import_once(module, pycache_prefix)['seconds'] for _ in range(runs)]
+    return {
+        'module': module,
+        'cold_seconds': cold['seconds'],
+        'warm_seconds': statistics.median(warm),
+        'side_effects': cold['side_effects'],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Cold and warm import-time benchmark")
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('--runs', type=int, default=5, help="Warm runs per module (median is reported)")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    for module in args.modules:
+        try:
+            results.append(benchmark(module, args.runs))
+        except RuntimeError as e:
+            results.append({'module': module, 'error': str(e)})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'module':<18}{'cold ms':>10}{'warm ms':>10}  side effects")
+    for result in results:
+        if 'error' in result:
+            print(f"{result['module']:<18}{'error':>10}  {result['error'].splitlines()[-1]}")
+            continue
+        print(f"{result['module']:<18}{result['cold_seconds'] * 1000:>10.1f}{result['warm_seconds'] * 1000:>10.1f}"
+              f"  {', '.join(result['side_effects']) or '-'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
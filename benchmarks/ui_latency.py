@@ -0,0 +1,208 @@
+"""Compare idle CPU and input-to-paint latency of the two Tk/asyncio integrations.
+
+``polling`` is the old loop, which called ``root.update()`` and then slept 10 ms in
+an asyncio coroutine. ``bridge`` is Tk's own mainloop with the asyncio loop on a
+background thread (``tk_asyncio.TkAsyncioBridge``). For each mode the script
+measures:
+
+- idle CPU: process CPU time divided by wall time while nothing happens;
+- input latency: from when a Tk timer event is due until its handler's label
+  change has been redrawn;
+- async latency: from when a coroutine finishes until its result has been
+  redrawn.
+
+"Redrawn" means the next idle callback has run, which Tk runs after its pending
+redraws. A display is required; on a headless machine use ``xvfb-run``. Results
+are saved as JSON together with the platform and revision they were taken on,
+so before/after numbers can be kept side by side.
+
+    xvfb-run python benchmarks/ui_latency.py [--idle-seconds 5] [--samples 200] [--json] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tkinter as tk
+from datetime import datetime
+from typing import Dict, List, Optional
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from tk_asyncio import TkAsyncioBridge  # noqa: E402
+
+POLL_INTERVAL = 0.01  # The removed main.run_app loop slept this long between updates
+
+
+class Probe:
+    def __init__(self, root: tk.Tk, samples: int):
+        self.root = root
+        self.samples = samples
+        self.label = tk.Label(root, text='-')
+        self.label.pack()
+        self.latencies: Dict[str, List[float]] = {'input': [], 'async': []}
+
+    def paint(self, kind: str, started: float) -> None:
+        self.label.config(text=f"{kind} {len(self.latencies[kind])}")
+        self.root.after_idle(lambda: self.latencies[kind].append(time.perf_counter() - started))
+
+    def schedule_input(self) -> None:
+        if len(self.latencies['input']) >= self.samples:
+            return
+        delay_ms = random.randint(20, 80)
+        due = time.perf_counter() + delay_ms / 1000
+
+        def on_input():
+            self.paint('input', due)
+            self.schedule_input()
+
+        self.root.after(delay_ms, on_input)
+
+    def done(self) -> bool:
+        return all(len(values) >= self.samples for values in self.latencies.values())
+
+
+async def produce_results(probe: Probe, deliver) -> None:
+    # Coroutines finishing at random times, each handing a result to the UI.
+    for _ in range(probe.samples):
+        await asyncio.sleep(random.uniform(0.02, 0.08))
+        deliver(probe, time.perf_counter())
+
+
+def measure_idle(pump, seconds: float) -> float:
+    cpu, wall = time.process_time(), time.perf_counter()
+    pump(seconds)
+    return (time.process_time() - cpu) / (time.perf_counter() - wall)
+
+
+def run_polling(idle_seconds: float, samples: int) -> Dict:
+    root = tk.Tk()
+    probe = Probe(root, samples)
+    result = {}
+
+    async def pump_for(seconds: float, until=None) -> None:
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline and not (until and until()):
+            root.update()
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        cpu, wall = time.process_time(), time.perf_counter()
+        await pump_for(idle_seconds)
+        result['idle_cpu'] = (time.process_time() - cpu) / (time.perf_counter() - wall)
+        probe.schedule_input()
+        producer = loop.create_task(produce_results(probe, lambda p, started: p.paint('async', started)))
+        await pump_for(600, until=probe.done)
+        await producer
+
+    asyncio.run(main())
+    root.destroy()
+    return dict(result, **summarize(probe))
+
+
+def run_bridge(idle_seconds: float, samples: int) -> Dict:
+    root = tk.Tk()
+    probe = Probe(root, samples)
+    bridge = TkAsyncioBridge(root)
+    bridge.start()
+    result = {}
+
+    def pump_for(seconds: float) -> None:
+        root.after(int(seconds * 1000), root.quit)
+        root.mainloop()
+
+    result['idle_cpu'] = measure_idle(pump_for, idle_seconds)
+
+    def check_done():
+        if probe.done():
+            root.quit()
+        else:
+            root.after(50, check_done)
+
+    probe.schedule_input()
+    bridge.submit(produce_results(probe, lambda p, started: bridge.call_in_ui(p.paint, 'async', started)))
+    check_done()
+    root.mainloop()
+    bridge.stop()
+    root.destroy()
+    return dict(result, **summarize(probe))
+
+
+def summarize(probe: Probe) -> Dict:
+    summary = {}
+    for kind, values in probe.latencies.items():
+        values = sorted(values)
+        summary[f'{kind}_latency_ms'] = {
+            'median': statistics.median(values) * 1000,
+            'p95': values[int(len(values) * 0.95) - 1] * 1000,
+            'max': values[-1] * 1000,
+        }
+    return summary
+
+
+MODES = {'polling': run_polling, 'bridge': run_bridge}
+
+
+def git_revision() -> Optional[str]:
+    try:
+        result = subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                                cwd=REPO_DIR)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def save(results: Dict, args: argparse.Namespace) -> str:
+    output = args.output or os.path.join(
+        REPO_DIR, 'benchmarks', 'results', f"ui-latency-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'tk': tk.TkVersion,
+            'platform': platform.platform(),
+            'parameters': {'idle_seconds': args.idle_seconds, 'samples': args.samples},
+            'results': results,
+        }, f, indent=2)
+    return output
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Idle CPU and input-to-paint latency of the Tk/asyncio integration")
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--idle-seconds', type=float, default=5.0)
+    parser.add_argument('--samples', type=int, default=200, help="Latency samples of each kind")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    parser.add_argument('--output', help="Results file (default: benchmarks/results/ui-latency-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    try:
+        results = {mode: MODES[mode](args.idle_seconds, args.samples) for mode in args.modes}
+    except tk.TclError as e:
+        print(f"Cannot open a Tk window ({e}); run under a display or xvfb-run", file=sys.stderr)
+        return 2
+
+    output = save(results, args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'mode':<10}{'idle CPU':>10}{'input p50/p95 ms':>20}{'async p50/p95 ms':>20}")
+    for mode, result in results.items():
+        columns = [f"{result[key]['median']:.1f}/{result[key]['p95']:.1f}"
+                   for key in ('input_latency_ms', 'async_latency_ms')]
+        print(f"{mode:<10}{result['idle_cpu']:>10.1%}" + ''.join(f"{column:>20}" for column in columns))
+    print(f"Results saved to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
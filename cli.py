@@ -0,0 +1,252 @@
+"""Headless batch mode: generate links for one or more Dropbox folders without Tk.
+
+Usage: python -m cli /Music /Video --types Audio,Video --format txt --concurrency 20
+
+Progress is written to stdout as JSON lines; logs go to stderr and the log file.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from app_controller import AppController
+from config import (
+    DROPBOX_BACKEND, FILE_TYPE_EXTENSIONS, METRICS_FILE, OUTPUTS_DIR, ensure_outputs_dir, get_access_token, logger
+)
+from dropbox_service import DropboxService, InvalidTokenError, TokenExpiredError
+from file_filter import FileFilter
+from job_scheduler import SCHEDULE_ORDERS, LinkJob
+from output_writers import OUTPUT_FORMAT_ALIASES, OUTPUT_WRITERS, get_writer_class
+from progress import ProgressSnapshot, ProgressTracker
+
+EXIT_OK = 0
+EXIT_FAILED = 1  # At least one root failed or at least one link could not be created
+EXIT_USAGE = 2  # Bad arguments (also argparse's own exit code)
+EXIT_AUTH = 3  # Missing, invalid or expired access token
+EXIT_INTERRUPTED = 130
+
+
+def emit(event: str, **fields) -> None:
+    print(json.dumps({'event': event, 'time': round(time.time(), 3), **fields}), flush=True)
+
+
+def default_output_path(root: str, output_dir: str, output_format: str) -> str:
+    slug = root.strip('/').replace('/', '_') or 'root'
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    extension = get_writer_class(output_format).extension
+    return os.path.join(output_dir, f"dropbox_{slug}_{timestamp}.{extension}")
+
+
+def metrics_path(metrics_file: Optional[str], root: str, roots: List[str]) -> Optional[str]:
+    # One file per root when several roots share the option.
+    if not metrics_file or len(roots) == 1:
+        return metrics_file
+    base, extension = os.path.splitext(metrics_file)
+    return f"{base}_{root.strip('/').replace('/', '_') or 'root'}{extension}"
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m cli', description="Generate Dropbox share links without the GUI.")
+    parser.add_argument('roots', nargs='+', help="Dropbox folder paths to process ('' or / for the whole Dropbox)")
+    parser.add_argument('--token', default=None, help="Access token (default: DROPBOX_ACCESS_TOKEN)")
+    parser.add_argument('--backend', choices=['dropbox', 'fake'], default=DROPBOX_BACKEND,
+                        help="'fake' runs against a synthetic in-process account (no token needed)")
+    parser.add_argument('--types', default='Audio,Video',
+                        help=f"Comma-separated file types from {', '.join(FILE_TYPE_EXTENSIONS)} (default: Audio,Video)")
+    parser.add_argument('--format', dest='output_format', default='txt',
+                        choices=list(OUTPUT_WRITERS) + list(OUTPUT_FORMAT_ALIASES))
+    parser.add_argument('-o', '--output', help="Output file (only with a single root)")
+    parser.add_argument('--output-dir', default=None, help="Directory for per-root output files (default: outputs/)")
+    parser.add_argument('--concurrency', type=int, default=None, help="Share-link requests in flight")
+    parser.add_argument('--incremental', action='store_true', help="Only process changes since the last completed run")
+    parser.add_argument('--resume', action='store_true', help="Continue an interrupted run into the same output file")
+    parser.add_argument('--min-size', type=int, default=None, help="Minimum file size in bytes")
+    parser.add_argument('--max-size', type=int, default=None, help="Maximum file size in bytes")
+    parser.add_argument('--modified-after', type=datetime.fromisoformat, default=None,
+                        help="Only files modified at or after this ISO date/time (UTC unless it has an offset)")
+    parser.add_argument('--modified-before', type=datetime.fromisoformat, default=None,
+                        help="Only files modified before this ISO date/time (UTC unless it has an offset)")
+    parser.add_argument('--include', action='append', default=[], help="Path glob to include (repeatable)")
+    parser.add_argument('--include-regex', default=None, help="Regular expression paths must match")
+    parser.add_argument('--exclude', action='append', default=[],
+                        help="Path glob or folder to exclude (repeatable)")
+    parser.add_argument('--schedule', action='store_true',
+                        help="Run all roots as one batch under a shared concurrency budget, linking files "
+                             "under overlapping roots once")
+    parser.add_argument('--order', choices=SCHEDULE_ORDERS, default='path',
+                        help="With --schedule: order of link creation ('newest' links fresh uploads first)")
+    parser.add_argument('--priority', action='append', default=[], metavar='ROOT=N',
+                        help="With --schedule: files under ROOT are linked before those of lower-priority roots "
+                             "(repeatable, default 0)")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="Worker processes per root, sharing one API rate budget (default: 1)")
+    parser.add_argument('--metrics-file', default=METRICS_FILE,
+                        help="Write API metrics for each root here (.prom for Prometheus text, JSON otherwise)")
+    parser.add_argument('--progress-interval', type=float, default=1.0,
+                        help="Minimum seconds between progress lines (default: 1.0)")
+    args = parser.parse_args(argv)
+
+    args.file_types = [t.strip().capitalize() for t in args.types.split(',') if t.strip()]
+    unknown = [t for t in args.file_types if t not in FILE_TYPE_EXTENSIONS]
+    if unknown or not args.file_types:
+        parser.error(f"unknown file types: {', '.join(unknown) or '(none)'}")
+    if args.output and len(args.roots) > 1:
+        parser.error("--output can only be used with a single root; use --output-dir instead")
+    if args.concurrency is not None and args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.resume and not args.output:
+        parser.error("--resume needs --output: the default output names are timestamped, so there is nothing to resume")
+    if args.resume and args.incremental:
+        parser.error("--resume cannot be combined with --incremental; an incremental run writes a new delta file")
+    if args.schedule and (args.incremental or args.resume):
+        parser.error("--schedule cannot be combined with --incremental or --resume")
+    if args.processes < 1:
+        parser.error("--processes must be at least 1")
+    if args.processes > 1 and (args.incremental or args.resume or args.schedule):
+        parser.error("--processes cannot be combined with --incremental, --resume or --schedule")
+    # Treat '/' as the Dropbox root, which the API spells ''.
+    args.roots = ['' if root in ('/', '') else root for root in args.roots]
+    args.priorities = {}
+    for spec in args.priority:
+        root, _, value = spec.rpartition('=')
+        try:
+            args.priorities['' if root in ('/', '') else root] = int(value)
+        except ValueError:
+            parser.error(f"invalid --priority {spec!r}: expected ROOT=N")
+    return args
+
+
+def emit_progress(event: str, root: str, snapshot: ProgressSnapshot, **fields) -> None:
+    emit(event, root=root or '/', processed=snapshot.processed, total=snapshot.discovered,
+         listing_complete=snapshot.listing_complete, errors=snapshot.errors,
+         files_per_second=round(snapshot.files_per_second, 2),
+         api_calls_per_second=round(snapshot.api_calls_per_second, 2), api_calls=snapshot.api_calls,
+         eta=None if snapshot.eta is None else round(snapshot.eta, 1), elapsed=round(snapshot.elapsed, 3),
+         **fields)
+
+
+def build_file_filter(controller: AppController, args: argparse.Namespace) -> FileFilter:
+    return controller.file_processor.build_filter(
+        args.file_types, min_size=args.min_size, max_size=args.max_size,
+        modified_after=args.modified_after, modified_before=args.modified_before,
+        include_globs=args.include, include_regex=args.include_regex, exclude=args.exclude
+    )
+
+
+async def run_root(controller: AppController, args: argparse.Namespace, root: str) -> bool:
+    output_file = args.output or default_output_path(root, args.output_dir or OUTPUTS_DIR, args.output_format)
+    file_filter = build_file_filter(controller, args)
+    emit('start', root=root or '/', output=output_file)
+    progress = ProgressTracker()
+    # The final snapshot is reported by the 'done' event instead.
+    progress.subscribe(lambda snapshot: snapshot.final or emit_progress('progress', root, snapshot),
+                       interval=args.progress_interval)
+    metrics_file = metrics_path(args.metrics_file, root, args.roots)
+    try:
+        if args.processes > 1:
+            links = controller.generate_links_sharded(
+                root, output_file, args.output_format, args.file_types, args.processes, file_filter=file_filter,
+                concurrency=args.concurrency, backend=args.backend, progress=progress, metrics_file=metrics_file
+            )
+        else:
+            links = controller.generate_links(
+                root, output_file, args.output_format, args.file_types, incremental=args.incremental,
+                resume=args.resume, file_filter=file_filter, concurrency=args.concurrency, progress=progress,
+                metrics_file=metrics_file
+            )
+        async for _ in links:
+            pass
+    except (InvalidTokenError, TokenExpiredError):
+        raise
+    except Exception as e:
+        logger.error(f"Error generating links for {root or '/'}: {str(e)}")
+        emit('error', root=root or '/', message=str(e))
+        return False
+    # A delta run writes next to an existing output rather than over it.
+    output_file = controller.last_output_file or output_file
+    snapshot = progress.snapshot(final=True)
+    emit_progress('done', root, snapshot, output=output_file)
+    if snapshot.errors:
+        logger.error(f"{snapshot.errors} links under {root or '/'} could not be created")
+        return False
+    return True
+
+
+async def run_scheduled(controller: AppController, args: argparse.Namespace) -> bool:
+    file_filter = build_file_filter(controller, args)
+    jobs = [LinkJob(root, args.output or default_output_path(root, args.output_dir or OUTPUTS_DIR, args.output_format),
+                    file_filter, args.output_format, args.priorities.get(root, 0))
+            for root in args.roots]
+    for job in jobs:
+        emit('start', root=job.root or '/', output=job.output_file)
+    progress = ProgressTracker()
+    # Progress covers the whole batch, reported under root '*'.
+    progress.subscribe(lambda snapshot: snapshot.final or emit_progress('progress', '*', snapshot),
+                       interval=args.progress_interval)
+    try:
+        async for _ in controller.run_jobs(jobs, concurrency=args.concurrency, order=args.order, progress=progress,
+                                           metrics_file=args.metrics_file):
+            pass
+    except (InvalidTokenError, TokenExpiredError):
+        raise
+    except Exception as e:
+        logger.error(f"Error running scheduled jobs: {str(e)}")
+        emit('error', root='*', message=str(e))
+        return False
+    succeeded = True
+    for job in jobs:
+        if job.error is not None:
+            emit('error', root=job.root or '/', message=job.error)
+            succeeded = False
+        else:
+            emit('done', root=job.root or '/', output=job.output_file, matched=job.matched, written=job.written)
+    snapshot = progress.snapshot(final=True)
+    emit_progress('done', '*', snapshot)
+    if snapshot.errors:
+        logger.error(f"{snapshot.errors} scheduled links could not be created")
+        return False
+    return succeeded
+
+
+async def run(args: argparse.Namespace) -> int:
+    if args.backend == 'fake':
+        from fake_dropbox import FakeDropbox
+        token = args.token or 'fake'
+        controller = AppController(DropboxService(client=FakeDropbox.from_config()))
+    else:
+        token = args.token or get_access_token()
+        if not token:
+            emit('error', message="No access token: pass --token or set DROPBOX_ACCESS_TOKEN")
+            return EXIT_AUTH
+        controller = AppController()
+    try:
+        controller.set_access_token(token)
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+        elif not args.output:
+            ensure_outputs_dir()
+        if args.schedule:
+            results = [await run_scheduled(controller, args)]
+        else:
+            results = [await run_root(controller, args, root) for root in args.roots]
+    except (InvalidTokenError, TokenExpiredError) as e:
+        emit('error', message=str(e))
+        return EXIT_AUTH
+    return EXIT_OK if all(results) else EXIT_FAILED
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    try:
+        return asyncio.run(run(args))
+    except KeyboardInterrupt:
+        emit('interrupted')
+        return EXIT_INTERRUPTED
+
+
+if __name__ == '__main__':
+    sys.exit(main())
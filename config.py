@@ -1,57 +1,140 @@
 import os
+import atexit
+import itertools
 import logging
-from logging.handlers import RotatingFileHandler
-from typing import Dict, Any
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Any, List, Optional
 import configparser
-from dotenv import load_dotenv
 import json
 import time
 
+# Importing this module has no side effects: the .env file, the INI/JSON configs,
+# the outputs directory and the log handlers are all set up on first use.
+
 # Define INI_CONFIG_FILE at the top
 INI_CONFIG_FILE = 'config.ini'
 
-# Load environment variables from .env file
-load_dotenv()
-
-# Dropbox configuration
-DROPBOX_ACCESS_TOKEN = os.getenv('DROPBOX_ACCESS_TOKEN')
-
 # File extensions
 AUDIO_EXTENSIONS = ['.mp3', '.wav', '.ogg', '.flac', '.m4a', '.aac']
 VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm']
 IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.svg']
 DOCUMENT_EXTENSIONS = ['.pdf', '.doc', '.docx', '.txt', '.rtf', '.odt', '.ppt', '.pptx', '.xls', '.xlsx', '.csv']
 ALL_FILE_EXTENSIONS = AUDIO_EXTENSIONS + VIDEO_EXTENSIONS + IMAGE_EXTENSIONS + DOCUMENT_EXTENSIONS
+FILE_TYPE_EXTENSIONS = {
+    'Audio': AUDIO_EXTENSIONS,
+    'Video': VIDEO_EXTENSIONS,
+    'Image': IMAGE_EXTENSIONS,
+    'Document': DOCUMENT_EXTENSIONS,
+}
+
+# API rate limiting (token bucket shared by all API calls, adapted on 429s)
+RATE_LIMIT_RATE = 10.0  # Sustained API calls per second
+RATE_LIMIT_BURST = 20  # Calls that may be issued back-to-back after an idle period
+RATE_LIMIT_MIN_RATE = 0.5  # Floor for the rate after repeated 429s
+RATE_LIMIT_INCREASE = 0.05  # Calls/s added back after each successful call
+RATE_LIMIT_MAX_RATE = 20.0  # Ceiling the rate may climb to after successful calls; RATE_LIMIT_RATE to only back off
+RATE_LIMIT_MAX_RETRIES = 5  # Retries of a single call after 429 responses
+SERVER_ERROR_MAX_RETRIES = 3  # Retries of a single call after 5xx responses the HTTP layer did not absorb
+SERVER_ERROR_BACKOFF = 0.5  # Seconds before the first 5xx retry, doubled on each further one
+
+# API metrics
+API_LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Histogram bucket bounds in seconds
+METRICS_FILE = None  # Per-job API metrics dump (.prom for Prometheus text format, JSON otherwise); None disables
+
+# API backend
+DROPBOX_BACKEND = 'dropbox'  # 'dropbox' (live API) or 'fake' (in-process fake_dropbox.FakeDropbox, for offline tests)
+FAKE_DROPBOX_FILES = 10_000  # Files in the fake's synthetic tree
+FAKE_DROPBOX_DEPTH = 3  # Folder levels below the root
+FAKE_DROPBOX_FANOUT = 5  # Subfolders per folder
+FAKE_DROPBOX_LATENCY = 0.05  # Mean seconds the fake takes per call
+FAKE_DROPBOX_RATE_LIMIT = None  # Calls/s the fake allows before answering 429; None disables
+FAKE_DROPBOX_ERROR_RATE = 0.0  # Fraction of fake calls failing with a transient 503
+FAKE_DROPBOX_SEED = 0  # Seed for the fake's latency and fault injection
 
-# API rate limiting
-MIN_CALL_INTERVAL = 0.1  # 100ms between API calls
+# Shared links
+PREFETCH_SHARED_LINKS = True  # Index all existing shared links once per run instead of one lookup per file
+PREFETCH_MIN_DELTA_FILES = 500  # Incremental runs with fewer changed files look their links up one by one
 
 # File processing
 BATCH_SIZE = 10
+LINK_CONCURRENCY = BATCH_SIZE  # Share-link requests in flight at once
+PIPELINE_QUEUE_SIZE = 1000  # Max entries buffered between streaming pipeline stages
+
+# Progress reporting
+PROGRESS_INTERVAL = 0.1  # Seconds between coalesced progress updates (GUI frame rate)
+PROGRESS_RATE_WINDOW = 5.0  # Seconds of history behind the rolling files/s and calls/s
+PROGRESS_LOG_INTERVAL = 10.0  # Seconds between progress lines in the log
+
+# Folder listing
+LIST_FOLDER_PAGE_LIMIT = 2000  # Max entries per list_folder page (Dropbox caps this at 2000)
+TRAVERSAL_MODE = 'recursive'  # 'recursive' (one server-side listing) or 'concurrent' (parallel per-folder)
+LISTING_CONCURRENCY = 8  # Max folders listed in parallel in 'concurrent' mode
+LISTING_CACHE_REVALIDATE_AFTER = 30.0  # Seconds a cached folder listing is used before a list_folder/continue check
+LISTING_CACHE_MAX_FOLDERS = 20_000  # Folder listings kept in memory, least recently used evicted first
 
 # Paths
 CACHE_DIR = 'dropbox_cache'
 PREFERENCES_FILE = os.path.join(os.path.dirname(__file__), 'preferences.json') # Updated this line
 LOG_FILE = 'app.log'
+LOG_DEBUG_SAMPLE_EVERY = 1000  # Hot-path DEBUG messages (see debug_sampled) are logged once per this many
+
+# Incremental runs
+CURSOR_STORE_FILE = os.path.join(CACHE_DIR, 'folder_cursors.json')
+
+# Resumable job journal (written next to the output file)
+JOURNAL_SUFFIX = '.journal'
+JOURNAL_FSYNC_EVERY = 200  # Completed files between fsyncs
+JOURNAL_FSYNC_INTERVAL = 2.0  # Max seconds between fsyncs
+JOURNAL_COMPACT_EVERY = 10_000  # Journal records folded into the gzipped checkpoint at a time
+
+# Share-link cache
+LINK_CACHE_BACKEND = 'sqlite'
+LINK_CACHE_FILE = os.path.join(CACHE_DIR, 'share_links.sqlite3')
+LINK_CACHE_TTL = 3600  # Seconds a cached link stays valid; None keeps links until evicted
+LINK_CACHE_MAX_ENTRIES = 1_000_000  # Oldest links are evicted beyond this; None disables eviction
+LINK_MEMORY_CACHE_SIZE = 100_000  # Links held in the in-process LRU tier; 0 disables it
 
 # GUI settings
 WINDOW_TITLE = "Dropbox Media Links Generator"
 WINDOW_SIZE = "1000x800"
+BROWSER_PREFETCH_LIMIT = 50  # Subfolders of a shown folder whose listings are fetched ahead
+BROWSER_PREFETCH_CONCURRENCY = 4  # Folder browser prefetches in flight at once
 
-# Output formats
-OUTPUT_FORMATS = ["txt", "csv", "md"]
+# Output formats (see output_writers.OUTPUT_WRITERS)
+OUTPUT_FORMATS = ["txt", "csv", "markdown", "html", "json", "jsonl"]
+OUTPUT_BUFFER_SIZE = 1 << 20  # Characters of formatted output buffered before a background write
 
 # Define the outputs directory
 OUTPUTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outputs')
 
-# Create the outputs directory if it doesn't exist
-os.makedirs(OUTPUTS_DIR, exist_ok=True)
 
-def setup_logging() -> logging.Logger:
-    """Set up logging configuration."""
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.DEBUG)
+def ensure_outputs_dir() -> str:
+    """Create the outputs directory if it doesn't exist and return it."""
+    os.makedirs(OUTPUTS_DIR, exist_ok=True)
+    return OUTPUTS_DIR
+
+
+_environment_loaded = False
+
+
+def load_environment() -> None:
+    """Load environment variables from the .env file, once."""
+    global _environment_loaded
+    if not _environment_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _environment_loaded = True
+
 
+def get_access_token() -> Optional[str]:
+    """Return the Dropbox access token from the environment or .env file."""
+    load_environment()
+    return os.getenv('DROPBOX_ACCESS_TOKEN')
+
+
+def _create_log_handlers() -> List[logging.Handler]:
     # Create handlers
     c_handler = logging.StreamHandler()
     f_handler = RotatingFileHandler(LOG_FILE, maxBytes=5*1024*1024, backupCount=3)
@@ -64,12 +147,80 @@ def setup_logging() -> logging.Logger:
     c_handler.setFormatter(c_format)
     f_handler.setFormatter(f_format)
 
-    # Add handlers to the logger
-    logger.addHandler(c_handler)
-    logger.addHandler(f_handler)
+    return [c_handler, f_handler]
+
+
+class _DeferredHandler(logging.Handler):
+    """Creates the real log handlers on the first record and forwards to them.
+
+    This keeps the log file closed until something is actually logged.
+    """
 
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self._handlers = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Called under the handler lock, so the handlers are only created once.
+        if self._handlers is None:
+            self._handlers = _create_log_handlers()
+        for handler in self._handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class _BackgroundQueueHandler(QueueHandler):
+    """Hands records to a listener thread, so callers never format or write them.
+
+    The listener is started with the first record and stopped (flushing the
+    queue) at exit.
+    """
+
+    def __init__(self):
+        super().__init__(queue.SimpleQueue())
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Records stay in this process, so message formatting is left to the listener thread.
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self._listener is None:
+            with self._start_lock:
+                if self._listener is None:
+                    listener = QueueListener(self.queue, _DeferredHandler(), respect_handler_level=True)
+                    listener.start()
+                    atexit.register(listener.stop)
+                    self._listener = listener
+        super().emit(record)
+
+
+def setup_logging() -> logging.Logger:
+    """Set up logging configuration. Repeated calls return the same logger without adding handlers."""
+    logger = logging.getLogger(__name__)
+    if not any(isinstance(handler, _BackgroundQueueHandler) for handler in logger.handlers):
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(_BackgroundQueueHandler())
     return logger
 
+
+_debug_counters: Dict[str, Any] = {}
+
+
+def debug_sampled(key: str, msg: str, *args, every: int = LOG_DEBUG_SAMPLE_EVERY) -> None:
+    """Log a DEBUG message for the 1st, (every+1)th, ... occurrence of ``key`` only.
+
+    For messages logged per file or per API call; ``msg`` is %-formatted lazily.
+    """
+    counter = _debug_counters.get(key)
+    if counter is None:
+        counter = _debug_counters.setdefault(key, itertools.count())
+    # next() on itertools.count is atomic under the GIL.
+    if next(counter) % every == 0:
+        logger.debug(msg + " [sampled 1/%d]", *args, every)
+
+
 def load_json_config() -> Dict[str, Any]:
     """Load configuration from the JSON preferences file."""
     if os.path.exists(PREFERENCES_FILE):
@@ -77,11 +228,13 @@ def load_json_config() -> Dict[str, Any]:
             return json.load(f)
     return {}
 
+
 def save_json_config(config: Dict[str, Any]) -> None:
     """Save configuration to the JSON preferences file."""
     with open(PREFERENCES_FILE, 'w') as f:
         json.dump(config, f)
 
+
 def load_ini_config() -> configparser.ConfigParser:
     """Load configuration from the INI file."""
     config = configparser.ConfigParser()
@@ -95,18 +248,27 @@ def load_ini_config() -> configparser.ConfigParser:
         save_ini_config(config)
     return config
 
+
 def save_ini_config(config: configparser.ConfigParser) -> None:
     """Save configuration to the INI file."""
     with open(INI_CONFIG_FILE, 'w') as configfile:
         config.write(configfile)
 
-# Load configuration
-json_config = load_json_config()
-ini_config = load_ini_config()
 
 # Set up logging
 logger = setup_logging()
 
-# Load configuration
-json_config = load_json_config()
-ini_config = load_ini_config()
\ No newline at end of file
+_LAZY_ATTRIBUTES = {
+    'DROPBOX_ACCESS_TOKEN': get_access_token,
+    'json_config': load_json_config,
+    'ini_config': load_ini_config,
+}
+
+
+def __getattr__(name: str) -> Any:
+    # Configuration is loaded on first access and then cached as a module attribute.
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = _LAZY_ATTRIBUTES[name]()
+    globals()[name] = value
+    return value
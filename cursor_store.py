@@ -0,0 +1,62 @@
+import json
+import os
+import time
+from typing import Dict, List, Optional
+from config import CURSOR_STORE_FILE, logger
+
+
+class CursorStore:
+    """Persists the final list_folder cursor of each root folder between runs.
+
+    A cursor is only reused by a run with the same file filter it was recorded
+    with (compared by ``FileFilter.fingerprint``, which covers file types, size
+    and date bounds and path patterns), since files the earlier filter rejected
+    were never linked and will not show up in a delta.
+    """
+
+    def __init__(self, path: str = CURSOR_STORE_FILE):
+        self.path = path
+
+    @staticmethod
+    def _key(folder_path: str) -> str:
+        return folder_path.lower().rstrip('/')
+
+    def _load(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable cursor store {self.path}: {str(e)}")
+            return {}
+
+    def _write(self, cursors: Dict[str, Dict]) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(cursors, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, folder_path: str, file_types: List[str], filter_fingerprint: str) -> Optional[str]:
+        record = self._load().get(self._key(folder_path))
+        if record and record.get('file_types') == sorted(file_types) and record.get('filter') == filter_fingerprint:
+            return record['cursor']
+        return None
+
+    def save(self, folder_path: str, file_types: List[str], filter_fingerprint: str, cursor: str) -> None:
+        cursors = self._load()
+        cursors[self._key(folder_path)] = {
+            'cursor': cursor,
+            'file_types': sorted(file_types),
+            'filter': filter_fingerprint,
+            'updated_at': time.time(),
+        }
+        self._write(cursors)
+
+    def clear(self, folder_path: str) -> None:
+        cursors = self._load()
+        if cursors.pop(self._key(folder_path), None) is not None:
+            self._write(cursors)
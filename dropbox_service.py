@@ -1,22 +1,26 @@
 import dropbox 
-import time
-import json
-import os
-from typing import Optional, List, Dict, Union, Tuple
+import functools
+from typing import Optional, List, Dict, Union, Tuple, Iterator, AsyncIterator
 from dropbox import Dropbox
-from dropbox.files import FileMetadata, FolderMetadata, ListFolderResult
-from dropbox.exceptions import ApiError, RateLimitError, AuthError
+from dropbox.files import FileMetadata, FolderMetadata, ListFolderResult, ListFolderContinueError, Metadata
+from dropbox.exceptions import ApiError, RateLimitError, AuthError, InternalServerError
 from dropbox.sharing import CreateSharedLinkWithSettingsError, SharedLinkSettings, RequestedVisibility
 import requests
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
-from config import CACHE_DIR, setup_logging
+from config import (
+    LIST_FOLDER_PAGE_LIMIT, RATE_LIMIT_RATE, RATE_LIMIT_BURST, RATE_LIMIT_MIN_RATE,
+    RATE_LIMIT_INCREASE, RATE_LIMIT_MAX_RATE, RATE_LIMIT_MAX_RETRIES, SERVER_ERROR_MAX_RETRIES, SERVER_ERROR_BACKOFF,
+    DROPBOX_BACKEND, debug_sampled, logger
+)
+from rate_limiter import TokenBucketRateLimiter
+from link_cache import LinkCache, create_link_cache
+from listing_cache import ListingCache
+from metrics import ApiMetrics, endpoint_of
 import asyncio
-from tkinter import simpledialog
-import aiofiles
 import re
+import time
 
-logger = setup_logging()
 
 # Define our own TokenExpiredError
 class TokenExpiredError(Exception):
@@ -26,15 +30,38 @@ class InvalidTokenError(Exception):
     pass
 
 class DropboxService:
-    MIN_CALL_INTERVAL = 0.1  # 100 ms between API calls, adjust as needed
-
-    def __init__(self, access_token=None):
-        self._dbx = None
+    def __init__(self, access_token=None, rate_limiter: Optional[TokenBucketRateLimiter] = None,
+                 link_cache: Optional[LinkCache] = None, client=None, metrics: Optional[ApiMetrics] = None):
+        # ``client`` replaces the SDK client, e.g. with a configured FakeDropbox.
+        self._dbx = client
+        self._link_cache = link_cache
         self._access_token = access_token
-        self.last_api_call = 0  # Initialize last_api_call
+        self.rate_limiter = rate_limiter or TokenBucketRateLimiter(
+            RATE_LIMIT_RATE, RATE_LIMIT_BURST, min_rate=RATE_LIMIT_MIN_RATE, max_rate=RATE_LIMIT_MAX_RATE,
+            increase=RATE_LIMIT_INCREASE
+        )
+        self._shared_link_index: Optional[Dict[str, str]] = None  # path_lower -> raw URL, see prefetch_shared_links
+        self.listing_cache = ListingCache(self)
+        self.metrics = metrics or ApiMetrics()
         if access_token:
             self._ensure_connection()
 
+    @property
+    def link_cache(self) -> LinkCache:
+        # Opened on first use so that services which never resolve links do not touch the cache file.
+        if self._link_cache is None:
+            self._link_cache = create_link_cache()
+        return self._link_cache
+
+    @property
+    def access_token(self) -> Optional[str]:
+        return self._access_token
+
+    @property
+    def client(self):
+        """The SDK client, or the fake standing in for it; None until a connection is made."""
+        return self._dbx
+
     def set_access_token(self, access_token):
         self._access_token = access_token
         self._ensure_connection()
@@ -42,33 +69,99 @@ class DropboxService:
     def _ensure_connection(self):
         if not self._access_token:
             raise ValueError("Access token not set")
-        if not self._dbx:
+        if not self._dbx and DROPBOX_BACKEND == 'fake':
+            from fake_dropbox import FakeDropbox
+            logger.info("Using the in-process fake Dropbox backend")
+            self._dbx = FakeDropbox.from_config()
+        elif not self._dbx:
+            # 429s are deliberately left to the shared rate limiter rather than retried here.
             retry_strategy = Retry(
                 total=3,
-                status_forcelist=[429, 500, 502, 503, 504],
+                status_forcelist=[500, 502, 503, 504],
                 allowed_methods=["HEAD", "GET", "OPTIONS", "POST"],
                 backoff_factor=1
             )
             adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=20, pool_maxsize=20)
             session = requests.Session()
+            session.hooks['response'].append(self.metrics.response_hook)
             session.mount("https://", adapter)
             session.mount("http://", adapter)
             
             self._dbx = Dropbox(
                 self._access_token,
-                session=session
+                session=session,
+                max_retries_on_rate_limit=0
             )
 
-    def _rate_limit(self):
-        current_time = time.time()
-        if current_time - self.last_api_call < self.MIN_CALL_INTERVAL:
-            time.sleep(self.MIN_CALL_INTERVAL - (current_time - self.last_api_call))
-        self.last_api_call = current_time
+    def _call_sync(self, method, *args, **kwargs):
+        """Invoke an SDK method under the shared rate limiter, blocking the calling thread."""
+        endpoint = endpoint_of(method)
+        # 429s and 5xx responses have separate retry budgets; exhausting either one raises.
+        attempt = rate_limited = server_errors = 0
+        while True:
+            waited = time.perf_counter()
+            self.rate_limiter.acquire_sync()
+            self.metrics.record_throttle_wait(endpoint, time.perf_counter() - waited)
+            try:
+                result = self.metrics.call(attempt, method, *args, **kwargs)
+            except RateLimitError as e:
+                self._on_rate_limited(e, rate_limited)
+                rate_limited += 1
+            except InternalServerError as e:
+                time.sleep(self._server_error_delay(e, server_errors))
+                server_errors += 1
+            else:
+                self.rate_limiter.on_success()
+                return result
+            attempt += 1
+
+    async def _call(self, method, *args, **kwargs):
+        """Invoke an SDK method under the shared rate limiter from a coroutine.
+
+        The blocking SDK call runs in an executor thread, and waiting for tokens or
+        server backoff uses asyncio.sleep, so the event loop never stalls.
+        """
+        loop = asyncio.get_running_loop()
+        endpoint = endpoint_of(method)
+        attempt = rate_limited = server_errors = 0
+        while True:
+            waited = time.perf_counter()
+            await self.rate_limiter.acquire()
+            self.metrics.record_throttle_wait(endpoint, time.perf_counter() - waited)
+            try:
+                result = await loop.run_in_executor(
+                    None, functools.partial(self.metrics.call, attempt, method, *args, **kwargs))
+            except RateLimitError as e:
+                self._on_rate_limited(e, rate_limited)
+                rate_limited += 1
+            except InternalServerError as e:
+                await asyncio.sleep(self._server_error_delay(e, server_errors))
+                server_errors += 1
+            else:
+                self.rate_limiter.on_success()
+                return result
+            attempt += 1
+
+    def _server_error_delay(self, error: InternalServerError, retries: int) -> float:
+        # Server errors say nothing about our request rate, so the limiter is left alone.
+        if retries >= SERVER_ERROR_MAX_RETRIES:
+            logger.error(f"Server error retries exhausted after {retries + 1} server errors: {error.status_code}")
+            raise error
+        debug_sampled('server_error_retry', "Server error %s, retrying (Attempt %d/%d)",
+                      error.status_code, retries + 1, SERVER_ERROR_MAX_RETRIES)
+        return SERVER_ERROR_BACKOFF * 2 ** retries
+
+    def _on_rate_limited(self, error: RateLimitError, retries: int) -> None:
+        self.rate_limiter.on_rate_limited(error.backoff)
+        if retries >= RATE_LIMIT_MAX_RETRIES:
+            logger.error(f"Rate limit retries exhausted after {retries + 1} rate-limited attempts")
+            raise error
+        debug_sampled('rate_limit_retry', "Rate limited, retrying (Attempt %d/%d)", retries + 1, RATE_LIMIT_MAX_RETRIES)
 
     def is_token_valid(self):
         try:
             self._ensure_connection()
-            self._dbx.users_get_current_account()
+            self._call_sync(self._dbx.users_get_current_account)
             return True
         except AuthError:
             return False
@@ -77,115 +170,202 @@ class DropboxService:
             return False
 
     def list_files(self, path: str) -> ListFolderResult:
+        """List the direct children of ``path``, following the cursor across all pages."""
+        entries = []
+        result = None
+        for result in self.iter_pages(path):
+            entries.extend(result.entries)
+        debug_sampled('list_files', "Found %d entries in %s", len(entries), path)
+        return ListFolderResult(entries=entries, cursor=result.cursor, has_more=False)
+
+    def iter_pages(self, path: str, recursive: bool = False, limit: Optional[int] = None,
+                   cursor: Optional[str] = None) -> Iterator[ListFolderResult]:
+        """Yield list_folder result pages for ``path`` until ``has_more`` is exhausted.
+
+        With a ``cursor`` from an earlier listing, only the changes since that listing are returned.
+        """
+        if cursor is not None:
+            result = self._list_folder_page(cursor=cursor)
+        else:
+            result = self._list_folder_page(path=path, recursive=recursive, limit=limit)
+        yield result
+        while result.has_more:
+            result = self._list_folder_page(cursor=result.cursor)
+            yield result
+
+    async def aiter_pages(self, path: str, recursive: bool = True, limit: Optional[int] = LIST_FOLDER_PAGE_LIMIT,
+                          cursor: Optional[str] = None) -> AsyncIterator[ListFolderResult]:
+        """Async counterpart of ``iter_pages``.
+
+        Each page is fetched in an executor thread so the event loop keeps running
+        while the SDK blocks on the network.
+        """
+        loop = asyncio.get_running_loop()
+        pages = self.iter_pages(path, recursive=recursive, limit=limit, cursor=cursor)
+        while True:
+            page = await loop.run_in_executor(None, next, pages, None)
+            if page is None:
+                return
+            yield page
+
+    async def iter_files(self, path: str, recursive: bool = True,
+                         limit: Optional[int] = LIST_FOLDER_PAGE_LIMIT) -> AsyncIterator[Metadata]:
+        """Stream entries under ``path`` as pages arrive."""
+        async for page in self.aiter_pages(path, recursive=recursive, limit=limit):
+            for entry in page.entries:
+                yield entry
+
+    @staticmethod
+    def is_cursor_reset(error: Exception) -> bool:
+        """Whether ``error`` means a stored list_folder cursor is no longer valid and a full listing is needed."""
+        return (isinstance(error, ApiError) and isinstance(error.error, ListFolderContinueError)
+                and error.error.is_reset())
+
+    def _list_folder_page(self, path: Optional[str] = None, cursor: Optional[str] = None,
+                          recursive: bool = False, limit: Optional[int] = None) -> ListFolderResult:
         if not self._dbx:
             raise ValueError("Dropbox client not initialized. Set access token first.")
-        self._rate_limit()
         try:
-            logger.debug(f"Listing files in Dropbox folder: {path}")
-            result = self._dbx.files_list_folder(path)
-            logger.debug(f"Found {len(result.entries)} entries in {path}")
-            return result
+            if cursor is not None:
+                return self._call_sync(self._dbx.files_list_folder_continue, cursor)
+            return self._call_sync(self._dbx.files_list_folder, path, recursive=recursive, limit=limit)
         except AuthError:
             logger.error("Authentication error when listing files")
             raise InvalidTokenError("The access token is invalid or has been revoked")
         except ApiError as e:
-            logger.error(f"Dropbox API error when listing files in {path}: {str(e)}")
+            logger.error(f"Dropbox API error when listing files in {path or 'cursor'}: {str(e)}")
             raise
 
     async def batch_get_share_links(self, paths: List[str]) -> Dict[str, Optional[str]]:
-        results = {}
-        async def get_link(path):
-            link = await self.get_cached_share_link(path)
-            results[path] = link
-
-        tasks = [asyncio.create_task(get_link(path)) for path in paths]
-        await asyncio.gather(*tasks)
+        cached = await self.link_cache.aget_many(paths)
+        results = {path: cached.get(path.lower()) for path in paths}
+        misses = [path for path, url in results.items() if url is None]
+        if misses:
+            links = await asyncio.gather(*(self.get_share_link(path) for path in misses))
+            results.update(zip(misses, links))
+            await self.link_cache.aput_many({path: url for path, url in zip(misses, links) if url})
         return results
 
     async def get_cached_share_link(self, path: str) -> Optional[str]:
-        cache_file = os.path.join(CACHE_DIR, path.replace('/', '_') + '.json')
-        if os.path.exists(cache_file):
-            with open(cache_file, 'r') as f:
-                cached_data = json.load(f)
-                if time.time() - cached_data['timestamp'] < 3600:  # Cache valid for 1 hour
-                    return cached_data['url']
-        
+        cached = await self.link_cache.aget_many([path])
+        if cached:
+            return cached[path.lower()]
+
         url = await self.get_share_link(path)
         if url:
-            with open(cache_file, 'w') as f:
-                json.dump({'url': url, 'timestamp': time.time()}, f)
+            await self.link_cache.aput_many({path: url})
         return url
 
+    @staticmethod
+    def _to_raw_url(url: str) -> str:
+        # Transform the URL to the raw format and add raw=1
+        raw_url = re.sub(r'www\.dropbox\.com', 'dl.dropboxusercontent.com', url)
+        return raw_url.replace('?dl=0', '?raw=1')
+
+    async def prefetch_shared_links(self) -> int:
+        """Index every existing shared link on the account by path for this run.
+
+        Pages through ``sharing_list_shared_links`` once, without a path, so that
+        per-file lookups become dictionary hits and only files without a link
+        cost an API call. Returns the number of indexed paths.
+        """
+        if not self._dbx:
+            raise ValueError("Dropbox client not initialized. Set access token first.")
+        index = {}
+        result = await self._call(self._dbx.sharing_list_shared_links)
+        while True:
+            for link in result.links:
+                # Links to items the account can no longer see have no path_lower.
+                if link.path_lower and link.path_lower not in index:
+                    index[link.path_lower] = self._to_raw_url(link.url)
+            if not result.has_more:
+                break
+            result = await self._call(self._dbx.sharing_list_shared_links, cursor=result.cursor)
+        self._shared_link_index = index
+        logger.info(f"Indexed {len(index)} existing shared links")
+        return len(index)
+
+    def clear_shared_link_index(self) -> None:
+        self._shared_link_index = None
+
+    @property
+    def shared_link_index(self) -> Optional[Dict[str, str]]:
+        return self._shared_link_index
+
+    @shared_link_index.setter
+    def shared_link_index(self, index: Optional[Dict[str, str]]) -> None:
+        # Lets worker processes reuse an index built once by the parent.
+        self._shared_link_index = index
+
+    async def _find_existing_link(self, path: str, use_index: bool = True) -> Optional[str]:
+        if use_index and self._shared_link_index is not None:
+            return self._shared_link_index.get(path.lower())
+        existing_links = (await self._call(self._dbx.sharing_list_shared_links, path=path, direct_only=True)).links
+        if existing_links:
+            return self._to_raw_url(existing_links[0].url)
+        return None
+
+    async def _create_link(self, path: str) -> str:
+        settings = SharedLinkSettings(requested_visibility=RequestedVisibility.public)
+        shared_link_metadata = await self._call(self._dbx.sharing_create_shared_link_with_settings, path, settings)
+        raw_url = self._to_raw_url(shared_link_metadata.url)
+        if self._shared_link_index is not None:
+            self._shared_link_index[path.lower()] = raw_url
+        return raw_url
+
+    @staticmethod
+    def _is_link_already_exists(error: ApiError) -> bool:
+        return isinstance(error.error, CreateSharedLinkWithSettingsError) and error.error.is_shared_link_already_exists()
+
     async def get_share_link(self, path: str, max_retries: int = 3) -> Optional[str]:
         for attempt in range(max_retries):
             try:
-                await asyncio.sleep(0)  # Allow other coroutines to run
-                self._rate_limit()
-                # First, try to list existing shared links
-                existing_links = self._dbx.sharing_list_shared_links(path=path).links
-                if existing_links:
-                    url = existing_links[0].url
-                    # Transform the URL to the raw format and add raw=1
-                    raw_url = re.sub(r'www\.dropbox\.com', 'dl.dropboxusercontent.com', url)
-                    raw_url = raw_url.replace('?dl=0', '?raw=1')
+                # First, look for an existing shared link, then create one if there is none
+                raw_url = await self._find_existing_link(path)
+                if raw_url:
                     return raw_url
-                
-                # If no existing link, create a new one
-                settings = SharedLinkSettings(requested_visibility=RequestedVisibility.public)
-                shared_link_metadata = self._dbx.sharing_create_shared_link_with_settings(path, settings)
-                url = shared_link_metadata.url
-                # Transform the URL to the raw format and add raw=1
-                raw_url = re.sub(r'www\.dropbox\.com', 'dl.dropboxusercontent.com', url)
-                raw_url = raw_url.replace('?dl=0', '?raw=1')
-                return raw_url
+                return await self._create_link(path)
             except ApiError as e:
-                if isinstance(e.error, CreateSharedLinkWithSettingsError) and e.error.is_shared_link_already_exists():
-                    # If the error indicates that a shared link already exists, try to get it
+                if self._is_link_already_exists(e):
+                    # The link exists but is missing from the index (or was created concurrently); ask for it directly
                     try:
-                        existing_links = self._dbx.sharing_list_shared_links(path=path).links
-                        if existing_links:
-                            url = existing_links[0].url
-                            # Transform the URL to the raw format and add raw=1
-                            raw_url = re.sub(r'www\.dropbox\.com', 'dl.dropboxusercontent.com', url)
-                            raw_url = raw_url.replace('?dl=0', '?raw=1')
+                        raw_url = await self._find_existing_link(path, use_index=False)
+                        if raw_url:
                             return raw_url
                     except Exception as list_error:
-                        logger.error(f"Error retrieving existing shared link for {path}: {str(list_error)}")
+                        logger.error("Error retrieving existing shared link for %s: %s", path, list_error)
                 
                 if attempt < max_retries - 1:
-                    logger.warning(f"Error getting/creating share link, retrying... (Attempt {attempt + 1}/{max_retries})")
-                    time.sleep(1)
+                    logger.warning("Error getting/creating share link, retrying... (Attempt %d/%d)", attempt + 1, max_retries)
+                    await asyncio.sleep(1)
                 else:
-                    logger.error(f"Error getting/creating share link for {path}: {str(e)}")
+                    logger.error("Error getting/creating share link for %s: %s", path, e)
                     return None
             except RateLimitError:
-                logger.warning("Rate limit reached. Waiting before retrying...")
-                time.sleep(60)
+                logger.error("Rate limit retries exhausted getting/creating share link for %s", path)
+                return None
             except Exception as e:
-                logger.error(f"Unexpected error getting/creating share link for {path}: {str(e)}")
+                logger.error("Unexpected error getting/creating share link for %s: %s", path, e)
                 return None
         return None
 
     async def create_shared_link(self, path: str) -> str:
         if not self._dbx:
             raise ValueError("Dropbox client not initialized. Set access token first.")
-        self._rate_limit()
         try:
-            # First, try to get existing shared links
-            existing_links = self._dbx.sharing_list_shared_links(path=path).links
-            if existing_links:
-                url = existing_links[0].url
-            else:
-                # If no existing link, create a new one
-                settings = SharedLinkSettings(requested_visibility=RequestedVisibility.public)
-                shared_link_metadata = self._dbx.sharing_create_shared_link_with_settings(path, settings)
-                url = shared_link_metadata.url
-            
-            # Transform the URL to the raw format and add raw=1
-            raw_url = re.sub(r'www\.dropbox\.com', 'dl.dropboxusercontent.com', url)
-            raw_url = raw_url.replace('?dl=0', '?raw=1')
-            
-            return raw_url
+            # First, try to get an existing shared link
+            raw_url = await self._find_existing_link(path)
+            if raw_url:
+                return raw_url
+            try:
+                return await self._create_link(path)
+            except ApiError as e:
+                if not self._is_link_already_exists(e):
+                    raise
+                raw_url = await self._find_existing_link(path, use_index=False)
+                if not raw_url:
+                    raise
+                return raw_url
         except AuthError:
             logger.error("Authentication error when creating shared link")
             raise InvalidTokenError("The access token is invalid or has been revoked")
@@ -195,63 +375,3 @@ class DropboxService:
         except Exception as e:
             logger.error(f"Unexpected error when creating shared link for {path}: {str(e)}")
             raise
-
-    async def process_files_batch(self, files, output_file, output_format, batch_size=10):
-        total_files = len(files)
-        for i in range(0, total_files, batch_size):
-            batch = files[i:i+batch_size]
-            tasks = [self.process_single_file(file, output_format) for file in batch]
-            results = await asyncio.gather(*tasks)
-            
-            async with aiofiles.open(output_file, mode='a') as f:
-                for result in results:
-                    if result:
-                        await f.write(result + '\n')
-            
-            yield i + len(batch), total_files
-
-    async def process_single_file(self, file, output_format):
-        try:
-            share_link = await self.create_shared_link(file.path_lower)
-            dl_link = share_link.replace('www.dropbox.com', 'dl.dropboxusercontent.com')
-            
-            if output_format == 'txt':
-                return f"{file.name}: {dl_link}"
-            elif output_format == 'html':
-                return f'<a href="{dl_link}">{file.name}</a>'
-            elif output_format == 'markdown':
-                return f'[{file.name}]({dl_link})'
-        except Exception as e:
-            logger.error(f"Error processing file {file.name}: {str(e)}")
-            return None
-
-    def load_progress(self):
-        if os.path.exists(self.progress_file):
-            with open(self.progress_file, 'r') as f:
-                return set(json.load(f))
-        return set()
-
-    async def save_progress(self, processed_files):
-        async with aiofiles.open(self.progress_file, 'w') as f:
-            await f.write(json.dumps(list(processed_files)))
-
-    async def process_files(self, files, output_file, output_format):
-        processed_files = self.load_progress()
-        total_files = len(files)
-
-        async with aiofiles.open(output_file, mode='a') as f:
-            for i, file in enumerate(files):
-                if file.path_lower in processed_files:
-                    yield i + 1, total_files
-                    continue
-
-                try:
-                    result = await self.process_single_file(file, output_format)
-                    if result:
-                        await f.write(result + '\n')
-                        processed_files.add(file.path_lower)
-                        await self.save_progress(processed_files)
-                except Exception as e:
-                    logger.error(f"Error processing file {file.name}: {str(e)}")
-
-                yield i + 1, total_files
\ No newline at end of file
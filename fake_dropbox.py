@@ -0,0 +1,365 @@
+"""In-process stand-in for ``dropbox.Dropbox`` used for offline load testing.
+
+``DropboxService`` talks to it instead of the live API when ``DROPBOX_BACKEND``
+is ``'fake'``. Benchmarks can also pass a configured instance in directly.
+"""
+import base64
+import bisect
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from dropbox.exceptions import ApiError, InternalServerError, RateLimitError
+from dropbox.files import (
+    DeletedMetadata, FileMetadata, FolderMetadata, ListFolderContinueError, ListFolderError,
+    ListFolderResult, LookupError as PathLookupError, Metadata
+)
+from dropbox.sharing import (
+    CreateSharedLinkWithSettingsError, FileLinkMetadata, LinkPermissions, ListSharedLinksError,
+    ListSharedLinksResult
+)
+from config import (
+    FAKE_DROPBOX_DEPTH, FAKE_DROPBOX_ERROR_RATE, FAKE_DROPBOX_FANOUT, FAKE_DROPBOX_FILES,
+    FAKE_DROPBOX_LATENCY, FAKE_DROPBOX_RATE_LIMIT, FAKE_DROPBOX_SEED, LIST_FOLDER_PAGE_LIMIT
+)
+
+_FILE_NAME = re.compile(r'^file_(\d+)(\.[a-z0-9]+)$')
+_EPOCH = datetime(2020, 1, 1)
+SHARED_LINKS_PAGE_SIZE = 1000
+
+
+class FakeDropbox:
+    """Synthetic Dropbox account implementing the SDK calls ``DropboxService`` makes.
+
+    The tree has ``depth`` levels of ``fanout`` subfolders under the root, and
+    ``files`` files spread round-robin over all folders. Entries are generated on
+    demand from their index, so even a million-file tree takes little memory.
+    A fraction ``existing_link_ratio`` of the files starts out with a shared link.
+
+    Every call first sleeps for about ``latency`` seconds. When ``rate_limit`` is
+    set, calls beyond that many per second are answered with a 429 whose
+    ``retry_after`` says when the next call would be allowed. A fraction
+    ``error_rate`` of calls fails with a 503. Given the same ``seed`` and the same
+    call order, runs are reproducible.
+
+    ``add_file``, ``delete`` and ``reset_cursors`` mutate the account, so that
+    incremental runs and cursor handling can be exercised too.
+    """
+
+    def __init__(self, files: int = FAKE_DROPBOX_FILES, depth: int = FAKE_DROPBOX_DEPTH,
+                 fanout: int = FAKE_DROPBOX_FANOUT,
+                 extensions: Sequence[str] = ('.mp3', '.mp4', '.jpg', '.pdf', '.wav', '.mov'),
+                 latency: float = FAKE_DROPBOX_LATENCY, rate_limit: Optional[float] = FAKE_DROPBOX_RATE_LIMIT,
+                 error_rate: float = FAKE_DROPBOX_ERROR_RATE, existing_link_ratio: float = 0.0,
+                 seed: int = FAKE_DROPBOX_SEED):
+        # Constructor arguments, so another process can build an identical account (without later edits).
+        self.spec = dict(files=files, depth=depth, fanout=fanout, extensions=list(extensions), latency=latency,
+                         rate_limit=rate_limit, error_rate=error_rate, existing_link_ratio=existing_link_ratio,
+                         seed=seed)
+        self.files = files
+        self.extensions = list(extensions)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.existing_link_ratio = existing_link_ratio
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._allowed_at = 0.0
+        self.calls = Counter()
+        self.rate_limited = 0
+        self.server_errors = 0
+
+        # Folders in depth-first order; each subtree is a contiguous range.
+        self._folders: List[Tuple[str, str]] = []  # (path_lower, path_display)
+        self._children: List[List[int]] = []
+        self._subtree_end: List[int] = []
+        self._build_tree('', '', depth, fanout)
+        self._folder_index = {path: k for k, (path, _) in enumerate(self._folders)}
+        folder_count = len(self._folders)
+        self._file_counts = [files // folder_count + (1 if k < files % folder_count else 0)
+                             for k in range(folder_count)]
+        # In recursive order each folder contributes its own entry, then its files.
+        self._offsets = [0]
+        for count in self._file_counts:
+            self._offsets.append(self._offsets[-1] + 1 + count)
+
+        self._links: Dict[str, str] = {}
+        self._added: Dict[str, FileMetadata] = {}
+        self._added_at: Dict[str, int] = {}  # path_lower -> version it was added in
+        self._deleted: Set[str] = set()
+        self._changes: List[Tuple[int, Metadata]] = []
+        self._version = 0
+        self._epoch = 0
+
+    @classmethod
+    def from_config(cls) -> 'FakeDropbox':
+        return cls()
+
+    def _build_tree(self, path: str, display: str, depth: int, fanout: int) -> int:
+        index = len(self._folders)
+        self._folders.append((path, display))
+        self._children.append([])
+        self._subtree_end.append(0)
+        if depth > 0:
+            for i in range(fanout):
+                self._children[index].append(
+                    self._build_tree(f'{path}/folder_{i:02d}', f'{display}/Folder_{i:02d}', depth - 1, fanout))
+        self._subtree_end[index] = len(self._folders)
+        return index
+
+    # Fault injection
+
+    def _enter(self, endpoint: str) -> None:
+        with self._lock:
+            self.calls[endpoint] += 1
+            delay = self.latency * (0.5 + self._random.random()) if self.latency else 0.0
+            fail = self.error_rate and self._random.random() < self.error_rate
+            retry_after = None
+            if self.rate_limit:
+                now = time.monotonic()
+                # Server-side bucket with one second of burst.
+                self._allowed_at = max(self._allowed_at, now - 1.0)
+                if self._allowed_at > now:
+                    retry_after = self._allowed_at - now
+                else:
+                    self._allowed_at += 1.0 / self.rate_limit
+            if retry_after is not None:
+                self.rate_limited += 1
+            elif fail:
+                self.server_errors += 1
+        if delay:
+            time.sleep(delay)
+        if retry_after is not None:
+            raise RateLimitError('fake', backoff=retry_after)
+        if fail:
+            raise InternalServerError('fake', 503, 'Service Unavailable')
+
+    @staticmethod
+    def _api_error(error) -> ApiError:
+        return ApiError('fake', error, None, None)
+
+    # Entries
+
+    def _file(self, file_id: int) -> FileMetadata:
+        folder_path, folder_display = self._folders[file_id % len(self._folders)]
+        extension = self.extensions[file_id % len(self.extensions)]
+        name = f'file_{file_id:07d}{extension}'
+        modified = _EPOCH + timedelta(minutes=file_id)
+        return FileMetadata(
+            name=name.capitalize(), path_lower=f'{folder_path}/{name}',
+            path_display=f'{folder_display}/{name.capitalize()}', id=f'id:file{file_id}',
+            client_modified=modified, server_modified=modified, rev=f'{file_id + 1:09x}',
+            size=1024 + (file_id * 7919) % (50 * 1024 * 1024),
+        )
+
+    def _folder(self, index: int) -> FolderMetadata:
+        path, display = self._folders[index]
+        return FolderMetadata(name=display.rsplit('/', 1)[-1], path_lower=path, path_display=display,
+                              id=f'id:folder{index}')
+
+    def _file_id(self, path_lower: str) -> Optional[int]:
+        folder, _, name = path_lower.rpartition('/')
+        match = _FILE_NAME.match(name)
+        if not match:
+            return None
+        file_id = int(match.group(1))
+        if (file_id < self.files and self._folders[file_id % len(self._folders)][0] == folder
+                and self.extensions[file_id % len(self.extensions)] == match.group(2)):
+            return file_id
+        return None
+
+    def _is_deleted(self, path_lower: str) -> bool:
+        while path_lower:
+            if path_lower in self._deleted:
+                return True
+            path_lower = path_lower.rpartition('/')[0]
+        return False
+
+    def _exists(self, path_lower: str) -> bool:
+        if self._is_deleted(path_lower):
+            return False
+        return path_lower in self._added or path_lower in self._folder_index or self._file_id(path_lower) is not None
+
+    def _base_count(self, index: int, recursive: bool) -> int:
+        if recursive:
+            return self._offsets[self._subtree_end[index]] - self._offsets[index] - 1
+        return len(self._children[index]) + self._file_counts[index]
+
+    def _base_entry(self, index: int, recursive: bool, position: int) -> Metadata:
+        if recursive:
+            offset = self._offsets[index] + 1 + position
+            folder = bisect.bisect_right(self._offsets, offset) - 1
+            local = offset - self._offsets[folder]
+            if local == 0:
+                return self._folder(folder)
+            return self._file(folder + (local - 1) * len(self._folders))
+        children = self._children[index]
+        if position < len(children):
+            return self._folder(children[position])
+        return self._file(index + (position - len(children)) * len(self._folders))
+
+    def _in_scope(self, path_lower: str, folder: str, recursive: bool) -> bool:
+        if recursive:
+            return folder == '' or path_lower.startswith(folder + '/')
+        return path_lower.rpartition('/')[0] == folder
+
+    def _added_paths(self, path: str, recursive: bool, version: int) -> List[str]:
+        # Files added after ``version`` belong to the change feed, not to the listing.
+        return sorted(p for p, added_at in self._added_at.items()
+                      if added_at <= version and self._in_scope(p, path, recursive))
+
+    # Listing
+
+    def _encode_cursor(self, **state) -> str:
+        return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+    def _page(self, path: str, recursive: bool, position: int, limit: int, version: int) -> ListFolderResult:
+        index = self._folder_index[path]
+        base = self._base_count(index, recursive)
+        added = self._added_paths(path, recursive, version)
+        total = base + len(added)
+        end = min(total, position + limit)
+        entries = []
+        for i in range(position, end):
+            entry = self._base_entry(index, recursive, i) if i < base else self._added[added[i - base]]
+            if not self._deleted or not self._is_deleted(entry.path_lower):
+                entries.append(entry)
+        cursor = self._encode_cursor(p=path, r=recursive, o=end, l=limit, v=version, e=self._epoch)
+        return ListFolderResult(entries=entries, cursor=cursor, has_more=end < total)
+
+    def files_list_folder(self, path: str, recursive: bool = False, limit: Optional[int] = None,
+                          **kwargs) -> ListFolderResult:
+        self._enter('files/list_folder')
+        path = path.lower().rstrip('/')
+        if path not in self._folder_index or self._is_deleted(path):
+            raise self._api_error(ListFolderError.path(PathLookupError.not_found))
+        with self._lock:
+            version = self._version
+        return self._page(path, recursive, 0, limit or LIST_FOLDER_PAGE_LIMIT, version)
+
+    def files_list_folder_continue(self, cursor: str) -> ListFolderResult:
+        self._enter('files/list_folder/continue')
+        try:
+            state = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except ValueError:
+            raise self._api_error(ListFolderContinueError.reset)
+        if state['e'] != self._epoch:
+            raise self._api_error(ListFolderContinueError.reset)
+        path, recursive, limit = state['p'], state['r'], state['l']
+        index = self._folder_index[path]
+        if state['o'] < self._base_count(index, recursive) + len(self._added_paths(path, recursive, state['v'])):
+            return self._page(path, recursive, state['o'], limit, state['v'])
+        # The listing is complete: report what changed since its cursor was issued.
+        with self._lock:
+            version = self._version
+            changes = [entry for changed_at, entry in self._changes
+                       if changed_at > state['v'] and self._in_scope(entry.path_lower, path, recursive)]
+            end = self._base_count(index, recursive) + len(self._added_paths(path, recursive, version))
+        cursor = self._encode_cursor(p=path, r=recursive, o=end, l=limit, v=version, e=self._epoch)
+        return ListFolderResult(entries=changes, cursor=cursor, has_more=False)
+
+    # Mutations
+
+    def add_file(self, path: str, size: int = 1024) -> FileMetadata:
+        """Create (or overwrite) a file under an existing folder."""
+        path_lower = path.lower()
+        name = path.rsplit('/', 1)[-1]
+        now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+        entry = FileMetadata(name=name, path_lower=path_lower, path_display=path, id=f'id:added{len(self._added)}',
+                             client_modified=now, server_modified=now, rev=f'{self._version + 1:09x}', size=size)
+        with self._lock:
+            self._deleted.discard(path_lower)
+            self._added[path_lower] = entry
+            self._version += 1
+            self._added_at[path_lower] = self._version
+            self._changes.append((self._version, entry))
+        return entry
+
+    def delete(self, path: str) -> None:
+        path_lower = path.lower()
+        with self._lock:
+            self._added.pop(path_lower, None)
+            self._added_at.pop(path_lower, None)
+            self._links.pop(path_lower, None)
+            self._deleted.add(path_lower)
+            self._version += 1
+            self._changes.append((self._version, DeletedMetadata(name=path.rsplit('/', 1)[-1],
+                                                                 path_lower=path_lower, path_display=path)))
+
+    def reset_cursors(self) -> None:
+        """Invalidate every cursor issued so far, as Dropbox occasionally does."""
+        with self._lock:
+            self._epoch += 1
+
+    # Shared links
+
+    def _preexisting_link(self, path_lower: str) -> bool:
+        return (self.existing_link_ratio > 0
+                and zlib.crc32(path_lower.encode()) % 10_000 < self.existing_link_ratio * 10_000)
+
+    def _link_url(self, path_lower: str) -> Optional[str]:
+        url = self._links.get(path_lower)
+        if url is None and self._preexisting_link(path_lower) and self._exists(path_lower):
+            url = self._make_url(path_lower)
+        return url
+
+    @staticmethod
+    def _make_url(path_lower: str) -> str:
+        token = format(zlib.crc32(path_lower.encode()), '08x') + format(zlib.adler32(path_lower.encode()), '08x')
+        return f'https://www.dropbox.com/s/{token}/{path_lower.rsplit("/", 1)[-1]}?dl=0'
+
+    @staticmethod
+    def _link(path_lower: str, url: str) -> FileLinkMetadata:
+        return FileLinkMetadata(url=url, name=path_lower.rsplit('/', 1)[-1], path_lower=path_lower,
+                                link_permissions=LinkPermissions(can_revoke=True))
+
+    def sharing_list_shared_links(self, path: Optional[str] = None, cursor: Optional[str] = None,
+                                  direct_only: Optional[bool] = None) -> ListSharedLinksResult:
+        self._enter('sharing/list_shared_links')
+        if path is not None:
+            path_lower = path.lower()
+            if not self._exists(path_lower):
+                raise self._api_error(ListSharedLinksError.path(PathLookupError.not_found))
+            url = self._link_url(path_lower)
+            return ListSharedLinksResult(links=[self._link(path_lower, url)] if url else [], has_more=False)
+        # Every link on the account: synthetic files with a pre-existing link, then links made here.
+        position = int(cursor) if cursor else 0
+        links = []
+        while position < self.files and len(links) < SHARED_LINKS_PAGE_SIZE:
+            path_lower = self._file(position).path_lower
+            if path_lower not in self._links and self._link_url(path_lower):
+                links.append(self._link(path_lower, self._make_url(path_lower)))
+            position += 1
+        if position >= self.files:
+            with self._lock:
+                created = list(self._links.items())
+            links.extend(self._link(path_lower, url) for path_lower, url in created)
+            return ListSharedLinksResult(links=links, has_more=False)
+        return ListSharedLinksResult(links=links, has_more=True, cursor=str(position))
+
+    def sharing_create_shared_link_with_settings(self, path: str, settings=None) -> FileLinkMetadata:
+        self._enter('sharing/create_shared_link_with_settings')
+        path_lower = path.lower()
+        if not self._exists(path_lower):
+            raise self._api_error(CreateSharedLinkWithSettingsError.path(PathLookupError.not_found))
+        with self._lock:
+            if path_lower in self._links or self._preexisting_link(path_lower):
+                raise self._api_error(CreateSharedLinkWithSettingsError.shared_link_already_exists(None))
+            url = self._links[path_lower] = self._make_url(path_lower)
+        return self._link(path_lower, url)
+
+    # Account
+
+    def users_get_current_account(self):
+        self._enter('users/get_current_account')
+        return SimpleNamespace(account_id='dbid:fake', email='fake@example.com')
+
+    def stats(self) -> Dict:
+        return {'calls': dict(self.calls), 'rate_limited': self.rate_limited, 'server_errors': self.server_errors,
+                'links_created': len(self._links)}
@@ -0,0 +1,113 @@
+import fnmatch
+import hashlib
+import json
+import re
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Pattern
+
+
+def _naive_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    # Dropbox reports server_modified as naive UTC; aware bounds would not compare with it.
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _compile_globs(patterns: Iterable[str]) -> Optional[Pattern]:
+    # One alternation of all patterns, matched against lowercased paths.
+    translated = [fnmatch.translate(pattern.lower()) for pattern in patterns]
+    return re.compile('|'.join(f'(?:{t})' for t in translated)) if translated else None
+
+
+class FileFilter:
+    """Predicate over Dropbox entries, compiled once per job.
+
+    Checks run cheapest first: an O(1) suffix lookup in a frozen extension set,
+    then size and ``server_modified`` bounds (naive datetimes are taken as UTC,
+    aware ones are converted to it), then the path patterns. Include
+    patterns are shell globs and/or one regular expression; an entry must match
+    at least one of them when any are given. Exclusions are globs, and a pattern
+    without wildcards excludes that folder and everything below it. All path
+    matching is case-insensitive against ``path_lower``.
+    """
+
+    def __init__(self, extensions: Optional[Iterable[str]] = None, min_size: Optional[int] = None,
+                 max_size: Optional[int] = None, modified_after: Optional[datetime] = None,
+                 modified_before: Optional[datetime] = None, include_globs: Iterable[str] = (),
+                 include_regex: Optional[str] = None, exclude: Iterable[str] = ()):
+        include_globs, exclude = list(include_globs), list(exclude)
+        modified_after, modified_before = _naive_utc(modified_after), _naive_utc(modified_before)
+        self.extensions = frozenset(ext.lower() for ext in extensions) if extensions is not None else None
+        # Dot counts of the configured extensions, so '.tar.gz' works as well as '.mp3'.
+        self._suffix_dots = sorted({ext.count('.') for ext in self.extensions or ()})
+        self.min_size = min_size
+        self.max_size = max_size
+        self.modified_after = modified_after
+        self.modified_before = modified_before
+        self._include_glob = _compile_globs(include_globs)
+        self._include_regex = re.compile(include_regex, re.IGNORECASE) if include_regex else None
+        exclude_globs = []
+        self._exclude_prefixes = []
+        for pattern in exclude:
+            if any(char in pattern for char in '*?['):
+                exclude_globs.append(pattern)
+            else:
+                self._exclude_prefixes.append(pattern.lower().rstrip('/'))
+        self._exclude_prefixes = tuple(self._exclude_prefixes)
+        self._exclude_glob = _compile_globs(exclude_globs)
+        # Everything that decides what matches, in a form that serializes the same way every time.
+        self._criteria = {
+            'extensions': sorted(self.extensions) if self.extensions is not None else None,
+            'min_size': min_size,
+            'max_size': max_size,
+            'modified_after': modified_after.isoformat() if modified_after else None,
+            'modified_before': modified_before.isoformat() if modified_before else None,
+            'include_globs': sorted(include_globs),
+            'include_regex': include_regex,
+            'exclude': sorted(exclude),
+        }
+
+    @property
+    def fingerprint(self) -> str:
+        """Digest of all criteria; two filters with the same fingerprint match the same entries."""
+        return hashlib.sha1(json.dumps(self._criteria, sort_keys=True).encode()).hexdigest()
+
+    def matches_name(self, name: str) -> bool:
+        if self.extensions is None:
+            return True
+        name = name.lower()
+        for dots in self._suffix_dots:
+            parts = name.rsplit('.', dots)
+            if len(parts) > dots and '.' + '.'.join(parts[1:]) in self.extensions:
+                return True
+        return False
+
+    def excludes_folder(self, path_lower: str) -> bool:
+        """Whether a whole folder is excluded, so traversal can skip it."""
+        return self._is_excluded(path_lower)
+
+    def _is_excluded(self, path_lower: str) -> bool:
+        for prefix in self._exclude_prefixes:
+            if path_lower == prefix or path_lower.startswith(prefix + '/'):
+                return True
+        return bool(self._exclude_glob and self._exclude_glob.match(path_lower))
+
+    def __call__(self, entry) -> bool:
+        if not self.matches_name(entry.name):
+            return False
+        if self.min_size is not None and entry.size < self.min_size:
+            return False
+        if self.max_size is not None and entry.size > self.max_size:
+            return False
+        if self.modified_after is not None and entry.server_modified < self.modified_after:
+            return False
+        if self.modified_before is not None and entry.server_modified >= self.modified_before:
+            return False
+        path_lower = entry.path_lower
+        if self._include_glob or self._include_regex:
+            if not ((self._include_glob and self._include_glob.match(path_lower))
+                    or (self._include_regex and self._include_regex.search(path_lower))):
+                return False
+        if self._exclude_prefixes or self._exclude_glob:
+            return not self._is_excluded(path_lower)
+        return True
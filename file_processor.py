@@ -1,141 +1,176 @@
-import importlib
-import subprocess
-import sys
-from collections import defaultdict
-import json
-import os
 import asyncio
-import aiofiles
-from typing import List, Dict, Any, AsyncGenerator, Optional, Union, Tuple
-from dropbox.files import FileMetadata, FolderMetadata
+import posixpath
+from typing import List, Any, AsyncGenerator, Optional, Union, Tuple
+from dropbox.files import FileMetadata
+from concurrent.futures import ThreadPoolExecutor
 from config import (
-    AUDIO_EXTENSIONS, VIDEO_EXTENSIONS, IMAGE_EXTENSIONS, DOCUMENT_EXTENSIONS,
-    BATCH_SIZE, logger, ALL_FILE_EXTENSIONS
-)
-import re
-from dropbox_service import DropboxService
-
-def install_aiofiles():
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "aiofiles"])
-
-try:
-    importlib.import_module('aiofiles')
-except ImportError:
-    print("aiofiles not found. Installing...")
-    install_aiofiles()
-
-import aiofiles  # Make sure this line is here and not commented out
-import asyncio
-import os
-import csv
-import dropbox
-from typing import List, Dict, Any, AsyncGenerator, Optional, Union, Tuple
-from dropbox.files import FileMetadata, FolderMetadata
-from config import (
-    AUDIO_EXTENSIONS, VIDEO_EXTENSIONS, IMAGE_EXTENSIONS, DOCUMENT_EXTENSIONS,
-    BATCH_SIZE, logger, ALL_FILE_EXTENSIONS
+    IMAGE_EXTENSIONS, DOCUMENT_EXTENSIONS, FILE_TYPE_EXTENSIONS,
+    BATCH_SIZE, logger, debug_sampled, ALL_FILE_EXTENSIONS, TRAVERSAL_MODE, LISTING_CONCURRENCY,
+    PREFETCH_SHARED_LINKS, LINK_CONCURRENCY
 )
 import re
+from async_utils import ordered_map
 from dropbox_service import DropboxService
+from file_filter import FileFilter
+from file_store import FileStore
+from job_journal import JobJournal
+from link_cache import TieredLinkCache
+from listing_cache import ListedFile
+from output_writers import OutputRecord, create_writer
 
 class FileProcessor:
     def __init__(self, dropbox_service):
         self.dropbox_service = dropbox_service
-        self.progress_file = 'processing_progress.json'
 
-    async def collect_files(self, folder_path: str, file_types: List[str]) -> Optional[Dict[str, List[Union[str, FileMetadata]]]]:
+    async def collect_files(self, folder_path: str, file_types: List[str], traversal: Optional[str] = None,
+                            concurrency: Optional[int] = None, ordered: bool = True,
+                            file_filter: Optional[FileFilter] = None) -> Optional[FileStore]:
+        """The files under ``folder_path`` that pass the filter, or None if any folder could not be listed."""
+        traversal = traversal or TRAVERSAL_MODE
         try:
-            logger.debug(f"Starting file collection from folder: {folder_path}")
+            logger.debug(f"Starting file collection from folder: {folder_path} (traversal: {traversal})")
             logger.debug(f"File types to collect: {file_types}")
-            all_files = {}
-            extensions = self._get_extensions(file_types)
-            logger.debug(f"Extensions to look for: {extensions}")
-            await self._collect_files_recursive(folder_path, extensions, all_files)
-            logger.debug(f"File collection complete. Total folders: {len(all_files)}")
-            for folder, files in all_files.items():
-                logger.debug(f"Folder: {folder}, Files: {len(files)}")
+            all_files = FileStore()
+            file_filter = file_filter or self.build_filter(file_types)
+            if traversal == 'concurrent':
+                await self._collect_files_concurrent(folder_path, file_filter, all_files,
+                                                     concurrency or LISTING_CONCURRENCY, ordered)
+            elif traversal == 'recursive':
+                await self._collect_files_recursive(folder_path, file_filter, all_files)
+            else:
+                raise ValueError(f"Unknown traversal mode: {traversal}")
+            logger.debug("File collection complete: %d files in %d folders", len(all_files), len(all_files.folders))
             return all_files
         except Exception as e:
             logger.error(f"Error collecting files: {str(e)}")
             return None
 
-    async def _collect_files_recursive(self, folder_path: str, extensions: List[str], all_files: Dict[str, List[Union[str, FileMetadata]]]):
-        try:
-            logger.debug(f"Listing files in folder: {folder_path}")
-            result = self.dropbox_service.list_files(folder_path)
-            logger.debug(f"Files/folders found in {folder_path}: {len(result.entries)}")
-            for entry in result.entries:
-                if isinstance(entry, FileMetadata):
-                    logger.debug(f"File found: {entry.name}")
-                    if any(entry.name.lower().endswith(ext.lower()) for ext in extensions):
-                        logger.debug(f"File matches extension: {entry.name}")
-                        if folder_path not in all_files:
-                            all_files[folder_path] = []
-                        all_files[folder_path].append(entry)
-                elif isinstance(entry, FolderMetadata):
-                    logger.debug(f"Subfolder found: {entry.name}")
-                    await self._collect_files_recursive(entry.path_lower, extensions, all_files)
-        except Exception as e:
-            logger.error(f"Error collecting files from {folder_path}: {str(e)}")
+    async def _collect_files_recursive(self, folder_path: str, file_filter: FileFilter, all_files: FileStore):
+        # A single server-side recursive listing replaces one round trip per subfolder.
+        logger.debug(f"Listing files recursively under: {folder_path}")
+        async for entry in self.dropbox_service.iter_files(folder_path, recursive=True):
+            # Rejected entries are dropped as they stream in; accepted ones keep only their path.
+            if isinstance(entry, FileMetadata) and file_filter(entry):
+                all_files.add(self.folder_of(entry), entry)
+
+    async def _collect_files_concurrent(self, folder_path: str, file_filter: FileFilter, all_files: FileStore,
+                                        concurrency: int, ordered: bool):
+        # Sibling folders are listed in parallel; the semaphore bounds in-flight SDK calls,
+        # which run in a dedicated pool so they never block the event loop.
+        listing_cache = self.dropbox_service.listing_cache
+        semaphore = asyncio.Semaphore(concurrency)
+        failed: List[str] = []
+
+        async def walk(path: str) -> List[Tuple[str, List[ListedFile]]]:
+            try:
+                async with semaphore:
+                    # Folders already listed (e.g. by the folder browser) only cost a cursor check.
+                    listing = await listing_cache.aget(path, executor)
+            except Exception as e:
+                # Siblings keep going; the collection as a whole fails once they are done.
+                logger.error("Error collecting files from %s: %s", path, e)
+                failed.append(path)
+                return []
+
+            matches = [entry for entry in listing.files if file_filter(entry)]
+            subfolders = [entry.path_lower for entry in listing.folders
+                          if not file_filter.excludes_folder(entry.path_lower)]
+            debug_sampled('collect_folder', "Listed %s: %d matching files, %d subfolders",
+                          path or '/', len(matches), len(subfolders))
+
+            if not ordered:
+                if matches:
+                    all_files.extend(path, matches)
+                await asyncio.gather(*(walk(subfolder) for subfolder in subfolders))
+                return []
+
+            # Keep the output deterministic: a folder's files, then its subfolders in sorted order.
+            groups = [(path, matches)] if matches else []
+            for child_groups in await asyncio.gather(*(walk(subfolder) for subfolder in sorted(subfolders))):
+                groups.extend(child_groups)
+            return groups
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='dropbox-list') as executor:
+            groups = await walk(folder_path)
+        logger.debug(f"Listing cache stats: {listing_cache.stats()}")
+        if failed:
+            raise RuntimeError(f"{len(failed)} folders under {folder_path or '/'} could not be listed")
+        for path, matches in groups:
+            all_files.extend(path, matches)
+
+    @staticmethod
+    def folder_of(entry: FileMetadata) -> str:
+        return posixpath.dirname(entry.path_lower)
+
+    @staticmethod
+    def path_of(file: Union[str, FileMetadata, ListedFile]) -> str:
+        return file if isinstance(file, str) else file.path_lower
 
     def _get_extensions(self, file_types: List[str]) -> List[str]:
         extensions = []
-        if 'Audio' in file_types:
-            extensions.extend(AUDIO_EXTENSIONS)
-        if 'Video' in file_types:
-            extensions.extend(VIDEO_EXTENSIONS)
+        for file_type in file_types:
+            extensions.extend(FILE_TYPE_EXTENSIONS.get(file_type, ()))
         logger.debug(f"File types: {file_types}, Extensions to collect: {extensions}")
         return extensions
 
-    async def process_files(self, files: Dict[str, List[Union[str, FileMetadata]]], output_file: str, output_format: str) -> AsyncGenerator[Tuple[int, int], None]:
-        total_files = sum(len(folder_files) for folder_files in files.values())
-        processed_count = 0
-
-        with open(output_file, 'w', encoding='utf-8') as f:
-            for folder_path, folder_files in files.items():
-                if folder_files:
-                    # Simplify the folder path to show only the last three levels
-                    path_parts = folder_path.split('/')
-                    simplified_folder_path = '/'.join(path_parts[-3:])
-                    f.write(f"\n{simplified_folder_path}:\n")
-                    f.write("=" * len(simplified_folder_path) + "\n\n")
-
-                for file in folder_files:
-                    result = await self.process_single_file(file, output_format)
-                    if result:
-                        f.write(result + "\n")
-                    processed_count += 1
-                    yield processed_count, total_files
-
-    async def process_single_file(self, file: Union[str, FileMetadata], output_format: str) -> Optional[str]:
+    def build_filter(self, file_types: List[str], **criteria) -> FileFilter:
+        """Compile the job's filter: the extensions of ``file_types`` plus any FileFilter criteria."""
+        return FileFilter(self._get_extensions(file_types), **criteria)
+
+    async def process_files(self, files: FileStore, output_file: str, output_format: str,
+                            concurrency: Optional[int] = None, resume: bool = False,
+                            prefetch: bool = PREFETCH_SHARED_LINKS) -> AsyncGenerator[Tuple[int, int], None]:
+        concurrency = concurrency or LINK_CONCURRENCY
+        total_files = len(files)
+        journal = JobJournal.for_output(output_file)
+        completed = journal.load() if resume else set()
+        # Files finished by an earlier attempt count as processed; their links are already in the output.
+        processed_count = sum(1 for _, path in files if path in completed) if completed else 0
+        if prefetch:
+            await self.prefetch_shared_links()
+
+        async def resolve(entry):
+            return await self.resolve_link(entry[1])
+
+        # Streamed from the store; ordered_map only holds its window of pending files.
+        entries = ((folder_path, path) for folder_path, path in files if path not in completed)
+        writer = create_writer(output_format, output_file, append=bool(completed))
+        finished = False
         try:
-            file_path = file.path_lower if isinstance(file, FileMetadata) else file
-            file_name = os.path.basename(file_path)
-            
-            # Simplify the path to show only the last three levels
-            path_parts = file_path.split('/')
-            simplified_path = '/'.join(path_parts[-3:])
-            
-            raw_link = await self.dropbox_service.create_shared_link(file_path)
-            
-            if output_format == 'html':
-                return f'<p>Path: {simplified_path}<br><a href="{raw_link}">{file_name}</a></p>'
-            elif output_format == 'markdown':
-                return f'Path: {simplified_path}\n[{file_name}]({raw_link})\n'
-            else:  # Plain text
-                return f'Path: {simplified_path}\n{raw_link}\n'
-        except Exception as e:
-            logger.error(f"Error processing file {file_path}: {str(e)}")
-            return None
+            await writer.open(journal)
+            # Links are requested concurrently but released in the original folder/file order.
+            async for (folder_path, path), url in ordered_map(resolve, entries, concurrency):
+                if url:
+                    await writer.write(OutputRecord(folder_path, path, url))
+                processed_count += 1
+                yield processed_count, total_files
+            finished = True
+        finally:
+            await writer.close(completed=finished)
+            journal.close(completed=finished)
 
-    def load_progress(self) -> set:
-        if os.path.exists(self.progress_file):
-            with open(self.progress_file, 'r') as f:
-                return set(json.load(f))
-        return set()
+    async def warm_link_cache(self, folder_path: str) -> None:
+        cache = self.dropbox_service.link_cache
+        if isinstance(cache, TieredLinkCache):
+            try:
+                warmed = await cache.awarm(folder_path)
+                logger.debug(f"Warmed {warmed} cached links for {folder_path}")
+            except Exception as e:
+                logger.warning(f"Could not warm link cache for {folder_path}: {str(e)}")
 
-    async def save_progress(self, processed_files: set):
-        async with aiofiles.open(self.progress_file, 'w') as f:
-            await f.write(json.dumps(list(processed_files)))
+    async def prefetch_shared_links(self) -> None:
+        try:
+            await self.dropbox_service.prefetch_shared_links()
+        except Exception as e:
+            # Fall back to per-file lookups rather than failing the run.
+            self.dropbox_service.clear_shared_link_index()
+            logger.warning(f"Could not prefetch shared links, falling back to per-file lookups: {str(e)}")
 
-    # ... other methods ...
\ No newline at end of file
+    async def resolve_link(self, file: Union[str, FileMetadata, ListedFile]) -> Optional[str]:
+        """Return the raw share link of ``file``, or None if it could not be resolved."""
+        file_path = self.path_of(file)
+        try:
+            return await self.dropbox_service.get_cached_share_link(file_path)
+        except Exception as e:
+            logger.error("Error processing file %s: %s", file_path, e)
+            return None
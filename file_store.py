@@ -0,0 +1,113 @@
+import gzip
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from dropbox.files import FileMetadata
+from listing_cache import ListedFile
+
+
+class FileStore:
+    """Collected files grouped by folder, holding only what linking and output need.
+
+    Each folder path is stored once; a file is just its lowercased name in its
+    folder's list, and its path is rebuilt on demand. That is a few dozen bytes
+    per file where a ``FileMetadata`` costs well over a kilobyte, so a million
+    collected files fit in tens of megabytes. Folders keep their insertion
+    order and files their order within a folder.
+    """
+
+    def __init__(self):
+        self._folders: List[str] = []
+        self._folder_ids: Dict[str, int] = {}
+        self._names: List[List[str]] = []
+        self._count = 0
+        self._lookup: Optional[Dict[str, Dict[str, int]]] = None
+
+    @staticmethod
+    def _join(folder: str, name: str) -> str:
+        return f"{folder.rstrip('/')}/{name}"
+
+    def _folder_names(self, folder: str) -> List[str]:
+        folder_id = self._folder_ids.get(folder)
+        if folder_id is None:
+            folder_id = self._folder_ids[folder] = len(self._folders)
+            self._folders.append(folder)
+            self._names.append([])
+        return self._names[folder_id]
+
+    def add(self, folder: str, file: Union[str, FileMetadata, ListedFile]) -> None:
+        """Add a file (a lowercased path or a listing entry) under ``folder``, its parent."""
+        path_lower = file if isinstance(file, str) else file.path_lower
+        self._folder_names(folder).append(path_lower.rpartition('/')[2])
+        self._count += 1
+        self._lookup = None
+
+    def extend(self, folder: str, files: Iterable[Union[str, FileMetadata, ListedFile]]) -> None:
+        names = self._folder_names(folder)
+        before = len(names)
+        names.extend((file if isinstance(file, str) else file.path_lower).rpartition('/')[2] for file in files)
+        self._count += len(names) - before
+        self._lookup = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __bool__(self) -> bool:
+        return self._count > 0
+
+    @property
+    def folders(self) -> List[str]:
+        return [folder for folder, names in zip(self._folders, self._names) if names]
+
+    def paths_in(self, folder: str) -> List[str]:
+        folder_id = self._folder_ids.get(folder)
+        if folder_id is None:
+            return []
+        return [self._join(folder, name) for name in self._names[folder_id]]
+
+    def items(self) -> Iterator[Tuple[str, List[str]]]:
+        """``(folder, paths)`` for every non-empty folder, like the dict ``collect_files`` used to return."""
+        for folder in self.folders:
+            yield folder, self.paths_in(folder)
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        """``(folder, path)`` for every file, folder by folder."""
+        for folder, names in zip(self._folders, self._names):
+            for name in names:
+                yield folder, self._join(folder, name)
+
+    def __contains__(self, path: str) -> bool:
+        return self.folder_of(path) is not None
+
+    def folder_of(self, path: str) -> Optional[str]:
+        """The folder ``path`` was stored under, or None if it is not in the store."""
+        if self._lookup is None:
+            # Built on first lookup only; iteration does not need it.
+            self._lookup = {}
+            for folder_id, folder in enumerate(self._folders):
+                self._lookup.setdefault(folder.rstrip('/'), {}).update(
+                    dict.fromkeys(self._names[folder_id], folder_id))
+        parent, _, name = path.lower().rpartition('/')
+        folder_id = self._lookup.get(parent, {}).get(name)
+        return None if folder_id is None else self._folders[folder_id]
+
+    def save(self, path: str) -> None:
+        """Write the store as JSON lines, one ``[folder, names]`` per folder; gzipped for ``.gz`` paths."""
+        opener = gzip.open if path.endswith('.gz') else open
+        tmp_path = path + '.tmp'
+        with opener(tmp_path, 'wt', encoding='utf-8') as f:
+            for folder, names in zip(self._folders, self._names):
+                if names:
+                    f.write(json.dumps([folder, names]) + '\n')
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'FileStore':
+        opener = gzip.open if path.endswith('.gz') else open
+        store = cls()
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                folder, names = json.loads(line)
+                store._folder_names(folder).extend(names)
+                store._count += len(names)
+        return store
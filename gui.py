@@ -9,16 +9,16 @@ from dropbox.files import FolderMetadata  # Added FolderMetadata import
 from dropbox.sharing import CreateSharedLinkWithSettingsError  # Added CreateSharedLinkWithSettingsError import
 from dropbox_service import DropboxService, TokenExpiredError, InvalidTokenError
 from file_processor import FileProcessor
-from config import WINDOW_TITLE, WINDOW_SIZE, OUTPUT_FORMATS, DROPBOX_ACCESS_TOKEN, setup_logging, load_json_config, save_json_config, ALL_FILE_EXTENSIONS, PREFERENCES_FILE
+from config import WINDOW_TITLE, WINDOW_SIZE, OUTPUT_FORMATS, BROWSER_PREFETCH_CONCURRENCY, BROWSER_PREFETCH_LIMIT, logger, load_json_config, save_json_config, ALL_FILE_EXTENSIONS, PREFERENCES_FILE
 from datetime import datetime  # Import datetime for timestamp
 import json  # Import json for saving/loading preferences
 import time  # Add this import
 from app_controller import AppController
+from tk_asyncio import TkAsyncioBridge
+from progress import ProgressTracker, format_progress
+from output_writers import get_writer_class
 from pathlib import Path
 
-# Initialize logger
-logger = setup_logging()
-
 class TokenDialog(simpledialog.Dialog):
     def __init__(self, parent, title=None):
         logger.debug("TokenDialog initialized")
@@ -37,59 +37,167 @@ class TokenDialog(simpledialog.Dialog):
         logger.debug(f"Token entered: {self.result}")
 
 class DropboxFolderBrowser(tk.Toplevel):
-    def __init__(self, parent, title, dropbox_service):
+    """Folder picker that lists Dropbox folders on the app's asyncio loop.
+
+    Unloaded folders show a placeholder child until their listing arrives.
+    Once a folder has been shown, the listings of its first subfolders are
+    prefetched in the background, so expanding them is usually instant.
+    Listings come from the service's shared ``ListingCache``, so they are reused
+    across browser windows and by link generation. They stay in use until
+    "Refresh" invalidates a folder and everything below it.
+    """
+
+    PLACEHOLDER = 'Loading...'
+
+    def __init__(self, parent, title, dropbox_service, bridge: TkAsyncioBridge):
         super().__init__(parent)
         self.title(title)
         self.geometry("800x600")  # Set a larger window size
         self.dropbox_service = dropbox_service
+        self.bridge = bridge
+        self.listing_cache = dropbox_service.listing_cache
         self.result = None
+        self._node_paths = {}  # node id -> (path_lower, path_display)
+        self._path_nodes = {}  # path_lower -> node id
+        self._loading = {}  # path_lower -> Future of the listing in flight
+        self._prefetch_slots = None
+        self._closed = False
 
         self.tree = ttk.Treeview(self)
         self.tree.pack(fill=tk.BOTH, expand=True)
 
         self.tree.heading('#0', text='Dropbox Folder Browser', anchor=tk.W)
         self.tree.bind('<<TreeviewOpen>>', self.on_open)
+        self.bind('<F5>', lambda event: self.refresh())
 
         self.root_node = self.tree.insert('', 'end', text='/', open=True)
-        self.load_folder('', self.root_node)
-
-        ttk.Button(self, text="Select", command=self.select).pack()
-
-    def load_folder(self, path, parent_node):
+        self._node_paths[self.root_node] = ('', '')
+        self._path_nodes[''] = self.root_node
+        self.tree.insert(self.root_node, 'end', text=self.PLACEHOLDER)
+        self.load_folder(self.root_node)
+
+        button_frame = ttk.Frame(self)
+        button_frame.pack()
+        ttk.Button(button_frame, text="Select", command=self.select).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Refresh", command=self.refresh).pack(side=tk.LEFT, padx=5)
+
+    def load_folder(self, node):
+        """Fill ``node`` from the cached listing, or fetch it and fill it when it arrives."""
+        path_lower, _ = self._node_paths[node]
+        listing = self.listing_cache.peek(path_lower)
+        if listing is not None:
+            self._populate(node, self._subfolders(listing))
+        else:
+            self._request_listing(path_lower)
+
+    def _request_listing(self, path_lower, prefetch=False):
+        if path_lower in self._loading:
+            return
+        self._loading[path_lower] = self.bridge.submit_with_callback(
+            self._fetch(path_lower, prefetch), lambda future: self._on_listing(path_lower, future, prefetch))
+
+    async def _fetch(self, path_lower, prefetch):
+        # Runs on the asyncio loop; the blocking SDK call goes to an executor thread.
+        if prefetch:
+            if self._prefetch_slots is None:
+                self._prefetch_slots = asyncio.Semaphore(BROWSER_PREFETCH_CONCURRENCY)
+            async with self._prefetch_slots:
+                return await self._list_subfolders(path_lower)
+        return await self._list_subfolders(path_lower)
+
+    async def _list_subfolders(self, path_lower):
+        return self._subfolders(await self.listing_cache.aget(path_lower))
+
+    @staticmethod
+    def _subfolders(listing):
+        return sorted(listing.folders, key=lambda entry: entry.name.lower())
+
+    def _on_listing(self, path_lower, future, prefetch):
+        self._loading.pop(path_lower, None)
+        if self._closed or future.cancelled():
+            return
+        node = self._path_nodes.get(path_lower)
+        is_open = node is not None and bool(self.tree.item(node, 'open'))
         try:
-            entries = self.dropbox_service.list_files(path).entries
-            entries = sorted(entries, key=lambda entry: entry.name.lower())
-            for entry in entries:
-                if isinstance(entry, FolderMetadata):
-                    node = self.tree.insert(parent_node, 'end', text=entry.name, open=False)
-                    self.tree.insert(node, 'end')  # Add a dummy child to make it expandable
+            folders = future.result()
         except (InvalidTokenError, TokenExpiredError):
-            messagebox.showerror("Error", "Invalid or expired token. Please re-authenticate.")
+            messagebox.showerror("Error", "Invalid or expired token. Please re-authenticate.", parent=self)
             self.destroy()
+            return
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to load folder: {e}")
+            if prefetch and not is_open:
+                # The folder is listed again, with errors shown, if the user opens it.
+                logger.debug(f"Prefetching {path_lower} failed: {str(e)}")
+            else:
+                messagebox.showerror("Error", f"Failed to load folder: {e}", parent=self)
+            return
+        if node is None:
+            return
+        if is_open:
+            self._populate(node, folders)
+        elif not folders:
+            # Known to have no subfolders: drop the placeholder so it is no longer expandable.
+            self.tree.delete(*self.tree.get_children(node))
+
+    def _is_unloaded(self, node):
+        children = self.tree.get_children(node)
+        return len(children) == 1 and children[0] not in self._node_paths
+
+    def _populate(self, node, folders):
+        if not self._is_unloaded(node):
+            return  # Already filled; opening a node again reuses its children.
+        self.tree.delete(*self.tree.get_children(node))
+        for entry in folders:
+            child = self.tree.insert(node, 'end', text=entry.name, open=False)
+            self._node_paths[child] = (entry.path_lower, entry.path_display)
+            self._path_nodes[entry.path_lower] = child
+            listing = self.listing_cache.peek(entry.path_lower)
+            if listing is None or listing.folders:
+                self.tree.insert(child, 'end', text=self.PLACEHOLDER)
+        # Make the next level instant: fetch the subfolders the user can now see.
+        for entry in folders[:BROWSER_PREFETCH_LIMIT]:
+            if self.listing_cache.peek(entry.path_lower) is None:
+                self._request_listing(entry.path_lower, prefetch=True)
 
     def on_open(self, event):
         item = self.tree.focus()
-        if self.tree.parent(item):  # Not root
-            path = self.get_path(item)
-            self.tree.delete(*self.tree.get_children(item))
-            self.load_folder(path, item)
+        if item in self._node_paths and self._is_unloaded(item):
+            self.load_folder(item)
+
+    def refresh(self):
+        """Invalidate the selected folder (or the root) and everything below it, then reload it."""
+        item = self.tree.focus() or self.root_node
+        path_lower, _ = self._node_paths.get(item, ('', ''))
+        self.listing_cache.invalidate(path_lower)
+        for child in self.tree.get_children(item):
+            self._forget(child)
+        self.tree.delete(*self.tree.get_children(item))
+        self.tree.insert(item, 'end', text=self.PLACEHOLDER)
+        self.tree.item(item, open=True)
+        self.load_folder(item)
+
+    def _forget(self, node):
+        for child in self.tree.get_children(node):
+            self._forget(child)
+        path_lower, _ = self._node_paths.pop(node, (None, None))
+        self._path_nodes.pop(path_lower, None)
 
     def get_path(self, item):
-        path_parts = []
-        while item:
-            path_parts.append(self.tree.item(item, 'text'))
-            item = self.tree.parent(item)
-        path = '/'.join(reversed(path_parts))
-        return path if path != '/' else ''
+        return self._node_paths.get(item, ('', ''))[1]
 
     def select(self):
         item = self.tree.focus()
         self.result = self.get_path(item)
         self.destroy()
 
-def get_output_path(custom_path=None):
+    def destroy(self):
+        self._closed = True
+        for future in self._loading.values():
+            future.cancel()
+        self._loading.clear()
+        super().destroy()
+
+def get_output_path(custom_path=None, output_format="txt"):
     # Get the script's directory
     script_dir = Path(__file__).parent.absolute()
     
@@ -99,7 +207,7 @@ def get_output_path(custom_path=None):
     
     # Generate a timestamped filename
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    filename = f"dropbox_{timestamp}.txt"
+    filename = f"dropbox_{timestamp}.{get_writer_class(output_format).extension}"
     
     # If a custom path is provided, use it; otherwise, use the default
     if custom_path:
@@ -108,7 +216,7 @@ def get_output_path(custom_path=None):
         return output_dir / filename
 
 class DropboxApp:
-    def __init__(self, master: tk.Tk, debug_mode: bool = False):
+    def __init__(self, master: tk.Tk, debug_mode: bool = False, bridge: Optional[TkAsyncioBridge] = None):
         self.master = master
         self.master.title(WINDOW_TITLE)
         self.master.geometry("800x200")  # Set default window size
@@ -122,12 +230,23 @@ class DropboxApp:
         self.file_type = tk.StringVar(value="both")
         self.output_file = tk.StringVar()
         self.set_default_output_file()
+        self.output_format.trace_add("write", self.on_output_format_changed)
         self.file_types = ['Audio', 'Video']  # Default to both Audio and Video
         self.audio_var = tk.BooleanVar(value=True)
         self.video_var = tk.BooleanVar(value=True)
+        self.image_var = tk.BooleanVar(value=False)
+        self.document_var = tk.BooleanVar(value=False)
+        self.incremental_var = tk.BooleanVar(value=False)
+        self.resume_var = tk.BooleanVar(value=False)
         self.progress_var = tk.DoubleVar()  # Add this line
         self.status_var = tk.StringVar()
         self.processing = False
+        self.generation = None
+        if bridge is None:
+            bridge = TkAsyncioBridge(master)
+            bridge.start()
+        self.bridge = bridge
+        self.master.protocol("WM_DELETE_WINDOW", self.on_close)
 
         self.create_widgets()
         self.load_preferences()
@@ -145,11 +264,18 @@ class DropboxApp:
         ttk.Entry(main_frame, textvariable=self.output_file, width=50).grid(row=1, column=1, sticky="we")
         ttk.Button(main_frame, text="Browse", command=self.browse_output_file).grid(row=1, column=2, padx=5)
 
+        ttk.Label(main_frame, text="Output Format:").grid(row=2, column=0, sticky="w")
+        ttk.Combobox(main_frame, textvariable=self.output_format, values=OUTPUT_FORMATS, state="readonly", width=10).grid(row=2, column=1, sticky="w")
+
         ttk.Label(main_frame, text="File Types:").grid(row=4, column=0, sticky="w")
         file_types_frame = ttk.Frame(main_frame)
         file_types_frame.grid(row=4, column=1, columnspan=2, sticky="w")
         ttk.Checkbutton(file_types_frame, text="Audio", variable=self.audio_var, command=self.update_file_types).pack(side=tk.LEFT, padx=(0, 10))
-        ttk.Checkbutton(file_types_frame, text="Video", variable=self.video_var, command=self.update_file_types).pack(side=tk.LEFT)
+        ttk.Checkbutton(file_types_frame, text="Video", variable=self.video_var, command=self.update_file_types).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Checkbutton(file_types_frame, text="Image", variable=self.image_var, command=self.update_file_types).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Checkbutton(file_types_frame, text="Document", variable=self.document_var, command=self.update_file_types).pack(side=tk.LEFT)
+        ttk.Checkbutton(file_types_frame, text="Only changes since last run", variable=self.incremental_var).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Checkbutton(file_types_frame, text="Resume interrupted run", variable=self.resume_var).pack(side=tk.LEFT, padx=(10, 0))
 
         self.progress_bar = ttk.Progressbar(main_frame, variable=self.progress_var, maximum=100)
         self.progress_bar.grid(row=3, column=0, columnspan=3, sticky="we", pady=10)
@@ -189,6 +315,7 @@ class DropboxApp:
                     self.selected_folder.set(preferences.get("selected_folder", ""))
                     self.output_format.set(preferences.get("output_format", "txt"))
                     self.output_file.set(preferences.get("output_file", ""))
+                    self.incremental_var.set(preferences.get("incremental", False))
                     self.dropbox_token = preferences.get("dropbox_token", "")
             except json.JSONDecodeError:
                 logger.error("Error loading preferences. Using default values.")
@@ -200,6 +327,7 @@ class DropboxApp:
             "selected_folder": self.selected_folder.get(),
             "output_format": self.output_format.get(),
             "output_file": self.output_file.get(),
+            "incremental": self.incremental_var.get(),
             "dropbox_token": self.dropbox_token
         }
         with open(PREFERENCES_FILE, 'w') as f:
@@ -228,7 +356,8 @@ class DropboxApp:
 
     def browse_folder(self):
         try:
-            folder_browser = DropboxFolderBrowser(self.master, "Select Dropbox Folder", self.app_controller.dropbox_service)
+            folder_browser = DropboxFolderBrowser(self.master, "Select Dropbox Folder", self.app_controller.dropbox_service,
+                                                  self.bridge)
             self.master.wait_window(folder_browser)
             if folder_browser.result:
                 self.selected_folder.set(folder_browser.result)
@@ -238,75 +367,88 @@ class DropboxApp:
             if self.handle_token_error(str(e)):
                 self.browse_folder()  # Retry with new token
 
-    async def generate_links(self, output_path):
-        if not self.dropbox_token:
-            if not self.handle_token_error("No access token set. Please enter a token."):
-                return
-
-        self.app_controller.set_access_token(self.dropbox_token)
-        logger.info(f"Selected folder: {self.selected_folder.get()}")
-        logger.info(f"File types: {self.file_types}")
-
+    async def generate_links(self, output_path, folder, output_format, file_types, incremental, resume):
+        """Runs on the asyncio loop thread; everything touching Tk goes through the bridge."""
+        start_time = time.time()
+        total_files = 0
+        progress = ProgressTracker()
+        # Progress reaches the UI at most PROGRESS_INTERVAL apart, however fast files complete.
+        progress.subscribe(lambda snapshot: self.bridge.call_in_ui(self.show_progress, snapshot))
+        async for _, total_files in self.app_controller.generate_links(
+            folder,
+            output_path,
+            output_format,
+            file_types,
+            incremental=incremental,
+            resume=resume,
+            progress=progress
+        ):
+            pass
+        return total_files, time.time() - start_time, self.app_controller.last_output_file
+
+    def show_progress(self, snapshot):
+        if not self.processing:
+            return
+        if snapshot.discovered > 0:
+            self.progress_var.set((snapshot.processed / snapshot.discovered) * 100)
+            progress_message = f"{format_progress(snapshot)} (Elapsed time: {snapshot.elapsed:.2f}s)"
+        else:
+            progress_message = f"No files to process (Elapsed time: {snapshot.elapsed:.2f}s)"
+        self.status_var.set(progress_message)
+
+    def on_generate_done(self, future, output_path):
+        if future is not self.generation:
+            # Stopped by the user; stop_processing() has already reset the UI.
+            return
+        self.generation = None
         try:
-            start_time = time.time()
-            self.progress_var.set(0)
-            self.progress_bar["value"] = 0
-
-            async for processed_count, total_files in self.app_controller.generate_links(
-                self.selected_folder.get(),
-                output_path,
-                self.output_format.get(),
-                self.file_types
-            ):
-                if not self.processing:
-                    break
-                elapsed_time = time.time() - start_time
-                if total_files > 0:
-                    progress = (processed_count / total_files) * 100
-                    self.progress_var.set(progress)
-                    self.progress_bar["value"] = progress
-                    progress_message = f"Processed {processed_count} of {total_files} files (Elapsed time: {elapsed_time:.2f}s)"
-                else:
-                    progress_message = f"No files to process (Elapsed time: {elapsed_time:.2f}s)"
-                self.status_var.set(progress_message)
-                logger.debug(progress_message)
-                
-                self.master.update_idletasks()
-                await asyncio.sleep(0)
-
-            if self.processing:
-                total_time = time.time() - start_time
-                if total_files > 0:
-                    self.status_var.set(f"Processed {total_files} files successfully in {total_time:.2f} seconds.")
-                else:
-                    self.status_var.set(f"No files were processed. Completed in {total_time:.2f} seconds.")
+            total_files, total_time, written_path = future.result()
+            if total_files > 0:
+                message = f"Processed {total_files} files successfully in {total_time:.2f} seconds."
             else:
-                self.status_var.set("Processing stopped by user.")
+                message = f"No files were processed. Completed in {total_time:.2f} seconds."
+            if written_path and written_path != output_path:
+                # An incremental run keeps the existing output and writes the changes beside it.
+                message += f" Changes written to {Path(written_path).name}."
+            self.status_var.set(message)
         except (TokenExpiredError, InvalidTokenError) as e:
             logger.error(f"Token error: {str(e)}")
             if self.handle_token_error(str(e)):
-                await self.generate_links(output_path)
+                self.start_generate_links(output_path)
+                return
         except Exception as e:
             logger.error(f"Error generating links: {str(e)}")
             messagebox.showerror("Error", f"Failed to generate links: {str(e)}")
-        finally:
-            self.processing = False
-            self.generate_button.config(state=tk.NORMAL)
-            self.stop_button.config(state=tk.DISABLED)
-            self.reset_token_button.config(state=tk.NORMAL)
+        self.processing = False
+        self.generate_button.config(state=tk.NORMAL)
+        self.stop_button.config(state=tk.DISABLED)
+        self.reset_token_button.config(state=tk.NORMAL)
 
     def browse_output_file(self):
         initial_dir = Path(self.output_file.get()).parent
+        extension = get_writer_class(self.output_format.get()).extension
         filename = filedialog.asksaveasfilename(
             initialdir=initial_dir,
             title="Select Output File",
-            filetypes=(("Text files", "*.txt"), ("All files", "*.*"))
+            defaultextension=f".{extension}",
+            filetypes=((f"{extension.upper()} files", f"*.{extension}"), ("All files", "*.*"))
         )
         if filename:
             self.output_file.set(filename)
 
     def set_default_output_file(self):
-        self.output_file.set(str(get_output_path()))
+        self.output_file.set(str(get_output_path(output_format=self.output_format.get())))
+
+    def on_output_format_changed(self, *args):
+        # Keep the output file's extension in step with the selected format.
+        output_file = self.output_file.get()
+        if not output_file:
+            return
+        path = Path(output_file)
+        known_extensions = {f".{get_writer_class(name).extension}" for name in OUTPUT_FORMATS}
+        if path.suffix.lower() in known_extensions:
+            extension = get_writer_class(self.output_format.get()).extension
+            self.output_file.set(str(path.with_suffix(f".{extension}")))
 
     def update_file_types(self):
         self.file_types = []
@@ -314,22 +456,42 @@ class DropboxApp:
             self.file_types.append('Audio')
         if self.video_var.get():
             self.file_types.append('Video')
+        if self.image_var.get():
+            self.file_types.append('Image')
+        if self.document_var.get():
+            self.file_types.append('Document')
         logger.debug(f"Updated file types: {self.file_types}")
 
-    def start_generate_links(self):
+    def start_generate_links(self, output_path=None):
+        if not self.dropbox_token:
+            if not self.handle_token_error("No access token set. Please enter a token."):
+                return
+        self.app_controller.set_access_token(self.dropbox_token)
+        logger.info(f"Selected folder: {self.selected_folder.get()}")
+        logger.info(f"File types: {self.file_types}")
+
         self.processing = True
         self.generate_button.config(state=tk.DISABLED)
         self.stop_button.config(state=tk.NORMAL)
         self.reset_token_button.config(state=tk.DISABLED)
-        output_path = self.output_file.get()
+        self.progress_var.set(0)
+        output_path = output_path or self.output_file.get()
         if not output_path:
-            output_path = str(get_output_path())
+            output_path = str(get_output_path(output_format=self.output_format.get()))
             self.output_file.set(output_path)
-        
-        asyncio.create_task(self.generate_links(output_path))
+
+        # Tk variables are read here, on the Tk thread, and passed to the loop as plain values.
+        coro = self.generate_links(output_path, self.selected_folder.get(), self.output_format.get(),
+                                   list(self.file_types), self.incremental_var.get(), self.resume_var.get())
+        self.generation = self.bridge.submit_with_callback(
+            coro, lambda future: self.on_generate_done(future, output_path))
 
     def stop_processing(self):
         self.processing = False
+        if self.generation is not None:
+            # Cancelling closes the pipeline, so the job journal is synced for a later resume.
+            self.generation.cancel()
+            self.generation = None
         self.generate_button.config(state=tk.NORMAL)
         self.stop_button.config(state=tk.DISABLED)
         self.reset_token_button.config(state=tk.NORMAL)
@@ -350,12 +512,12 @@ class DropboxApp:
         return simpledialog.askstring("Dropbox Access Token", "Please enter your Dropbox access token:", parent=self.master)
 
     def run(self):
-        asyncio.run(self._run_async())
+        self.master.mainloop()
 
-    async def _run_async(self):
-        while True:
-            self.master.update()
-            await asyncio.sleep(0.1)
+    def on_close(self):
+        self.stop_processing()
+        self.bridge.stop()
+        self.master.destroy()
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,149 @@
+import gzip
+import json
+import os
+import time
+import zlib
+from typing import IO, List, Optional, Set, Tuple
+from config import JOURNAL_COMPACT_EVERY, JOURNAL_FSYNC_EVERY, JOURNAL_FSYNC_INTERVAL, JOURNAL_SUFFIX, logger
+
+
+class JobJournal:
+    """Append-only, crash-safe record of the files a job has finished.
+
+    Each completed file adds one JSON line. Lines are handed to the OS as they are
+    written and fsynced in batches (every ``fsync_every`` records or
+    ``fsync_interval`` seconds). The job's output file is synced first, so the
+    journal never claims a file whose link is not on disk yet. A torn last line
+    left by a crash is ignored on load.
+
+    Every ``compact_every`` records, the lines written so far are folded into a
+    gzipped checkpoint next to the journal (``<journal>.gz``, one gzip member per
+    fold) and the journal is truncated, so a long job's journal stays small
+    however many files it covers. Loading compacts checkpoint and journal into a
+    fresh checkpoint whenever the journal holds records, duplicates or damage.
+    """
+
+    def __init__(self, path: str, fsync_every: int = JOURNAL_FSYNC_EVERY,
+                 fsync_interval: float = JOURNAL_FSYNC_INTERVAL, compact_every: int = JOURNAL_COMPACT_EVERY):
+        self.path = path
+        self.checkpoint_path = path + '.gz'
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self._file: Optional[IO[str]] = None
+        self._output: Optional[IO[str]] = None
+        self._unsynced = 0
+        self._unfolded: List[str] = []
+        self._last_sync = time.monotonic()
+
+    @classmethod
+    def for_output(cls, output_file: str) -> 'JobJournal':
+        return cls(str(output_file) + JOURNAL_SUFFIX)
+
+    def _read_checkpoint(self) -> Tuple[Set[str], int, bool]:
+        """Paths in the checkpoint, how many records held them and whether it was read to the end."""
+        completed = set()
+        records = 0
+        if not os.path.exists(self.checkpoint_path):
+            return completed, records, True
+        try:
+            with gzip.open(self.checkpoint_path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    completed.add(json.loads(line)['path'])
+                    records += 1
+        except (OSError, EOFError, zlib.error, ValueError, KeyError, TypeError) as e:
+            # Typically a fold cut short by a crash; its records are still in the journal.
+            logger.warning(f"Journal checkpoint {self.checkpoint_path} is damaged: {str(e)}")
+            return completed, records, False
+        return completed, records, True
+
+    def load(self) -> Set[str]:
+        """Return the paths completed so far, compacting the journal if needed."""
+        completed, records, intact = self._read_checkpoint()
+        lines = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        completed.add(json.loads(line)['path'])
+                    except (ValueError, KeyError, TypeError):
+                        # Typically the last line, torn by a crash mid-write.
+                        continue
+        if lines or not intact or records > len(completed):
+            self.compact(completed)
+        logger.info(f"Journal {self.path}: {len(completed)} files already completed")
+        return completed
+
+    def compact(self, completed: Set[str]) -> None:
+        """Atomically rewrite the checkpoint with exactly one record per completed path and empty the journal."""
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                f.write(''.join(self._line(path) for path in completed).encode('utf-8'))
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+        # A crash before this truncation only leaves duplicates, which the next load drops.
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        logger.debug(f"Compacted journal {self.path} to {len(completed)} records")
+
+    def open(self, output: Optional[IO[str]] = None, resume: bool = False) -> None:
+        """Start recording; without ``resume`` any previous journal is discarded."""
+        self._output = output
+        if not resume and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        self._unfolded = []
+        self._last_sync = time.monotonic()
+
+    @staticmethod
+    def _line(path: str) -> str:
+        return json.dumps({'path': path}) + '\n'
+
+    def record(self, path: str) -> None:
+        self._file.write(self._line(path))
+        self._unfolded.append(path)
+        self._unsynced += 1
+        if len(self._unfolded) >= self.compact_every:
+            self._fold()
+        elif self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def _fold(self) -> None:
+        """Move the records written since the last fold into the checkpoint and truncate the journal."""
+        self.sync()
+        with open(self.checkpoint_path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                f.write(''.join(self._line(path) for path in self._unfolded).encode('utf-8'))
+            raw.flush()
+            os.fsync(raw.fileno())
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        logger.debug("Folded %d journal records into %s", len(self._unfolded), self.checkpoint_path)
+        self._unfolded = []
+
+    def sync(self) -> None:
+        for f in (self._output, self._file):
+            if f is not None and not f.closed:
+                f.flush()
+                os.fsync(f.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self, completed: bool = False) -> None:
+        """Sync and close; a completed job has nothing left to resume, so its journal is removed."""
+        if self._file is None:
+            return
+        self.sync()
+        self._file.close()
+        self._file = None
+        self._output = None
+        if completed:
+            os.remove(self.path)
+            if os.path.exists(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
@@ -0,0 +1,205 @@
+import asyncio
+import posixpath
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+from dropbox.files import FileMetadata
+from async_utils import ordered_map
+from config import LINK_CONCURRENCY, PREFETCH_SHARED_LINKS, logger
+from file_filter import FileFilter
+from file_processor import FileProcessor
+from output_writers import OutputRecord, create_writer
+
+# How files are ordered for link creation; see JobScheduler.
+SCHEDULE_ORDERS = ('path', 'newest', 'oldest')
+
+
+def _contains(root_lower: str, path_lower: str) -> bool:
+    return root_lower == '' or path_lower == root_lower or path_lower.startswith(root_lower + '/')
+
+
+class LinkJob:
+    """One root to export: which files to take from it and where to write their links."""
+    __slots__ = ('root', 'output_file', 'output_format', 'file_filter', 'priority', 'matched', 'written', 'error')
+
+    def __init__(self, root: str, output_file: str, file_filter: FileFilter, output_format: str = 'txt',
+                 priority: int = 0):
+        self.root = '' if root in ('', '/') else root.rstrip('/')
+        self.output_file = output_file
+        self.output_format = output_format
+        self.file_filter = file_filter
+        self.priority = priority  # Files of higher-priority jobs get their links first
+        self.matched = 0
+        self.written = 0
+        self.error: Optional[str] = None  # Why the job's root could not be listed, if it could not
+
+    def contains(self, path_lower: str) -> bool:
+        return _contains(self.root.lower(), path_lower)
+
+
+class _ScheduledFile:
+    __slots__ = ('path', 'folder', 'modified', 'jobs', 'url')
+
+    def __init__(self, path: str, folder: str, modified: float, jobs: int):
+        self.path = path
+        self.folder = folder
+        self.modified = modified
+        self.jobs = jobs  # Bit mask of the jobs whose root and filter match the file
+        self.url: Optional[str] = None
+
+
+class JobScheduler:
+    """Runs many link jobs on one DropboxService under one concurrency budget.
+
+    Roots nested in another job's root are not listed again: each outermost
+    root is listed once and every entry is matched against all jobs it falls
+    under. A file matched by several jobs gets its link resolved once and
+    written to each of their outputs.
+
+    Link creation starts once all roots are listed, so that the whole batch can
+    be ordered: by job ``priority`` first, then by ``order`` - ``'newest'``
+    (most recently modified first, so fresh uploads are linked first),
+    ``'oldest'`` or ``'path'`` (by folder, then name). At most ``concurrency`` links
+    are requested at once across all jobs. That order only decides which links
+    are created first: each job's output is written as soon as all of its links
+    are in, by folder then name, so its folder headers are never interleaved
+    and a batch that stops early leaves unfinished jobs' outputs untouched.
+
+    A job whose root cannot be listed gets its ``error`` set; the other jobs
+    still run.
+
+    Exposes the same counters as ``LinkPipeline``, so a ``ProgressTracker`` can
+    be attached to it.
+    """
+
+    def __init__(self, file_processor: FileProcessor, jobs: List[LinkJob], concurrency: Optional[int] = None,
+                 order: str = 'path'):
+        if order not in SCHEDULE_ORDERS:
+            raise ValueError(f"Unknown schedule order: {order}")
+        self.file_processor = file_processor
+        self.dropbox_service = file_processor.dropbox_service
+        self.jobs = sorted(jobs, key=lambda job: -job.priority)
+        self.concurrency = concurrency or LINK_CONCURRENCY
+        self.order = order
+        self.listed = 0
+        self.discovered = 0
+        self.processed = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.listing_complete = False
+        self._files: Dict[str, _ScheduledFile] = {}
+
+    def _listing_roots(self) -> Dict[str, List[int]]:
+        """Map each outermost root to the indices of the jobs under it."""
+        roots: Dict[str, List[int]] = {}
+        for index, job in sorted(enumerate(self.jobs), key=lambda item: len(item[1].root)):
+            root = job.root.lower()
+            outer = next((listed for listed in roots if _contains(listed, root)), root)
+            roots.setdefault(outer, []).append(index)
+        return roots
+
+    async def _list_root(self, root: str, job_indices: List[int]) -> None:
+        jobs = [(1 << index, self.jobs[index]) for index in job_indices]
+        try:
+            async for entry in self.dropbox_service.iter_files(root, recursive=True):
+                self.listed += 1
+                if not isinstance(entry, FileMetadata):
+                    continue
+                path = entry.path_lower
+                mask = 0
+                for bit, job in jobs:
+                    if job.contains(path) and job.file_filter(entry):
+                        mask |= bit
+                if not mask:
+                    continue
+                scheduled = self._files.get(path)
+                if scheduled is None:
+                    self._files[path] = _ScheduledFile(path, posixpath.dirname(path),
+                                                       entry.server_modified.timestamp(), mask)
+                    self.discovered += 1
+                else:
+                    scheduled.jobs |= mask
+        except Exception as e:
+            logger.error(f"Error listing files in {root or '/'}: {str(e)}")
+            for _, job in jobs:
+                job.error = str(e)
+
+    def _schedule(self) -> List[_ScheduledFile]:
+        files = list(self._files.values())
+        self._files = {}
+        priorities = [job.priority for job in self.jobs]
+
+        def job_priority(scheduled: _ScheduledFile) -> int:
+            # Jobs are sorted by priority, so the lowest set bit is the most urgent job.
+            return priorities[(scheduled.jobs & -scheduled.jobs).bit_length() - 1]
+
+        if self.order == 'newest':
+            files.sort(key=lambda f: (-job_priority(f), -f.modified))
+        elif self.order == 'oldest':
+            files.sort(key=lambda f: (-job_priority(f), f.modified))
+        else:
+            files.sort(key=lambda f: (-job_priority(f), f.folder, f.path))
+        for scheduled in files:
+            matched = bin(scheduled.jobs).count('1')
+            self.duplicates += matched - 1
+            for index, job in enumerate(self.jobs):
+                if scheduled.jobs >> index & 1:
+                    job.matched += 1
+        return files
+
+    def _job_indices(self, mask: int) -> List[int]:
+        return [index for index in range(len(self.jobs)) if mask >> index & 1]
+
+    async def _write_job(self, job: LinkJob, files: List[_ScheduledFile]) -> None:
+        """Write a job's resolved links to its output, by folder, then name."""
+        writer = create_writer(job.output_format, job.output_file)
+        await writer.open()
+        finished = False
+        try:
+            for scheduled in sorted(files, key=lambda f: (f.folder, f.path)):
+                if scheduled.url:
+                    await writer.write(OutputRecord(scheduled.folder, scheduled.path, scheduled.url))
+                    job.written += 1
+            finished = True
+        finally:
+            await writer.close(completed=finished)
+
+    async def _resolved(self, scheduled: _ScheduledFile, job_files: List[List[_ScheduledFile]],
+                        remaining: List[int]) -> None:
+        """Count a resolved file and write the output of every job it completes."""
+        if not scheduled.url:
+            self.errors += 1
+        self.processed += 1
+        for index in self._job_indices(scheduled.jobs):
+            remaining[index] -= 1
+            if not remaining[index]:
+                await self._write_job(self.jobs[index], job_files[index])
+                job_files[index] = []
+
+    async def run(self) -> AsyncGenerator[Tuple[int, int], None]:
+        """List every root, then resolve and write all links, yielding ``(processed, total)``."""
+        roots = self._listing_roots()
+        logger.info(f"Scheduling {len(self.jobs)} jobs over {len(roots)} listings (order: {self.order})")
+        await asyncio.gather(*(self._list_root(root, indices) for root, indices in roots.items()))
+        self.listing_complete = True
+        files = self._schedule()
+        if self.duplicates:
+            logger.info(f"{self.duplicates} files are shared by overlapping jobs and will be linked once")
+        if PREFETCH_SHARED_LINKS and files:
+            await self.file_processor.prefetch_shared_links()
+
+        async def resolve(scheduled: _ScheduledFile) -> Optional[str]:
+            return await self.file_processor.resolve_link(scheduled.path)
+
+        # Each output is opened only once all of its job's links are in, so a batch that fails or is
+        # cancelled leaves the outputs of its unfinished jobs as they were.
+        job_files: List[List[_ScheduledFile]] = [[] for _ in self.jobs]
+        for scheduled in files:
+            for index in self._job_indices(scheduled.jobs):
+                job_files[index].append(scheduled)
+        for index, job in enumerate(self.jobs):
+            if not job_files[index] and job.error is None:
+                await self._write_job(job, [])
+        remaining = [len(files_of_job) for files_of_job in job_files]
+        async for scheduled, url in ordered_map(resolve, files, self.concurrency):
+            scheduled.url = url
+            await self._resolved(scheduled, job_files, remaining)
+            yield self.processed, self.discovered
@@ -0,0 +1,377 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from config import (
+    LINK_CACHE_BACKEND, LINK_CACHE_FILE, LINK_CACHE_TTL, LINK_CACHE_MAX_ENTRIES, LINK_MEMORY_CACHE_SIZE, logger
+)
+
+
+class LinkCache:
+    """Base class for share-link cache backends.
+
+    Backends implement the blocking ``get_rows``/``put_many``/``invalidate``/``clear``
+    primitives; the ``a``-prefixed coroutines run them on a single dedicated worker
+    thread so lookups never block the event loop.
+    """
+
+    def __init__(self, ttl: Optional[float] = LINK_CACHE_TTL):
+        self.ttl = ttl
+        self._executor = None
+
+    def get_many(self, paths: Iterable[str]) -> Dict[str, str]:
+        """Return ``{path_lower: url}`` for every path with a fresh cached link."""
+        return {path: url for path, url, _ in self.get_rows(paths)}
+
+    def get_rows(self, paths: Iterable[str]) -> List[Tuple[str, str, float]]:
+        """Return fresh ``(path_lower, url, created_at)`` rows for the given paths."""
+        raise NotImplementedError
+
+    def put_many(self, links: Dict[str, str]) -> None:
+        raise NotImplementedError
+
+    def invalidate(self, paths: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def get_prefix(self, prefix: str, limit: Optional[int] = None) -> List[Tuple[str, str, float]]:
+        """Return fresh ``(path_lower, url, created_at)`` rows under a folder prefix, newest first."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    async def _run(self, method, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=type(self).__name__)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, method, *args)
+
+    async def aget_many(self, paths: Iterable[str]) -> Dict[str, str]:
+        return await self._run(self.get_many, list(paths))
+
+    async def aget_rows(self, paths: Iterable[str]) -> List[Tuple[str, str, float]]:
+        return await self._run(self.get_rows, list(paths))
+
+    async def aput_many(self, links: Dict[str, str]) -> None:
+        await self._run(self.put_many, dict(links))
+
+    async def ainvalidate(self, paths: Iterable[str]) -> None:
+        await self._run(self.invalidate, list(paths))
+
+    def _cutoff(self) -> float:
+        return time.time() - self.ttl if self.ttl is not None else float('-inf')
+
+    @staticmethod
+    def _prefix_bounds(prefix: str) -> Tuple[str, str]:
+        # '/Music' matches '/music/...' but not '/musicals/...'; '' or '/' matches everything.
+        start = prefix.lower().rstrip('/') + '/'
+        return start, start + '\U0010ffff'
+
+
+class SQLiteLinkCache(LinkCache):
+    """Share-link cache stored in a single indexed SQLite database in WAL mode.
+
+    When ``max_entries`` is set, the oldest links are evicted once the table grows
+    past it; expired links are dropped at the same time.
+    """
+
+    # Stay well below SQLITE_MAX_VARIABLE_NUMBER on older SQLite builds.
+    _CHUNK_SIZE = 500
+
+    def __init__(self, db_path: str = LINK_CACHE_FILE, ttl: Optional[float] = LINK_CACHE_TTL,
+                 max_entries: Optional[int] = LINK_CACHE_MAX_ENTRIES):
+        super().__init__(ttl)
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS share_links ("
+            "path TEXT PRIMARY KEY, url TEXT NOT NULL, created_at REAL NOT NULL) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS share_links_created_at ON share_links (created_at)")
+        # Upper bound on the row count, so eviction does not need a COUNT(*) on every write.
+        self._approx_count = self._conn.execute("SELECT COUNT(*) FROM share_links").fetchone()[0]
+
+    @staticmethod
+    def _chunks(items: List, size: int):
+        for i in range(0, len(items), size):
+            yield items[i:i + size]
+
+    def get_rows(self, paths: Iterable[str]) -> List[Tuple[str, str, float]]:
+        keys = list({path.lower() for path in paths})
+        rows = []
+        cutoff = self._cutoff()
+        with self._lock:
+            for chunk in self._chunks(keys, self._CHUNK_SIZE):
+                placeholders = ','.join('?' * len(chunk))
+                rows.extend(self._conn.execute(
+                    f"SELECT path, url, created_at FROM share_links WHERE path IN ({placeholders}) AND created_at >= ?",
+                    (*chunk, cutoff)
+                ))
+        return rows
+
+    def put_many(self, links: Dict[str, str]) -> None:
+        if not links:
+            return
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO share_links (path, url, created_at) VALUES (?, ?, ?)",
+                    ((path.lower(), url, now) for path, url in links.items())
+                )
+            self._approx_count += len(links)
+            if self.max_entries is not None and self._approx_count > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM share_links WHERE created_at < ?", (self._cutoff(),))
+            count = self._conn.execute("SELECT COUNT(*) FROM share_links").fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM share_links WHERE path IN "
+                    "(SELECT path FROM share_links ORDER BY created_at LIMIT ?)",
+                    (excess,)
+                )
+                count -= excess
+        self._approx_count = count
+        logger.debug("Link cache evicted down to %d entries", count)
+
+    def invalidate(self, paths: Iterable[str]) -> None:
+        keys = list({path.lower() for path in paths})
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("DELETE FROM share_links WHERE path = ?", ((key,) for key in keys))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM share_links")
+            self._approx_count = 0
+
+    def get_prefix(self, prefix: str, limit: Optional[int] = None) -> List[Tuple[str, str, float]]:
+        start, end = self._prefix_bounds(prefix)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT path, url, created_at FROM share_links "
+                "WHERE path >= ? AND path < ? AND created_at >= ? ORDER BY created_at DESC LIMIT ?",
+                (start, end, self._cutoff(), -1 if limit is None else limit)
+            ).fetchall()
+
+    def close(self) -> None:
+        super().close()
+        with self._lock:
+            self._conn.close()
+
+
+class MemoryLinkCache(LinkCache):
+    """Size-bounded in-process LRU of share links.
+
+    Entries carry the time the link was first cached, so the TTL measures the same
+    age here as in the persistent tier it is warmed from.
+    """
+
+    def __init__(self, max_entries: int = LINK_MEMORY_CACHE_SIZE, ttl: Optional[float] = LINK_CACHE_TTL):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Tuple[str, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_rows(self, paths: Iterable[str]) -> List[Tuple[str, str, float]]:
+        rows = []
+        cutoff = self._cutoff()
+        with self._lock:
+            for path in paths:
+                key = path.lower()
+                entry = self._entries.get(key)
+                if entry is None:
+                    self.misses += 1
+                elif entry[1] < cutoff:
+                    del self._entries[key]
+                    self.expirations += 1
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    rows.append((key, entry[0], entry[1]))
+                    self.hits += 1
+        return rows
+
+    def put_many(self, links: Dict[str, str], created_at: Optional[float] = None) -> None:
+        created_at = created_at if created_at is not None else time.time()
+        self.put_rows((path, url, created_at) for path, url in links.items())
+
+    def put_rows(self, rows: Iterable[Tuple[str, str, float]]) -> None:
+        with self._lock:
+            for path, url, created_at in rows:
+                key = path.lower()
+                self._entries[key] = (url, created_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, paths: Iterable[str]) -> None:
+        with self._lock:
+            for path in paths:
+                self._entries.pop(path.lower(), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_prefix(self, prefix: str, limit: Optional[int] = None) -> List[Tuple[str, str, float]]:
+        start, end = self._prefix_bounds(prefix)
+        cutoff = self._cutoff()
+        with self._lock:
+            rows = [(path, url, created_at) for path, (url, created_at) in self._entries.items()
+                    if start <= path < end and created_at >= cutoff]
+        rows.sort(key=lambda row: row[2], reverse=True)
+        return rows[:limit] if limit is not None else rows
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    # Pure in-memory operations are cheap enough to run inline on the event loop.
+    async def aget_rows(self, paths: Iterable[str]) -> List[Tuple[str, str, float]]:
+        return self.get_rows(paths)
+
+    async def aget_many(self, paths: Iterable[str]) -> Dict[str, str]:
+        return self.get_many(paths)
+
+    async def aput_many(self, links: Dict[str, str]) -> None:
+        self.put_many(links)
+
+    async def ainvalidate(self, paths: Iterable[str]) -> None:
+        self.invalidate(paths)
+
+
+class TieredLinkCache(LinkCache):
+    """An LRU memory tier in front of a persistent backend.
+
+    Reads try memory first and promote persistent hits; writes and invalidations
+    go to both tiers, and both share the persistent tier's TTL.
+    """
+
+    def __init__(self, memory: MemoryLinkCache, persistent: LinkCache):
+        super().__init__(persistent.ttl)
+        memory.ttl = persistent.ttl
+        self.memory = memory
+        self.persistent = persistent
+
+    def get_rows(self, paths: Iterable[str]) -> List[Tuple[str, str, float]]:
+        paths = list(paths)
+        rows = self.memory.get_rows(paths)
+        found = {row[0] for row in rows}
+        misses = [path for path in paths if path.lower() not in found]
+        if misses:
+            from_disk = self.persistent.get_rows(misses)
+            # Promoted rows keep their original timestamp so both tiers expire them together.
+            self.memory.put_rows(from_disk)
+            rows.extend(from_disk)
+        return rows
+
+    def put_many(self, links: Dict[str, str]) -> None:
+        self.memory.put_many(links)
+        self.persistent.put_many(links)
+
+    def invalidate(self, paths: Iterable[str]) -> None:
+        paths = list(paths)
+        self.memory.invalidate(paths)
+        self.persistent.invalidate(paths)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self.persistent.clear()
+
+    def get_prefix(self, prefix: str, limit: Optional[int] = None) -> List[Tuple[str, str, float]]:
+        return self.persistent.get_prefix(prefix, limit)
+
+    def warm(self, prefix: str) -> int:
+        """Load the freshest persistent links under ``prefix`` into the memory tier."""
+        rows = self.persistent.get_prefix(prefix, limit=self.memory.max_entries)
+        # Insert oldest first so the newest links end up most recently used.
+        self.memory.put_rows(reversed(rows))
+        logger.debug(f"Warmed link cache with {len(rows)} links under {prefix or '/'}")
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.memory.stats()
+
+    def close(self) -> None:
+        super().close()
+        self.persistent.close()
+
+    async def aget_rows(self, paths: Iterable[str]) -> List[Tuple[str, str, float]]:
+        paths = list(paths)
+        rows = self.memory.get_rows(paths)
+        found = {row[0] for row in rows}
+        misses = [path for path in paths if path.lower() not in found]
+        if misses:
+            from_disk = await self.persistent.aget_rows(misses)
+            self.memory.put_rows(from_disk)
+            rows.extend(from_disk)
+        return rows
+
+    async def aget_many(self, paths: Iterable[str]) -> Dict[str, str]:
+        return {path: url for path, url, _ in await self.aget_rows(paths)}
+
+    async def aput_many(self, links: Dict[str, str]) -> None:
+        self.memory.put_many(links)
+        await self.persistent.aput_many(links)
+
+    async def ainvalidate(self, paths: Iterable[str]) -> None:
+        paths = list(paths)
+        self.memory.invalidate(paths)
+        await self.persistent.ainvalidate(paths)
+
+    async def awarm(self, prefix: str) -> int:
+        return await self._run(self.warm, prefix)
+
+
+LINK_CACHE_BACKENDS = {
+    'sqlite': SQLiteLinkCache,
+}
+
+
+def create_link_cache(backend: str = LINK_CACHE_BACKEND, memory_entries: int = LINK_MEMORY_CACHE_SIZE, **kwargs) -> LinkCache:
+    """Instantiate a registered cache backend by name, fronted by a memory tier unless ``memory_entries`` is 0."""
+    try:
+        cache_class = LINK_CACHE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown link cache backend: {backend}")
+    cache = cache_class(**kwargs)
+    if memory_entries:
+        cache = TieredLinkCache(MemoryLinkCache(memory_entries), cache)
+    return cache
@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+from dropbox.exceptions import ApiError
+from dropbox.files import DeletedMetadata, FileMetadata, FolderMetadata
+from config import LISTING_CACHE_MAX_FOLDERS, LISTING_CACHE_REVALIDATE_AFTER, logger
+
+
+class ListedFile:
+    """Compact stand-in for ``FileMetadata``, holding only what filtering and linking read."""
+    __slots__ = ('name', 'path_lower', 'path_display', 'size', 'server_modified')
+
+    def __init__(self, name: str, path_lower: str, path_display: str, size: int, server_modified):
+        self.name = name
+        self.path_lower = path_lower
+        self.path_display = path_display
+        self.size = size
+        self.server_modified = server_modified
+
+    @classmethod
+    def from_metadata(cls, entry: FileMetadata) -> 'ListedFile':
+        return cls(entry.name, entry.path_lower, entry.path_display, entry.size, entry.server_modified)
+
+
+class ListedFolder:
+    """Compact stand-in for ``FolderMetadata``."""
+    __slots__ = ('name', 'path_lower', 'path_display')
+
+    def __init__(self, name: str, path_lower: str, path_display: str):
+        self.name = name
+        self.path_lower = path_lower
+        self.path_display = path_display
+
+    @classmethod
+    def from_metadata(cls, entry: FolderMetadata) -> 'ListedFolder':
+        return cls(entry.name, entry.path_lower, entry.path_display)
+
+
+class FolderListing:
+    """The direct children of one folder and the list_folder cursor the listing ended on.
+
+    Listings are never modified once built; applying changes returns a new one,
+    so a listing can be handed to other threads without copying.
+    """
+    __slots__ = ('path', 'cursor', '_files', '_folders', 'validated_at')
+
+    def __init__(self, path: str, cursor: str, files: Dict[str, ListedFile],
+                 folders: Dict[str, ListedFolder], validated_at: float):
+        self.path = path
+        self.cursor = cursor
+        self._files = files
+        self._folders = folders
+        self.validated_at = validated_at
+
+    @property
+    def files(self) -> List[ListedFile]:
+        return list(self._files.values())
+
+    @property
+    def folders(self) -> List[ListedFolder]:
+        return list(self._folders.values())
+
+    @classmethod
+    def from_entries(cls, path: str, entries: Iterable, cursor: str) -> 'FolderListing':
+        return cls(path, cursor, {}, {}, time.monotonic()).apply(entries, cursor)
+
+    def apply(self, entries: Iterable, cursor: str) -> 'FolderListing':
+        """Return this listing with ``entries`` (a list_folder/continue delta) applied."""
+        files = dict(self._files)
+        folders = dict(self._folders)
+        for entry in entries:
+            if isinstance(entry, FileMetadata):
+                folders.pop(entry.path_lower, None)
+                files[entry.path_lower] = ListedFile.from_metadata(entry)
+            elif isinstance(entry, FolderMetadata):
+                files.pop(entry.path_lower, None)
+                folders[entry.path_lower] = ListedFolder.from_metadata(entry)
+            elif isinstance(entry, DeletedMetadata):
+                files.pop(entry.path_lower, None)
+                folders.pop(entry.path_lower, None)
+        return FolderListing(self.path, cursor, files, folders, time.monotonic())
+
+
+class ListingCache:
+    """Non-recursive folder listings shared by the folder browser and the collector.
+
+    Listings are keyed by lowercased path and keep the cursor they ended on. A
+    listing younger than ``revalidate_after`` seconds is returned as is. An older
+    one is revalidated with ``files_list_folder_continue``, which costs a single
+    call and comes back empty when nothing in the folder changed; any changes are
+    applied to the cached listing. Only an expired cursor forces a full re-list.
+    At most ``max_folders`` listings are kept, least recently used first out.
+    """
+
+    def __init__(self, dropbox_service, revalidate_after: float = LISTING_CACHE_REVALIDATE_AFTER,
+                 max_folders: int = LISTING_CACHE_MAX_FOLDERS):
+        self.dropbox_service = dropbox_service
+        self.revalidate_after = revalidate_after
+        self.max_folders = max_folders
+        self._listings: 'OrderedDict[str, FolderListing]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.full_listings = 0
+
+    def peek(self, path: str) -> Optional[FolderListing]:
+        """The cached listing of ``path`` without any API call, fresh or not."""
+        with self._lock:
+            return self._listings.get(path.lower())
+
+    def get(self, path: str) -> FolderListing:
+        """Return the listing of ``path``, revalidating or fetching it as needed. Blocks on the network."""
+        key = path.lower()
+        with self._lock:
+            listing = self._listings.get(key)
+            if listing is not None:
+                self._listings.move_to_end(key)
+                if time.monotonic() - listing.validated_at < self.revalidate_after:
+                    self.hits += 1
+                    return listing
+        if listing is not None:
+            try:
+                listing = self._revalidate(listing)
+            except ApiError as e:
+                if not self.dropbox_service.is_cursor_reset(e):
+                    raise
+                logger.debug("Cursor for %s expired; listing it again", path)
+                listing = self._fetch(key)
+        else:
+            listing = self._fetch(key)
+        self._store(key, listing)
+        return listing
+
+    async def aget(self, path: str, executor=None) -> FolderListing:
+        return await asyncio.get_running_loop().run_in_executor(executor, self.get, path)
+
+    def _fetch(self, path: str) -> FolderListing:
+        entries = []
+        page = None
+        for page in self.dropbox_service.iter_pages(path):
+            entries.extend(page.entries)
+        self.full_listings += 1
+        return FolderListing.from_entries(path, entries, page.cursor)
+
+    def _revalidate(self, listing: FolderListing) -> FolderListing:
+        changes = []
+        page = None
+        for page in self.dropbox_service.iter_pages(listing.path, cursor=listing.cursor):
+            changes.extend(page.entries)
+        self.revalidations += 1
+        if changes:
+            logger.debug("%d changes in %s since it was listed", len(changes), listing.path or '/')
+            # Cached listings of deleted or re-created subfolders are stale.
+            for entry in changes:
+                if not isinstance(entry, FileMetadata):
+                    self.invalidate(entry.path_lower)
+        return listing.apply(changes, page.cursor)
+
+    def _store(self, key: str, listing: FolderListing) -> None:
+        with self._lock:
+            self._listings[key] = listing
+            self._listings.move_to_end(key)
+            while len(self._listings) > self.max_folders:
+                self._listings.popitem(last=False)
+
+    def invalidate(self, path: str) -> None:
+        """Drop the listing of ``path`` and of every folder below it."""
+        key = path.lower()
+        with self._lock:
+            for cached in list(self._listings):
+                if key == '' or cached == key or cached.startswith(key + '/'):
+                    del self._listings[cached]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._listings.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'folders': len(self._listings), 'hits': self.hits,
+                'revalidations': self.revalidations, 'full_listings': self.full_listings}
@@ -1,51 +1,48 @@
-import importlib
+import importlib.util
 import subprocess
 import sys
+import tkinter as tk
+from tkinter import messagebox
+from config import logger
+
+# Import name -> pip package name
+REQUIRED_PACKAGES = {'dropbox': 'dropbox', 'dotenv': 'python-dotenv'}
 
 def install_package(package):
     subprocess.check_call([sys.executable, "-m", "pip", "install", package])
 
-required_packages = ['aiofiles', 'dropbox', 'asyncio']
+def install_missing_packages() -> None:
+    for module, package in REQUIRED_PACKAGES.items():
+        if importlib.util.find_spec(module) is None:
+            print(f"{package} not found. Installing...")
+            install_package(package)
 
-for package in required_packages:
+def load_gui():
+    # Packages are only checked when the import actually fails, not on every launch.
     try:
-        importlib.import_module(package)
+        from gui import DropboxApp
     except ImportError:
-        print(f"{package} not found. Installing...")
-        install_package(package)
-
-import tkinter as tk
-import asyncio
-import sys
-import logging
-from tkinter import messagebox
-from gui import DropboxApp
-from config import logger
+        install_missing_packages()
+        importlib.invalidate_caches()
+        from gui import DropboxApp
+    return DropboxApp
 
-async def run_app(root: tk.Tk, app: DropboxApp) -> None:
-    try:
-        while True:
-            root.update()
-            await asyncio.sleep(0.01)  # Smaller delay for more responsive UI
-    except tk.TclError as e:
-        if "application has been destroyed" not in str(e):
-            logger.error(f"Unexpected TclError: {e}", exc_info=True)
-            raise
-
-async def main() -> None:
+def main() -> None:
     root = tk.Tk()
     root.title("Dropbox Media Links Generator")
-    
+
     debug_mode = "--debug" in sys.argv
-    
+
+    DropboxApp = load_gui()
     app = DropboxApp(root, debug_mode=debug_mode)
-    await run_app(root, app)
+    # Blocks in Tk's event loop; async work runs on the app's background asyncio loop.
+    app.run()
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        main()
     except Exception as e:
         logger.critical(f"Unhandled exception in main loop: {str(e)}", exc_info=True)
         messagebox.showerror("Critical Error", f"A critical error occurred: {str(e)}\n\nThe application will now close.")
     finally:
-        sys.exit(0)
\ No newline at end of file
+        sys.exit(0)
@@ -0,0 +1,248 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+from urllib.parse import urlparse
+from dropbox.exceptions import ApiError, AuthError, InternalServerError, RateLimitError
+from config import API_LATENCY_BUCKETS, logger
+
+OUTCOMES = ('ok', 'rate_limited', 'server_error', 'api_error', 'auth_error', 'error')
+
+
+class EndpointStats:
+    """Counters and a latency histogram for one API endpoint."""
+    __slots__ = ('calls', 'outcomes', 'retries', 'bucket_counts', 'latency_sum', 'latency_min', 'latency_max',
+                 'throttle_wait', 'bytes_sent', 'bytes_received')
+
+    def __init__(self, bucket_count: int):
+        self.calls = 0
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+        self.retries = 0
+        self.bucket_counts = [0] * (bucket_count + 1)  # The last bucket is +Inf
+        self.latency_sum = 0.0
+        self.latency_min: Optional[float] = None
+        self.latency_max = 0.0
+        self.throttle_wait = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+
+def classify(error: Optional[BaseException]) -> str:
+    if error is None:
+        return 'ok'
+    if isinstance(error, RateLimitError):
+        return 'rate_limited'
+    if isinstance(error, InternalServerError):
+        return 'server_error'
+    if isinstance(error, AuthError):
+        return 'auth_error'
+    if isinstance(error, ApiError):
+        return 'api_error'
+    return 'error'
+
+
+def endpoint_of(method) -> str:
+    """``files_list_folder`` for both ``dbx.files_list_folder`` and the /2/files/list_folder route."""
+    return getattr(method, '__name__', None) or str(method)
+
+
+class ApiMetrics:
+    """Per-endpoint call counts, outcomes, retries, latency histograms and bytes.
+
+    ``DropboxService`` reports every SDK call attempt through ``call``, which
+    times the call in the thread that makes it, so executor queueing is not
+    counted as API latency. Time spent waiting for the rate limiter is recorded
+    separately as throttle wait. Bytes come from a ``requests`` response hook on
+    the SDK's session and are only available with the live backend.
+    Thread-safe; ``snapshot`` returns plain data that can be serialized as is.
+    """
+
+    def __init__(self, buckets: Sequence[float] = API_LATENCY_BUCKETS):
+        self.buckets = sorted(buckets)
+        self._endpoints: Dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def _stats(self, endpoint: str) -> EndpointStats:
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = EndpointStats(len(self.buckets))
+        return stats
+
+    def call(self, attempt: int, method, *args, **kwargs):
+        """Invoke ``method`` and record its latency and outcome; exceptions propagate."""
+        started = time.perf_counter()
+        error = None
+        try:
+            return method(*args, **kwargs)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.observe(endpoint_of(method), time.perf_counter() - started, classify(error), attempt > 0)
+
+    def observe(self, endpoint: str, seconds: float, outcome: str = 'ok', retry: bool = False) -> None:
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+        with self._lock:
+            stats = self._stats(endpoint)
+            stats.calls += 1
+            stats.outcomes[outcome] += 1
+            stats.retries += retry
+            stats.bucket_counts[index] += 1
+            stats.latency_sum += seconds
+            stats.latency_min = seconds if stats.latency_min is None else min(stats.latency_min, seconds)
+            stats.latency_max = max(stats.latency_max, seconds)
+
+    def record_throttle_wait(self, endpoint: str, seconds: float) -> None:
+        if seconds > 0:
+            with self._lock:
+                self._stats(endpoint).throttle_wait += seconds
+
+    def response_hook(self, response, *args, **kwargs):
+        """``requests`` response hook counting bytes per endpoint."""
+        # /2/files/list_folder/continue -> files_list_folder_continue
+        route = urlparse(response.url).path.strip('/').split('/', 1)[-1].replace('/', '_')
+        request_body = response.request.body if response.request is not None else None
+        received = response.headers.get('Content-Length')
+        with self._lock:
+            stats = self._stats(route)
+            stats.bytes_sent += len(request_body or b'')
+            stats.bytes_received += int(received) if received else len(response.content or b'')
+        return response
+
+    def merge(self, endpoints: Dict) -> None:
+        """Add the ``endpoints`` of another instance's ``snapshot``, e.g. one taken in a worker process;
+        both must use the same latency buckets."""
+        with self._lock:
+            for endpoint, other in endpoints.items():
+                stats = self._stats(endpoint)
+                stats.calls += other['calls']
+                for outcome, count in other['outcomes'].items():
+                    stats.outcomes[outcome] += count
+                stats.retries += other['retries']
+                for i, count in enumerate(other['latency']['buckets'].values()):
+                    stats.bucket_counts[i] += count
+                stats.latency_sum += other['latency']['sum']
+                other_min = other['latency'].get('min')
+                if other_min is not None:
+                    stats.latency_min = other_min if stats.latency_min is None else min(stats.latency_min, other_min)
+                stats.latency_max = max(stats.latency_max, other['latency']['max'])
+                stats.throttle_wait += other['throttle_wait_seconds']
+                stats.bytes_sent += other['bytes_sent']
+                stats.bytes_received += other['bytes_received']
+
+    def reset(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
+            self.started = time.time()
+
+    def _quantile(self, stats: EndpointStats, q: float) -> Optional[float]:
+        """Estimate the q-quantile by linear interpolation inside the bucket holding the q-th call.
+
+        Calls are assumed to be spread evenly over their bucket, as in Prometheus'
+        ``histogram_quantile``; the overflow bucket ends at the largest latency
+        seen. The estimate is kept within the observed min and max.
+        """
+        if not stats.calls:
+            return None
+        rank = q * stats.calls
+        seen = 0
+        for i, count in enumerate(stats.bucket_counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else max(stats.latency_max, lower)
+                estimate = lower + (upper - lower) * (rank - seen) / count
+                return min(max(estimate, stats.latency_min), stats.latency_max)
+            seen += count
+        return stats.latency_max
+
+    def snapshot(self) -> Dict:
+        """Current metrics as plain dicts, keyed by endpoint."""
+        with self._lock:
+            endpoints = {}
+            for endpoint, stats in sorted(self._endpoints.items()):
+                endpoints[endpoint] = {
+                    'calls': stats.calls,
+                    'outcomes': {outcome: count for outcome, count in stats.outcomes.items() if count},
+                    'retries': stats.retries,
+                    'latency': {
+                        'sum': stats.latency_sum,
+                        'mean': stats.latency_sum / stats.calls if stats.calls else None,
+                        'min': stats.latency_min,
+                        'max': stats.latency_max,
+                        'p50': self._quantile(stats, 0.5),
+                        'p95': self._quantile(stats, 0.95),
+                        'p99': self._quantile(stats, 0.99),
+                        'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], stats.bucket_counts)),
+                    },
+                    'throttle_wait_seconds': stats.throttle_wait,
+                    'bytes_sent': stats.bytes_sent,
+                    'bytes_received': stats.bytes_received,
+                }
+            return {'started': self.started, 'elapsed': time.time() - self.started, 'endpoints': endpoints}
+
+    def to_prometheus(self) -> str:
+        snapshot = self.snapshot()['endpoints']
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help_text: str) -> None:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        family('dropbox_api_calls_total', 'counter', 'API call attempts by endpoint and outcome.')
+        for endpoint, stats in snapshot.items():
+            for outcome, count in stats['outcomes'].items():
+                lines.append(f'dropbox_api_calls_total{{endpoint="{endpoint}",outcome="{outcome}"}} {count}')
+        family('dropbox_api_retries_total', 'counter', 'API call attempts that were retries.')
+        for endpoint, stats in snapshot.items():
+            lines.append(f'dropbox_api_retries_total{{endpoint="{endpoint}"}} {stats["retries"]}')
+        family('dropbox_api_latency_seconds', 'histogram', 'API call latency.')
+        for endpoint, stats in snapshot.items():
+            cumulative = 0
+            for bound, count in stats['latency']['buckets'].items():
+                cumulative += count
+                lines.append(f'dropbox_api_latency_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+            lines.append(f'dropbox_api_latency_seconds_sum{{endpoint="{endpoint}"}} {stats["latency"]["sum"]}')
+            lines.append(f'dropbox_api_latency_seconds_count{{endpoint="{endpoint}"}} {stats["calls"]}')
+        family('dropbox_api_throttle_wait_seconds_total', 'counter', 'Time spent waiting for the client rate limiter.')
+        for endpoint, stats in snapshot.items():
+            lines.append(f'dropbox_api_throttle_wait_seconds_total{{endpoint="{endpoint}"}} '
+                         f'{stats["throttle_wait_seconds"]}')
+        for direction in ('sent', 'received'):
+            family(f'dropbox_api_bytes_{direction}_total', 'counter', f'HTTP body bytes {direction}.')
+            for endpoint, stats in snapshot.items():
+                lines.append(f'dropbox_api_bytes_{direction}_total{{endpoint="{endpoint}"}} '
+                             f'{stats[f"bytes_{direction}"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str) -> None:
+        """Dump to ``path``: Prometheus text format for ``.prom`` files, JSON otherwise."""
+        if path.endswith('.prom'):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.snapshot(), indent=2)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        logger.debug(f"API metrics written to {path}")
+
+    def summary(self) -> str:
+        parts = []
+        for endpoint, stats in self.snapshot()['endpoints'].items():
+            part = f"{endpoint} {stats['calls']} calls"
+            if stats['latency']['p50'] is not None:
+                part += f" (p50 {stats['latency']['p50'] * 1000:.0f}ms, p95 {stats['latency']['p95'] * 1000:.0f}ms)"
+            failures = stats['calls'] - stats['outcomes'].get('ok', 0)
+            if failures:
+                part += f", {failures} failed"
+            parts.append(part)
+        return '; '.join(parts) or 'no API calls'
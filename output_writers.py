@@ -0,0 +1,276 @@
+import asyncio
+import csv
+import html
+import io
+import json
+import os
+from typing import Callable, Dict, IO, List, Optional, Type
+from config import OUTPUT_BUFFER_SIZE, logger
+
+
+class OutputRecord:
+    """One resolved link, as handed to an output writer."""
+    __slots__ = ('folder', 'path', 'url')
+
+    def __init__(self, folder: str, path: str, url: str):
+        self.folder = folder
+        self.path = path
+        self.url = url
+
+    @property
+    def name(self) -> str:
+        return self.path.rsplit('/', 1)[-1]
+
+    def as_dict(self) -> Dict[str, str]:
+        return {'folder': self.folder, 'path': self.path, 'name': self.name, 'url': self.url}
+
+
+def simplify_path(path: str) -> str:
+    # Simplify the path to show only the last three levels
+    return '/'.join(path.split('/')[-3:])
+
+
+class OutputWriter:
+    """Streams records to an output file in one format.
+
+    Subclasses only turn records into text (``format_header``, ``format_folder``,
+    ``format_record``, ``format_deleted``, ``format_footer``). The base class
+    buffers that text and writes it in chunks of about ``buffer_size`` bytes from
+    an executor thread, so link generation never waits on the disk. The next
+    chunk only waits if the previous write has not finished yet. If a journal is
+    attached, a record's path is journaled in the same thread right after the
+    chunk holding it has been written, so the journal never runs ahead of the
+    output.
+    """
+
+    extension = 'txt'
+
+    def __init__(self, path: str, append: bool = False, buffer_size: int = OUTPUT_BUFFER_SIZE):
+        self.path = str(path)
+        self.append = append
+        self.buffer_size = buffer_size
+        self.file: Optional[IO[str]] = None
+        self.journal = None
+        self.records = 0
+        self._chunks: List[str] = []
+        self._journal_paths: List[str] = []
+        self._buffered = 0
+        self._flushing: Optional[asyncio.Future] = None
+        self._current_folder = None
+
+    async def open(self, journal=None) -> None:
+        self.journal = journal
+        loop = asyncio.get_running_loop()
+        self.file = await loop.run_in_executor(None, self._open_file)
+        if journal is not None:
+            journal.open(self.file, resume=self.append)
+
+    def _open_file(self) -> IO[str]:
+        existing = self.append and os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        f = open(self.path, 'a' if self.append else 'w', encoding='utf-8')
+        if not existing:
+            f.write(self.format_header())
+        return f
+
+    def format_header(self) -> str:
+        return ''
+
+    def format_folder(self, folder: str) -> str:
+        simplified_folder_path = simplify_path(folder)
+        return f"\n{simplified_folder_path}:\n" + "=" * len(simplified_folder_path) + "\n\n"
+
+    def format_record(self, record: OutputRecord) -> str:
+        raise NotImplementedError
+
+    def format_deleted(self, paths: List[str]) -> str:
+        return "\nDeleted:\n========\n\n" + "".join(f"{path}\n" for path in paths)
+
+    def format_footer(self) -> str:
+        return ''
+
+    async def write(self, record: OutputRecord) -> None:
+        if record.folder != self._current_folder:
+            self._current_folder = record.folder
+            self._buffer(self.format_folder(record.folder))
+        self._buffer(self.format_record(record))
+        self._journal_paths.append(record.path)
+        self.records += 1
+        if self._buffered >= self.buffer_size:
+            await self._start_flush()
+
+    async def write_deleted(self, paths: List[str]) -> None:
+        if paths:
+            self._buffer(self.format_deleted(paths))
+
+    def _buffer(self, text: str) -> None:
+        if text:
+            self._chunks.append(text)
+            self._buffered += len(text)
+
+    async def _start_flush(self) -> None:
+        # At most one write in flight; waiting for it here is the only backpressure.
+        if self._flushing is not None:
+            await self._flushing
+        chunk, paths = ''.join(self._chunks), self._journal_paths
+        self._chunks, self._journal_paths, self._buffered = [], [], 0
+        self._flushing = asyncio.get_running_loop().run_in_executor(None, self._write_chunk, chunk, paths)
+
+    def _write_chunk(self, chunk: str, paths: List[str]) -> None:
+        self.file.write(chunk)
+        if self.journal is not None:
+            for path in paths:
+                self.journal.record(path)
+
+    async def flush(self) -> None:
+        """Write out everything buffered so far and wait for it."""
+        await self._start_flush()
+        await self._flushing
+        self._flushing = None
+
+    async def close(self, completed: bool = True) -> None:
+        """Flush and close; the footer is only written once the output is complete."""
+        if self.file is None:
+            return
+        try:
+            if completed:
+                self._buffer(self.format_footer())
+            await self.flush()
+        finally:
+            # Even when cancelled, let a write already in flight finish before closing under it.
+            if self._flushing is not None and not self._flushing.done():
+                await asyncio.wait([self._flushing])
+            self._flushing = None
+            f, self.file = self.file, None
+            await asyncio.get_running_loop().run_in_executor(None, f.close)
+
+
+class TextWriter(OutputWriter):
+    def format_record(self, record: OutputRecord) -> str:
+        return f'Path: {simplify_path(record.path)}\n{record.url}\n\n'
+
+
+class MarkdownWriter(OutputWriter):
+    extension = 'md'
+
+    def format_record(self, record: OutputRecord) -> str:
+        return f'Path: {simplify_path(record.path)}\n[{record.name}]({record.url})\n\n'
+
+
+class HtmlWriter(OutputWriter):
+    extension = 'html'
+
+    def format_record(self, record: OutputRecord) -> str:
+        return (f'<p>Path: {html.escape(simplify_path(record.path))}<br>'
+                f'<a href="{html.escape(record.url)}">{html.escape(record.name)}</a></p>\n')
+
+
+class CsvWriter(OutputWriter):
+    extension = 'csv'
+    fields = ['folder', 'path', 'name', 'url', 'status']
+
+    def _row(self, *values) -> str:
+        out = io.StringIO()
+        csv.writer(out, lineterminator='\n').writerow(values)
+        return out.getvalue()
+
+    def format_header(self) -> str:
+        return self._row(*self.fields)
+
+    def format_folder(self, folder: str) -> str:
+        return ''
+
+    def format_record(self, record: OutputRecord) -> str:
+        return self._row(record.folder, record.path, record.name, record.url, 'linked')
+
+    def format_deleted(self, paths: List[str]) -> str:
+        return ''.join(self._row(path.rsplit('/', 1)[0], path, path.rsplit('/', 1)[-1], '', 'deleted')
+                       for path in paths)
+
+
+class JsonLinesWriter(OutputWriter):
+    extension = 'jsonl'
+
+    def format_folder(self, folder: str) -> str:
+        return ''
+
+    def format_record(self, record: OutputRecord) -> str:
+        return json.dumps(record.as_dict()) + '\n'
+
+    def format_deleted(self, paths: List[str]) -> str:
+        return ''.join(json.dumps({'path': path, 'deleted': True}) + '\n' for path in paths)
+
+
+class JsonWriter(OutputWriter):
+    """A single JSON array; resuming reopens the array left by the interrupted run."""
+    extension = 'json'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._empty = True
+
+    def _open_file(self) -> IO[str]:
+        if self.append and os.path.exists(self.path):
+            with open(self.path, 'r+', encoding='utf-8') as f:
+                content = f.read().rstrip()
+                # Drop the closing bracket of a finished array, if there is one.
+                if content.endswith(']'):
+                    content = content[:-1].rstrip()
+                f.seek(0)
+                f.write(content)
+                f.truncate()
+            if content:
+                self._empty = content == '['
+                return open(self.path, 'a', encoding='utf-8')
+        self.append = False
+        return super()._open_file()
+
+    def format_header(self) -> str:
+        return '['
+
+    def format_folder(self, folder: str) -> str:
+        return ''
+
+    def _item(self, item: Dict) -> str:
+        separator = '\n' if self._empty else ',\n'
+        self._empty = False
+        return separator + json.dumps(item)
+
+    def format_record(self, record: OutputRecord) -> str:
+        return self._item(record.as_dict())
+
+    def format_deleted(self, paths: List[str]) -> str:
+        return ''.join(self._item({'path': path, 'deleted': True}) for path in paths)
+
+    def format_footer(self) -> str:
+        return '\n]\n'
+
+
+OUTPUT_WRITERS: Dict[str, Type[OutputWriter]] = {}
+OUTPUT_FORMAT_ALIASES = {'md': 'markdown', 'text': 'txt', 'htm': 'html', 'ndjson': 'jsonl'}
+
+
+def register_writer(name: str) -> Callable[[Type[OutputWriter]], Type[OutputWriter]]:
+    """Class decorator adding a writer to the registry, e.g. for third-party formats."""
+    def decorator(writer_class: Type[OutputWriter]) -> Type[OutputWriter]:
+        if name in OUTPUT_WRITERS:
+            logger.warning(f"Replacing output writer for format '{name}'")
+        OUTPUT_WRITERS[name] = writer_class
+        return writer_class
+    return decorator
+
+
+for _name, _writer in [('txt', TextWriter), ('csv', CsvWriter), ('markdown', MarkdownWriter),
+                       ('html', HtmlWriter), ('json', JsonWriter), ('jsonl', JsonLinesWriter)]:
+    register_writer(_name)(_writer)
+
+
+def get_writer_class(output_format: str) -> Type[OutputWriter]:
+    name = OUTPUT_FORMAT_ALIASES.get(output_format, output_format)
+    try:
+        return OUTPUT_WRITERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown output format: {output_format}")
+
+
+def create_writer(output_format: str, path: str, append: bool = False, **kwargs) -> OutputWriter:
+    return get_writer_class(output_format)(path, append=append, **kwargs)
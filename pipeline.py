@@ -0,0 +1,269 @@
+import asyncio
+import os
+import posixpath
+from datetime import datetime
+from typing import AsyncGenerator, List, Optional, Tuple
+from dropbox.exceptions import ApiError
+from dropbox.files import DeletedMetadata, FileMetadata
+from async_utils import ordered_map
+from config import LINK_CONCURRENCY, PIPELINE_QUEUE_SIZE, PREFETCH_MIN_DELTA_FILES, PREFETCH_SHARED_LINKS, logger
+from cursor_store import CursorStore
+from dropbox_service import DropboxService
+from file_filter import FileFilter
+from file_processor import FileProcessor
+from job_journal import JobJournal
+from listing_cache import ListedFile
+from output_writers import OutputRecord, create_writer
+
+# Marks the end of a stage's output.
+_DONE = object()
+
+
+def delta_path(output_file: str) -> str:
+    """Where a delta run writes when ``output_file`` already holds an earlier export."""
+    base, extension = os.path.splitext(output_file)
+    return f"{base}.delta-{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}{extension}"
+
+
+class LinkPipeline:
+    """Streams a folder through lister -> filter -> resolver -> writer stages.
+
+    The stages run concurrently and are joined by bounded queues, so the first
+    links are written while listing is still in progress and a slow stage applies
+    backpressure upstream instead of letting entries pile up in memory.
+
+    In incremental mode the lister resumes from the cursor stored by the previous
+    run of the same root, so only added, changed and deleted entries flow through.
+    If the output file already exists, the delta goes to a separate file next
+    to it (see ``delta_path``), so the earlier export is never truncated, even
+    with ``resume``; ``output_file`` is where the run actually wrote.
+
+    A full run that is not starting an incremental chain takes folders the
+    folder browser has already listed from the ``ListingCache``: fresh cached
+    folders are served from memory, stale ones are revalidated with one
+    list_folder/continue call each, and only the subtrees below them that are
+    not cached are listed, recursively. Such a run stores no cursor, since its
+    entries do not all come from one listing.
+
+    With ``resume`` the run continues an interrupted job: files recorded in the
+    job journal are skipped and new links are appended to the existing output.
+    """
+
+    def __init__(self, file_processor: FileProcessor, concurrency: Optional[int] = None,
+                 queue_size: int = PIPELINE_QUEUE_SIZE, cursor_store: Optional[CursorStore] = None):
+        self.file_processor = file_processor
+        self.cursor_store = cursor_store or CursorStore()
+        self.dropbox_service = file_processor.dropbox_service
+        self.concurrency = concurrency or LINK_CONCURRENCY
+        self.queue_size = queue_size
+        self.listed = 0
+        self.discovered = 0
+        self.processed = 0
+        self.listing_complete = False
+        self.is_delta = False
+        self.cursor = None
+        self.deleted_paths = []
+        self.skipped = 0
+        self.errors = 0
+        self.output_file = None
+        self._completed = set()
+        self._delta_sized = None
+        # The resolver waits for the prefetch decision, so it must come before the filter fills its queue.
+        self._prefetch_threshold = min(PREFETCH_MIN_DELTA_FILES, queue_size) if queue_size > 0 else PREFETCH_MIN_DELTA_FILES
+
+    async def run(self, folder_path: str, output_file: str, output_format: str,
+                  file_types: List[str], incremental: bool = False, resume: bool = False,
+                  file_filter: Optional[FileFilter] = None) -> AsyncGenerator[Tuple[int, int], None]:
+        """Generate links for ``folder_path``, yielding ``(processed, discovered so far)``."""
+        file_filter = file_filter or self.file_processor.build_filter(file_types)
+        start_cursor = self.cursor_store.get(folder_path, file_types, file_filter.fingerprint) if incremental else None
+        if incremental and start_cursor is None:
+            logger.info(f"No stored cursor for {folder_path} with these filters; running a full listing")
+        self.is_delta = start_cursor is not None
+        if self.is_delta and os.path.exists(output_file) and os.path.getsize(output_file) > 0:
+            # The existing file is the earlier export, not an interrupted delta, so there is nothing to resume.
+            if resume:
+                logger.info("Not resuming: an incremental run never writes over an earlier export")
+                resume = False
+            output_file = delta_path(output_file)
+            logger.info(f"Writing the changes to {output_file}; the existing output is kept")
+        self.output_file = output_file
+        journal = JobJournal.for_output(output_file)
+        self._completed = journal.load() if resume else set()
+        self._delta_sized = asyncio.Event()
+        listed = asyncio.Queue(self.queue_size)
+        matched = asyncio.Queue(self.queue_size)
+        resolved = asyncio.Queue(self.queue_size)
+        prepared = asyncio.ensure_future(self._prepare(folder_path))
+        stages = [
+            prepared,
+            asyncio.ensure_future(self._list(folder_path, start_cursor, listed, use_cache=not incremental)),
+            asyncio.ensure_future(self._filter(file_filter, listed, matched)),
+            asyncio.ensure_future(self._resolve(prepared, matched, resolved)),
+        ]
+        writer = create_writer(output_format, output_file, append=bool(self._completed))
+        finished = False
+        try:
+            # The writer journals each path once the chunk holding its link is on disk.
+            await writer.open(journal)
+            while True:
+                item = await self._next_resolved(resolved, stages)
+                if item is _DONE:
+                    break
+                file_folder, path, url = item
+                if url:
+                    await writer.write(OutputRecord(file_folder, path, url))
+                else:
+                    self.errors += 1
+                self.processed += 1
+                yield self.processed, self.discovered
+            await writer.write_deleted(self.deleted_paths)
+            # Surface any error raised by an upstream stage.
+            await asyncio.gather(*stages)
+            finished = True
+        finally:
+            for stage in stages:
+                stage.cancel()
+            await writer.close(completed=finished)
+            journal.close(completed=finished)
+        # Only a fully written run may advance the stored cursor.
+        if self.cursor:
+            self.cursor_store.save(folder_path, file_types, file_filter.fingerprint, self.cursor)
+
+    @staticmethod
+    async def _next_resolved(queue: asyncio.Queue, stages: List[asyncio.Future]):
+        """The next resolved item, or the error of a failed stage rather than waiting forever for one."""
+        if not queue.empty():
+            return queue.get_nowait()
+        getter = asyncio.ensure_future(queue.get())
+        try:
+            while True:
+                done, _ = await asyncio.wait([getter, *stages], return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    return getter.result()
+                for stage in done:
+                    if not stage.cancelled() and stage.exception() is not None:
+                        raise stage.exception()
+                stages = [stage for stage in stages if not stage.done()]
+        finally:
+            getter.cancel()
+
+    async def _prepare(self, folder_path: str) -> None:
+        # Runs alongside listing; the resolver waits for it before the first lookup.
+        await self.file_processor.warm_link_cache(folder_path)
+        if not PREFETCH_SHARED_LINKS:
+            return
+        if self.is_delta:
+            # Most deltas are a handful of files, which are cheaper to look up one by one
+            # than paging through every shared link on the account.
+            await self._delta_sized.wait()
+            if self.discovered < self._prefetch_threshold:
+                logger.debug(f"{self.discovered} changed files; looking up their shared links individually")
+                return
+        await self.file_processor.prefetch_shared_links()
+
+    async def _list(self, folder_path: str, cursor: Optional[str], out: asyncio.Queue, use_cache: bool) -> None:
+        try:
+            try:
+                if use_cache and cursor is None and self.dropbox_service.listing_cache.peek(folder_path) is not None:
+                    await self._list_cached(folder_path, out)
+                else:
+                    await self._list_pages(folder_path, cursor, out)
+            except ApiError as e:
+                if cursor is None or not DropboxService.is_cursor_reset(e):
+                    raise
+                logger.warning(f"Stored cursor for {folder_path} is no longer valid; running a full listing")
+                self.is_delta = False
+                await self._list_pages(folder_path, None, out)
+        except Exception as e:
+            logger.error(f"Error listing files in {folder_path}: {str(e)}")
+            await out.put(_DONE)
+            raise
+        self.listing_complete = True
+        logger.debug(f"Listing complete: {self.listed} entries, {self.discovered} matching files")
+        await out.put(_DONE)
+
+    async def _list_pages(self, folder_path: str, cursor: Optional[str], out: asyncio.Queue,
+                          keep_cursor: bool = True) -> None:
+        async for page in self.dropbox_service.aiter_pages(folder_path, recursive=True, cursor=cursor):
+            for entry in page.entries:
+                self.listed += 1
+                await out.put(entry)
+            if keep_cursor:
+                self.cursor = page.cursor
+
+    async def _list_cached(self, folder_path: str, out: asyncio.Queue) -> None:
+        """Serve cached folders from the listing cache and list the uncached subtrees below them."""
+        listing_cache = self.dropbox_service.listing_cache
+        served = 0
+        pending = [folder_path]
+        while pending:
+            path = pending.pop()
+            if listing_cache.peek(path) is None:
+                await self._list_pages(path, None, out, keep_cursor=False)
+                continue
+            # Stale listings cost one list_folder/continue call, which also drops the cached subfolders it
+            # finds changed; those are then listed in full like any uncached subtree.
+            listing = await listing_cache.aget(path)
+            served += 1
+            folders = sorted(folder.path_lower for folder in listing.folders)
+            self.listed += len(folders)
+            for entry in listing.files:
+                self.listed += 1
+                await out.put(entry)
+            # Depth first, in sorted order; each subfolder's listing is looked up when it is reached.
+            pending.extend(reversed(folders))
+        logger.debug(f"Served {served} folders under {folder_path or '/'} from the listing cache")
+
+    async def _filter(self, file_filter: FileFilter, inbox: asyncio.Queue, out: asyncio.Queue) -> None:
+        try:
+            await self._filter_entries(file_filter, inbox, out)
+        except Exception as e:
+            logger.error(f"Error filtering files: {str(e)}")
+            raise
+        finally:
+            self._delta_sized.set()
+            await out.put(_DONE)
+
+    async def _filter_entries(self, file_filter: FileFilter, inbox: asyncio.Queue, out: asyncio.Queue) -> None:
+        while True:
+            entry = await inbox.get()
+            if entry is _DONE:
+                break
+            if isinstance(entry, (FileMetadata, ListedFile)):
+                if file_filter(entry):
+                    self.discovered += 1
+                    if self.discovered == self._prefetch_threshold:
+                        self._delta_sized.set()
+                    if entry.path_lower in self._completed:
+                        # Already linked by the interrupted run this one resumes.
+                        self.skipped += 1
+                        self.processed += 1
+                        continue
+                    await out.put(entry)
+            elif isinstance(entry, DeletedMetadata):
+                # Deleted entries do not say whether they were files or folders; keep
+                # matching files and anything without an extension (usually a folder).
+                if not posixpath.splitext(entry.name)[1] or file_filter.matches_name(entry.name):
+                    self.deleted_paths.append(entry.path_display or entry.path_lower)
+
+    async def _resolve(self, prepared: asyncio.Future,
+                       inbox: asyncio.Queue, out: asyncio.Queue) -> None:
+        async def entries():
+            while True:
+                entry = await inbox.get()
+                if entry is _DONE:
+                    return
+                yield entry
+
+        async def resolve(entry):
+            return await self.file_processor.resolve_link(entry)
+
+        await prepared
+        try:
+            async for entry, result in ordered_map(resolve, entries(), self.concurrency):
+                await out.put((self.file_processor.folder_of(entry), entry.path_lower, result))
+        except Exception:
+            await out.put(_DONE)
+            raise
+        await out.put(_DONE)
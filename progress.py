@@ -0,0 +1,148 @@
+import asyncio
+import time
+from collections import deque
+from typing import Callable, List, NamedTuple, Optional
+from config import PROGRESS_INTERVAL, PROGRESS_LOG_INTERVAL, PROGRESS_RATE_WINDOW, logger
+
+
+class ProgressSnapshot(NamedTuple):
+    processed: int
+    discovered: int
+    listed: int
+    errors: int
+    api_calls: int
+    elapsed: float
+    files_per_second: float
+    api_calls_per_second: float
+    eta: Optional[float]  # Seconds; None until the total is known
+    listing_complete: bool
+    final: bool
+
+
+class _Subscriber:
+    __slots__ = ('callback', 'interval', 'last_sent')
+
+    def __init__(self, callback: Callable[[ProgressSnapshot], None], interval: float):
+        self.callback = callback
+        self.interval = interval
+        self.last_sent = float('-inf')
+
+
+class ProgressTracker:
+    """Coalesces a job's progress into snapshots delivered at a fixed frame rate.
+
+    Nothing is pushed per file: the pipeline and the rate limiter only bump their
+    own counters, and a ticker task samples them every ``interval`` seconds.
+    Rates are rolling averages over the last ``rate_window`` seconds. Each
+    subscriber may ask for a slower cadence; every subscriber gets the final
+    snapshot. Subscribers are called on the event loop thread.
+    """
+
+    def __init__(self, interval: float = PROGRESS_INTERVAL, rate_window: float = PROGRESS_RATE_WINDOW):
+        self.interval = interval
+        self.rate_window = rate_window
+        self.pipeline = None
+        self.rate_limiter = None
+        self._subscribers: List[_Subscriber] = []
+        self._samples = deque()
+        self._started = time.monotonic()
+        self._api_calls_at_start = 0
+        self._last_state = None
+        self._ticker: Optional[asyncio.Task] = None
+
+    def subscribe(self, callback: Callable[[ProgressSnapshot], None],
+                  interval: Optional[float] = None) -> Callable[[], None]:
+        """Call ``callback(snapshot)`` at most every ``interval`` seconds; returns an unsubscribe function."""
+        subscriber = _Subscriber(callback, interval or 0.0)
+        self._subscribers.append(subscriber)
+        return lambda: self._subscribers.remove(subscriber)
+
+    def attach(self, pipeline, rate_limiter=None) -> None:
+        """Sample counters from ``pipeline`` (and API calls from ``rate_limiter``) from now on."""
+        self.pipeline = pipeline
+        self.rate_limiter = rate_limiter
+        self._api_calls_at_start = rate_limiter.calls if rate_limiter else 0
+        self._started = time.monotonic()
+        self._samples.clear()
+        self._last_state = None
+
+    def snapshot(self, final: bool = False) -> ProgressSnapshot:
+        now = time.monotonic()
+        pipeline = self.pipeline
+        processed = pipeline.processed if pipeline else 0
+        discovered = pipeline.discovered if pipeline else 0
+        api_calls = (self.rate_limiter.calls - self._api_calls_at_start) if self.rate_limiter else 0
+        listing_complete = bool(pipeline and pipeline.listing_complete)
+
+        self._samples.append((now, processed, api_calls))
+        while len(self._samples) > 2 and now - self._samples[1][0] >= self.rate_window:
+            self._samples.popleft()
+        first_time, first_processed, first_calls = self._samples[0]
+        span = now - first_time
+        files_per_second = (processed - first_processed) / span if span > 0 else 0.0
+        api_calls_per_second = (api_calls - first_calls) / span if span > 0 else 0.0
+
+        eta = None
+        if listing_complete:
+            remaining = discovered - processed
+            if remaining <= 0:
+                eta = 0.0
+            elif files_per_second > 0:
+                eta = remaining / files_per_second
+        return ProgressSnapshot(
+            processed=processed, discovered=discovered, listed=pipeline.listed if pipeline else 0,
+            errors=pipeline.errors if pipeline else 0, api_calls=api_calls, elapsed=now - self._started,
+            files_per_second=files_per_second, api_calls_per_second=api_calls_per_second, eta=eta,
+            listing_complete=listing_complete, final=final,
+        )
+
+    def publish(self, final: bool = False) -> None:
+        snapshot = self.snapshot(final)
+        state = (snapshot.processed, snapshot.discovered, snapshot.listed, snapshot.errors,
+                 snapshot.listing_complete)
+        if state == self._last_state and not final:
+            return
+        self._last_state = state
+        now = time.monotonic()
+        for subscriber in list(self._subscribers):
+            if final or now - subscriber.last_sent >= subscriber.interval:
+                subscriber.last_sent = now
+                try:
+                    subscriber.callback(snapshot)
+                except Exception as e:
+                    logger.error(f"Error in progress subscriber {subscriber.callback!r}: {str(e)}")
+
+    async def _tick(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self.publish()
+
+    def start(self) -> None:
+        if self._ticker is None:
+            self._ticker = asyncio.ensure_future(self._tick())
+
+    def stop(self) -> None:
+        """Stop ticking and deliver the final snapshot."""
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+        self.publish(final=True)
+
+
+def format_progress(snapshot: ProgressSnapshot) -> str:
+    total = f"{snapshot.discovered}" if snapshot.listing_complete else f"{snapshot.discovered}+"
+    message = (f"Processed {snapshot.processed} of {total} files, {snapshot.files_per_second:.1f} files/s, "
+               f"{snapshot.api_calls_per_second:.1f} API calls/s")
+    if snapshot.eta is not None and not snapshot.final:
+        message += f", ETA {snapshot.eta:.0f}s"
+    if snapshot.errors:
+        message += f", {snapshot.errors} errors"
+    return message
+
+
+def log_progress(snapshot: ProgressSnapshot) -> None:
+    logger.info(format_progress(snapshot))
+
+
+def subscribe_logging(tracker: ProgressTracker, interval: float = PROGRESS_LOG_INTERVAL) -> Callable[[], None]:
+    return tracker.subscribe(log_progress, interval)
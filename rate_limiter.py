@@ -0,0 +1,155 @@
+import asyncio
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+from config import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class TokenBucketRateLimiter:
+    """Token bucket shared by every Dropbox API call.
+
+    Callers reserve a token under a lock and then wait outside it, so the same
+    limiter works from coroutines (``acquire``) and from worker threads
+    (``acquire_sync``) without ever blocking the event loop.
+
+    The refill rate adapts AIMD-style: a 429 halves it (never below ``min_rate``)
+    and pauses the bucket for the server's ``Retry-After``; every successful call
+    adds ``increase`` back, up to ``max_rate``.
+    """
+
+    def __init__(self, rate: float, burst: int, min_rate: Optional[float] = None,
+                 max_rate: Optional[float] = None, increase: float = 0.05, decrease_factor: float = 0.5):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = float(rate)
+        self.burst = burst
+        self.max_rate = float(max_rate or rate)
+        self.min_rate = float(min_rate or rate / 20)
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self._tokens = float(burst)
+        self._updated = self._clock()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        # API calls that have reserved a token, retries included.
+        self.calls = 0
+
+    # Subclasses sharing state between processes need a clock that all of them agree on.
+    _clock = staticmethod(time.monotonic)
+
+    def _refill(self, now: float) -> None:
+        if now > self._updated:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def _reserve(self) -> float:
+        """Take one token and return how long the caller must wait before using it."""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self._tokens -= 1
+            self.calls += 1
+            # _updated lies in the future while the bucket is paused by a server backoff.
+            return (self._updated - now) + max(0.0, -self._tokens) / self.rate
+
+    async def acquire(self) -> None:
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self) -> None:
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self._refill(self._clock())
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            pause = retry_after if retry_after is not None else 1.0 / self.rate
+            # A burst of in-flight calls tends to hit the same 429; only back off once per pause window.
+            if now >= self._last_decrease + pause:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self._last_decrease = now
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = max(self._updated, now + pause)
+            rate = self.rate
+        logger.warning("Rate limited by Dropbox; pausing %.1fs and lowering rate to %.2f calls/s", pause, rate)
+
+
+class SharedTokenBucketRateLimiter(TokenBucketRateLimiter):
+    """A token bucket whose state lives in a small file shared by several processes.
+
+    Every process opening the same ``path`` draws from one budget, and 429
+    backoffs seen by one process slow all of them down. Each operation reads the
+    state, applies the usual token bucket logic and writes it back under an
+    exclusive ``flock``, using wall-clock time since monotonic clocks are not
+    comparable across processes. The first process to open the file seeds it
+    with ``rate`` and ``burst``. POSIX only.
+    """
+
+    _STATE = struct.Struct('<4d')  # tokens, updated, rate, last_decrease
+    _clock = staticmethod(time.time)
+
+    def __init__(self, path: str, rate: float, burst: int, **kwargs):
+        if fcntl is None:
+            raise RuntimeError("A shared rate limiter needs fcntl, which is only available on POSIX systems")
+        super().__init__(rate, burst, **kwargs)
+        self.path = path
+        self._fd = None
+        self._pid = None
+        self._file_lock = threading.Lock()
+        with self._shared():
+            pass
+
+    def _file(self) -> int:
+        # Descriptors are not shared with forked children; each process opens its own.
+        if self._fd is None or self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+        return self._fd
+
+    @contextmanager
+    def _shared(self):
+        with self._file_lock:
+            fd = self._file()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                data = os.pread(fd, self._STATE.size, 0)
+                if len(data) == self._STATE.size:
+                    self._tokens, self._updated, self.rate, self._last_decrease = self._STATE.unpack(data)
+                yield
+                os.pwrite(fd, self._STATE.pack(self._tokens, self._updated, self.rate, self._last_decrease), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _reserve(self) -> float:
+        with self._shared():
+            return super()._reserve()
+
+    def on_success(self) -> None:
+        with self._shared():
+            super().on_success()
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        with self._shared():
+            super().on_rate_limited(retry_after)
+
+    def close(self) -> None:
+        if self._fd is not None and self._pid == os.getpid():
+            os.close(self._fd)
+        self._fd = None
@@ -0,0 +1,208 @@
+"""Link generation sharded across worker processes.
+
+One process is held back by the GIL and the SDK's blocking ``requests`` calls
+long before it reaches the API quota. ``ShardedRunner`` collects the file set
+once, splits it into contiguous shards and resolves each shard in its own
+process, with its own ``DropboxService`` session. All workers draw from one
+``SharedTokenBucketRateLimiter``, set up like the parent's rate limiter, so
+together they stay within the parent's budget.
+Shards write their links as JSON lines, which are merged in shard order into
+the requested output format, so the result is identical to a single-process run.
+"""
+import asyncio
+import functools
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+from config import DROPBOX_BACKEND, LINK_CONCURRENCY, PREFETCH_SHARED_LINKS, logger
+from file_filter import FileFilter
+from file_processor import FileProcessor
+from file_store import FileStore
+from output_writers import OutputRecord, create_writer
+
+# Shared with the parent: files processed by each shard, then API calls made by each shard.
+_counters = None
+
+
+def split_store(store: FileStore, shards: int) -> List[FileStore]:
+    """Split ``store`` into up to ``shards`` stores of near-equal size, keeping file order."""
+    total = len(store)
+    parts = [FileStore() for _ in range(max(1, min(shards, total)))]
+    for index, (folder, path) in enumerate(store):
+        parts[index * len(parts) // total].add(folder, path)
+    return parts
+
+
+def _init_worker(counters) -> None:
+    global _counters
+    _counters = counters
+
+
+def _run_shard(shard: int, settings: Dict) -> Dict:
+    """Worker process entry point: resolve one shard's links into a JSON lines file."""
+    return asyncio.run(_resolve_shard(shard, settings))
+
+
+async def _resolve_shard(shard: int, settings: Dict) -> Dict:
+    from dropbox_service import DropboxService
+    from rate_limiter import SharedTokenBucketRateLimiter
+
+    rate_limiter = SharedTokenBucketRateLimiter(settings['budget_file'], **settings['rate_limit'])
+    client = None
+    if settings['backend'] == 'fake':
+        from fake_dropbox import FakeDropbox
+        # The same synthetic account as the parent's, so shards resolve the files it listed.
+        fake_spec = settings['fake_spec']
+        client = FakeDropbox(**fake_spec) if fake_spec is not None else FakeDropbox.from_config()
+    service = DropboxService(rate_limiter=rate_limiter, client=client)
+    try:
+        service.set_access_token(settings['access_token'])
+        if settings['link_index_file']:
+            with open(settings['link_index_file'], encoding='utf-8') as f:
+                service.shared_link_index = json.load(f)
+        store = FileStore.load(settings['shards'][shard])
+        processor = FileProcessor(service)
+        shard_count = len(settings['shards'])
+        async for processed, _ in processor.process_files(store, settings['outputs'][shard], 'jsonl',
+                                                          concurrency=settings['concurrency'], prefetch=False):
+            _counters[shard] = processed
+            _counters[shard_count + shard] = rate_limiter.calls
+        return {'shard': shard, 'files': len(store), 'api_calls': rate_limiter.calls,
+                'metrics': service.metrics.snapshot()['endpoints']}
+    finally:
+        rate_limiter.close()
+
+
+class ShardedRunner:
+    """Generate links for one root with ``processes`` worker processes.
+
+    ``concurrency`` is per worker. The parent lists the root and, with
+    ``PREFETCH_SHARED_LINKS``, indexes existing shared links once for all
+    workers. Incremental and resumed runs are not supported in this mode.
+
+    Exposes the same counters as ``LinkPipeline``, and ``calls`` like a rate
+    limiter, summed over the parent and its workers, so a ``ProgressTracker``
+    can be attached to it.
+    """
+
+    def __init__(self, file_processor: FileProcessor, processes: int, concurrency: Optional[int] = None,
+                 backend: str = DROPBOX_BACKEND):
+        if processes < 1:
+            raise ValueError("processes must be at least 1")
+        self.file_processor = file_processor
+        self.dropbox_service = file_processor.dropbox_service
+        self.processes = processes
+        self.concurrency = concurrency or LINK_CONCURRENCY
+        self.backend = backend
+        self.listed = 0
+        self.discovered = 0
+        self.errors = 0
+        self.listing_complete = False
+        self.shard_results: List[Dict] = []
+        self._counters = None
+
+    @property
+    def processed(self) -> int:
+        return sum(self._counters[:len(self._counters) // 2]) if self._counters is not None else 0
+
+    @property
+    def calls(self) -> int:
+        worker_calls = sum(self._counters[len(self._counters) // 2:]) if self._counters is not None else 0
+        return self.dropbox_service.rate_limiter.calls + worker_calls
+
+    async def run(self, folder_path: str, output_file: str, output_format: str, file_types: List[str],
+                  file_filter: Optional[FileFilter] = None) -> AsyncGenerator[Tuple[int, int], None]:
+        """Collect, resolve in worker processes, then merge; yields ``(processed, total)`` while workers run."""
+        store = await self.file_processor.collect_files(folder_path, file_types, file_filter=file_filter)
+        if store is None:
+            raise RuntimeError(f"Could not list {folder_path or '/'}")
+        self.listed = self.discovered = len(store)
+        self.listing_complete = True
+        # Nothing to resolve: no workers, just an empty output.
+        shards = split_store(store, self.processes) if store else []
+        logger.info(f"Resolving {len(store)} files in {len(shards)} worker processes")
+        work_dir = tempfile.mkdtemp(prefix='.shards-', dir=os.path.dirname(os.path.abspath(output_file)))
+        try:
+            settings = self._prepare(work_dir, shards)
+            if PREFETCH_SHARED_LINKS and store:
+                await self.file_processor.prefetch_shared_links()
+                index = self.dropbox_service.shared_link_index
+                if index is not None:
+                    settings['link_index_file'] = os.path.join(work_dir, 'shared_links.json')
+                    with open(settings['link_index_file'], 'w', encoding='utf-8') as f:
+                        json.dump(index, f)
+            if shards:
+                async for counts in self._run_workers(settings):
+                    yield counts
+            await self._merge(settings['outputs'], output_file, output_format)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _prepare(self, work_dir: str, shards: List[FileStore]) -> Dict:
+        limiter = self.dropbox_service.rate_limiter
+        settings = {
+            'access_token': self.dropbox_service.access_token,
+            'backend': self.backend,
+            'rate_limit': {'rate': limiter.rate, 'burst': limiter.burst, 'min_rate': limiter.min_rate,
+                           'max_rate': limiter.max_rate, 'increase': limiter.increase,
+                           'decrease_factor': limiter.decrease_factor},
+            'fake_spec': getattr(self.dropbox_service.client, 'spec', None),
+            'concurrency': self.concurrency,
+            'budget_file': os.path.join(work_dir, 'rate_budget'),
+            'link_index_file': None,
+            'shards': [],
+            'outputs': [],
+        }
+        for i, shard in enumerate(shards):
+            settings['shards'].append(os.path.join(work_dir, f'shard-{i}.jsonl.gz'))
+            settings['outputs'].append(os.path.join(work_dir, f'links-{i}.jsonl'))
+            shard.save(settings['shards'][i])
+        return settings
+
+    async def _run_workers(self, settings: Dict) -> AsyncGenerator[Tuple[int, int], None]:
+        # Spawned rather than forked: the parent runs threads (executor, logging) and an SDK session.
+        context = multiprocessing.get_context('spawn')
+        shard_count = len(settings['shards'])
+        self._counters = counters = context.Array('q', 2 * shard_count, lock=False)
+        loop = asyncio.get_running_loop()
+        pool = ProcessPoolExecutor(max_workers=shard_count, mp_context=context,
+                                   initializer=_init_worker, initargs=(counters,))
+        finished = False
+        try:
+            futures = [loop.run_in_executor(pool, _run_shard, shard, settings) for shard in range(shard_count)]
+            pending = set(futures)
+            while pending:
+                _, pending = await asyncio.wait(pending, timeout=0.5)
+                yield self.processed, self.discovered
+            self.shard_results = [future.result() for future in futures]
+            finished = True
+        finally:
+            if finished:
+                pool.shutdown()
+            else:
+                # Cancelled or failed: drop queued shards and let running ones end without blocking the loop.
+                await loop.run_in_executor(None, functools.partial(pool.shutdown, wait=False, cancel_futures=True))
+        for result in self.shard_results:
+            self.dropbox_service.metrics.merge(result['metrics'])
+        api_calls = sum(result['api_calls'] for result in self.shard_results)
+        logger.info(f"Workers finished: {self.processed} files, {api_calls} API calls")
+
+    async def _merge(self, shard_outputs: List[str], output_file: str, output_format: str) -> None:
+        writer = create_writer(output_format, output_file)
+        await writer.open()
+        finished = False
+        try:
+            for shard_output in shard_outputs:
+                with open(shard_output, encoding='utf-8') as f:
+                    for line in f:
+                        item = json.loads(line)
+                        await writer.write(OutputRecord(item['folder'], item['path'], item['url']))
+            finished = True
+        finally:
+            await writer.close(completed=finished)
+        # Workers leave out files whose link could not be resolved.
+        self.errors = self.discovered - writer.records
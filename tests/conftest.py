@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import logger  # noqa: E402
+from dropbox_service import DropboxService  # noqa: E402
+from fake_dropbox import FakeDropbox  # noqa: E402
+from file_processor import FileProcessor  # noqa: E402
+from link_cache import create_link_cache  # noqa: E402
+from rate_limiter import TokenBucketRateLimiter  # noqa: E402
+
+FILE_TYPES = ['Audio', 'Video', 'Image', 'Document']
+
+# The app's console handler would hold on to the stream pytest swaps per test; let pytest capture logs instead.
+for handler in list(logger.handlers):
+    logger.removeHandler(handler)
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # The link cache, cursor store and log file live relative to the working directory.
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def fake():
+    return FakeDropbox(files=60, depth=2, fanout=3, latency=0.0, rate_limit=None, error_rate=0.0)
+
+
+def make_service(fake, workdir) -> DropboxService:
+    service = DropboxService(client=fake, rate_limiter=TokenBucketRateLimiter(1e6, 1000),
+                             link_cache=create_link_cache(db_path=str(workdir / 'links.sqlite3')))
+    service.set_access_token('fake')
+    return service
+
+
+@pytest.fixture
+def service(fake, workdir):
+    return make_service(fake, workdir)
+
+
+@pytest.fixture
+def processor(service):
+    return FileProcessor(service)
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+import cli
+import dropbox_service
+from fake_dropbox import FakeDropbox
+from file_processor import FileProcessor
+
+
+@pytest.fixture(autouse=True)
+def small_fake(fake, monkeypatch):
+    # The CLI builds its own fake and service; keep them small and unthrottled.
+    monkeypatch.setattr(FakeDropbox, 'from_config', classmethod(lambda cls: fake))
+    monkeypatch.setattr(dropbox_service, 'RATE_LIMIT_RATE', 1e6)
+    monkeypatch.setattr(dropbox_service, 'RATE_LIMIT_BURST', 1000)
+
+
+def events(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_aware_modified_bound(workdir, capsys):
+    output = workdir / 'links.txt'
+    assert cli.main(['/', '--backend', 'fake', '--types', 'Audio', '-o', str(output),
+                     '--modified-after', '2020-01-01T00:00:00+02:00']) == cli.EXIT_OK
+    done = events(capsys)[-1]
+    assert done['event'] == 'done' and done['processed'] > 0
+
+
+def test_failed_links_fail_the_run(workdir, monkeypatch):
+    async def no_link(self, file):
+        return None
+
+    monkeypatch.setattr(FileProcessor, 'resolve_link', no_link)
+    assert cli.main(['/', '--backend', 'fake', '-o', str(workdir / 'links.txt')]) == cli.EXIT_FAILED
+
+
+def test_schedule_with_missing_root_fails(workdir, capsys):
+    assert cli.main(['/folder_00', '/does_not_exist', '--backend', 'fake', '--schedule',
+                     '--output-dir', str(workdir)]) == cli.EXIT_FAILED
+    errors = [event for event in events(capsys) if event['event'] == 'error']
+    assert [event['root'] for event in errors] == ['/does_not_exist']
+
+
+def test_schedule_by_newest_keeps_folders_together(workdir, capsys):
+    assert cli.main(['/', '--backend', 'fake', '--schedule', '--order', 'newest',
+                     '--output-dir', str(workdir)]) == cli.EXIT_OK
+    output = next(event['output'] for event in events(capsys) if event['event'] == 'done')
+    headers = [line for line in open(output, encoding='utf-8') if line.rstrip().endswith(':')]
+    assert headers and len(headers) == len(set(headers))
+
+
+@pytest.mark.parametrize('flags', [['--resume'], ['--resume', '--incremental', '-o', 'links.txt']])
+def test_resume_usage_errors(flags):
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main(['/', '--backend', 'fake', *flags])
+    assert exit_info.value.code == cli.EXIT_USAGE
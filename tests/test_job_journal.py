@@ -0,0 +1,43 @@
+import os
+
+from job_journal import JobJournal
+
+
+def write(journal, paths, resume=False):
+    journal.open(resume=resume)
+    for path in paths:
+        journal.record(path)
+    journal.close()
+
+
+def test_journal_is_folded_into_checkpoint(workdir):
+    journal = JobJournal(str(workdir / 'links.txt.journal'), compact_every=10)
+    paths = [f'/folder/file_{i}.mp3' for i in range(25)]
+    write(journal, paths)
+    with open(journal.path, encoding='utf-8') as f:
+        assert len(f.readlines()) == 5
+    assert os.path.exists(journal.checkpoint_path)
+    assert journal.load() == set(paths)
+
+
+def test_load_compacts_and_skips_torn_line(workdir):
+    journal = JobJournal(str(workdir / 'links.txt.journal'), compact_every=10)
+    paths = [f'/folder/file_{i}.mp3' for i in range(15)]
+    write(journal, paths)
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"path": "/folder/fi')
+    assert journal.load() == set(paths)
+    assert os.path.getsize(journal.path) == 0
+
+    write(journal, ['/folder/more.mp3'], resume=True)
+    assert journal.load() == set(paths) | {'/folder/more.mp3'}
+
+
+def test_completed_job_removes_journal_and_checkpoint(workdir):
+    journal = JobJournal(str(workdir / 'links.txt.journal'), compact_every=2)
+    journal.open()
+    for i in range(5):
+        journal.record(f'/file_{i}.mp3')
+    journal.close(completed=True)
+    assert not os.path.exists(journal.path)
+    assert not os.path.exists(journal.checkpoint_path)
@@ -0,0 +1,35 @@
+import asyncio
+
+from conftest import FILE_TYPES
+from job_scheduler import JobScheduler, LinkJob
+
+
+def test_cancelled_batch_keeps_existing_outputs(processor, fake, workdir):
+    outputs = [workdir / 'folder_00.txt', workdir / 'folder_01.txt']
+    for output in outputs:
+        output.write_text('earlier export\n')
+    file_filter = processor.build_filter(FILE_TYPES)
+    jobs = [LinkJob('/folder_00', str(outputs[0]), file_filter), LinkJob('/folder_01', str(outputs[1]), file_filter)]
+
+    async def cancelled():
+        links = JobScheduler(processor, jobs, concurrency=2, order='newest').run()
+        async for processed, _ in links:
+            if processed == 3:
+                break
+        await links.aclose()
+
+    asyncio.run(cancelled())
+    assert all(output.read_text() == 'earlier export\n' for output in outputs)
+
+
+def test_each_output_is_written_when_its_job_completes(processor, fake, workdir):
+    output = workdir / 'folder_00.txt'
+    job = LinkJob('/folder_00', str(output), processor.build_filter(FILE_TYPES))
+
+    async def consume():
+        async for _ in JobScheduler(processor, [job]).run():
+            pass
+
+    asyncio.run(consume())
+    assert job.written == job.matched > 0
+    assert output.read_text().count('https://') == job.matched
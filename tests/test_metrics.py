@@ -0,0 +1,27 @@
+import pytest
+
+from metrics import ApiMetrics
+
+
+def test_quantiles_interpolate_within_buckets():
+    metrics = ApiMetrics(buckets=(0.1, 1.0))
+    for seconds in (0.2, 0.4, 0.6, 0.8):
+        metrics.observe('files_list_folder', seconds)
+    latency = metrics.snapshot()['endpoints']['files_list_folder']['latency']
+    # All four calls fall in (0.1, 1.0]; the median is halfway through it, not its upper bound.
+    assert latency['p50'] == pytest.approx(0.55)
+    assert latency['min'] == 0.2
+    assert latency['p99'] <= latency['max'] == 0.8
+
+
+def test_merged_quantiles_match_a_single_instance():
+    single, worker = ApiMetrics(buckets=(0.1, 1.0)), ApiMetrics(buckets=(0.1, 1.0))
+    merged = ApiMetrics(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.3, 2.0):
+        single.observe('sharing_list_shared_links', seconds)
+        worker.observe('sharing_list_shared_links', seconds)
+    merged.merge(worker.snapshot()['endpoints'])
+    expected = single.snapshot()['endpoints']['sharing_list_shared_links']['latency']
+    latency = merged.snapshot()['endpoints']['sharing_list_shared_links']['latency']
+    assert latency['min'] == expected['min'] == 0.05
+    assert latency['p95'] == pytest.approx(expected['p95'])
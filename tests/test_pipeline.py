@@ -0,0 +1,162 @@
+import asyncio
+import os
+
+import pytest
+
+from conftest import FILE_TYPES
+from pipeline import LinkPipeline
+
+
+def run(pipeline, output_file, **kwargs):
+    async def consume():
+        async for _ in pipeline.run('', str(output_file), 'txt', FILE_TYPES, **kwargs):
+            pass
+    # A stage that fails must fail the run, not leave it waiting forever.
+    asyncio.run(asyncio.wait_for(consume(), timeout=30))
+
+
+def test_full_run_writes_every_file(processor, fake, workdir):
+    pipeline = LinkPipeline(processor)
+    run(pipeline, workdir / 'links.txt')
+    assert pipeline.processed == pipeline.discovered == fake.files
+    assert pipeline.errors == 0
+    assert (workdir / 'links.txt').read_text().count('https://') == fake.files
+
+
+def test_failing_filter_fails_the_run(processor, workdir):
+    def broken_filter(entry):
+        raise TypeError("can't compare offset-naive and offset-aware datetimes")
+
+    with pytest.raises(TypeError):
+        run(LinkPipeline(processor), workdir / 'links.txt', file_filter=broken_filter)
+
+
+def test_failing_resolver_fails_the_run(processor, workdir, monkeypatch):
+    async def broken_resolve(entry):
+        raise RuntimeError("resolver broke")
+
+    monkeypatch.setattr(processor, 'resolve_link', broken_resolve)
+    with pytest.raises(RuntimeError):
+        run(LinkPipeline(processor), workdir / 'links.txt')
+
+
+def test_incremental_rerun_keeps_existing_output(processor, fake, workdir):
+    output = workdir / 'links.txt'
+    run(LinkPipeline(processor), output, incremental=True)
+    export = output.read_text()
+
+    unchanged = LinkPipeline(processor)
+    run(unchanged, output, incremental=True)
+    assert unchanged.is_delta
+    assert unchanged.discovered == 0
+    assert output.read_text() == export
+
+    fake.add_file('/Folder_00/New.mp3')
+    delta = LinkPipeline(processor)
+    run(delta, output, incremental=True)
+    assert delta.discovered == 1
+    assert output.read_text() == export
+    assert delta.output_file != str(output)
+    with open(delta.output_file, encoding='utf-8') as f:
+        assert f.read().count('https://') == 1
+
+
+def test_incremental_resume_keeps_existing_output(processor, fake, workdir):
+    output = workdir / 'links.txt'
+    run(LinkPipeline(processor), output, incremental=True)
+    export = output.read_text()
+
+    fake.add_file('/Folder_00/New.mp3')
+    delta = LinkPipeline(processor)
+    run(delta, output, incremental=True, resume=True)
+    assert output.read_text() == export
+    with open(delta.output_file, encoding='utf-8') as f:
+        assert f.read().count('https://') == 1
+
+
+def test_delta_larger_than_queue_does_not_hang(processor, fake, workdir):
+    output = workdir / 'links.txt'
+    run(LinkPipeline(processor), output, incremental=True)
+
+    for i in range(40):
+        fake.add_file(f'/Folder_00/New_{i:02d}.mp3')
+    delta = LinkPipeline(processor, queue_size=5)
+    run(delta, output, incremental=True)
+    assert delta.processed == delta.discovered == 40
+
+
+def test_small_delta_skips_shared_link_prefetch(processor, fake, workdir):
+    output = workdir / 'links.txt'
+    run(LinkPipeline(processor), output, incremental=True)
+    calls = dict(fake.calls)
+
+    run(LinkPipeline(processor), output, incremental=True)
+    assert fake.calls['files/list_folder/continue'] - calls.get('files/list_folder/continue', 0) == 1
+    assert fake.calls['sharing/list_shared_links'] == calls['sharing/list_shared_links']
+
+
+def test_cursor_is_not_reused_with_different_filters(processor, workdir):
+    output = workdir / 'links.txt'
+    run(LinkPipeline(processor), output, incremental=True,
+        file_filter=processor.build_filter(FILE_TYPES, min_size=10 ** 9))
+
+    unfiltered = LinkPipeline(processor)
+    run(unfiltered, workdir / 'all.txt', incremental=True)
+    assert not unfiltered.is_delta
+    assert unfiltered.discovered > 0
+
+
+def test_resume_writes_each_file_once(processor, fake, workdir):
+    output = workdir / 'links.txt'
+
+    async def interrupted():
+        links = LinkPipeline(processor, concurrency=4).run('', str(output), 'txt', FILE_TYPES)
+        async for processed, _ in links:
+            if processed == fake.files // 2:
+                break
+        await links.aclose()
+
+    asyncio.run(interrupted())
+    assert os.path.exists(str(output) + '.journal')
+
+    resumed = LinkPipeline(processor)
+    run(resumed, output, resume=True)
+    assert resumed.skipped > 0
+    paths = [line for line in output.read_text().splitlines() if line.startswith('Path: ')]
+    assert len(paths) == len(set(paths)) == fake.files
+    assert not os.path.exists(str(output) + '.journal')
+
+
+def test_fresh_cached_folders_are_not_listed_again(processor, fake, service, workdir):
+    # The folder browser has listed the root and one branch; the rest is not cached.
+    root = service.listing_cache.get('')
+    branch = sorted(folder.path_lower for folder in root.folders)[0]
+    service.listing_cache.get(branch)
+    listed_before = fake.calls['files/list_folder']
+
+    pipeline = LinkPipeline(processor)
+    run(pipeline, workdir / 'links.txt')
+
+    assert pipeline.processed == pipeline.discovered == fake.files
+    assert (workdir / 'links.txt').read_text().count('https://') == fake.files
+    # One recursive listing per uncached subfolder; the root and the cached branch are served from memory.
+    assert fake.calls['files/list_folder'] - listed_before == len(root.folders) - 1 + len(
+        service.listing_cache.peek(branch).folders)
+    assert pipeline.cursor is None
+
+
+def test_stale_cached_folders_are_revalidated_not_listed(processor, fake, service, workdir):
+    root = service.listing_cache.get('')
+    branch = sorted(folder.path_lower for folder in root.folders)[0]
+    service.listing_cache.get(branch)
+    service.listing_cache.revalidate_after = 0  # Every cached listing is now stale
+    calls = dict(fake.calls)
+
+    pipeline = LinkPipeline(processor)
+    run(pipeline, workdir / 'links.txt')
+
+    assert pipeline.processed == pipeline.discovered == fake.files
+    # Each stale folder costs one cursor check; only the uncached subfolders are listed.
+    assert fake.calls['files/list_folder/continue'] - calls.get('files/list_folder/continue', 0) == 2
+    assert fake.calls['files/list_folder'] - calls['files/list_folder'] == len(root.folders) - 1 + len(
+        service.listing_cache.peek(branch).folders)
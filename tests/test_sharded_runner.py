@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from conftest import FILE_TYPES
+from dropbox_service import DropboxService
+from fake_dropbox import FakeDropbox
+from file_processor import FileProcessor
+from link_cache import create_link_cache
+from pipeline import LinkPipeline
+from rate_limiter import TokenBucketRateLimiter
+from sharded_runner import ShardedRunner
+
+
+def run(links):
+    async def consume():
+        async for _ in links:
+            pass
+    asyncio.run(asyncio.wait_for(consume(), timeout=60))
+
+
+def test_sharded_output_matches_single_process(processor, fake, workdir):
+    run(LinkPipeline(processor).run('', str(workdir / 'single.txt'), 'txt', FILE_TYPES))
+
+    # A separate account and link cache, so the sharded run creates every link itself.
+    service = DropboxService(client=FakeDropbox(**fake.spec), rate_limiter=TokenBucketRateLimiter(1e6, 1000),
+                             link_cache=create_link_cache(db_path=str(workdir / 'sharded-links.sqlite3')))
+    service.set_access_token('fake')
+    runner = ShardedRunner(FileProcessor(service), 2, backend='fake')
+    run(runner.run('', str(workdir / 'sharded.txt'), 'txt', FILE_TYPES))
+
+    assert len(runner.shard_results) == 2
+    assert runner.processed == fake.files and runner.errors == 0
+    assert (workdir / 'sharded.txt').read_text() == (workdir / 'single.txt').read_text()
+
+
+def test_missing_root_fails(processor, workdir):
+    with pytest.raises(RuntimeError):
+        run(ShardedRunner(processor, 2, backend='fake').run('/does_not_exist', str(workdir / 'links.txt'), 'txt',
+                                                            FILE_TYPES))
+
+
+def test_no_matching_files_starts_no_workers(processor, workdir):
+    runner = ShardedRunner(processor, 2, backend='fake')
+    run(runner.run('', str(workdir / 'links.txt'), 'txt', FILE_TYPES, file_filter=lambda entry: False))
+    assert runner.shard_results == [] and runner.discovered == 0
+    assert (workdir / 'links.txt').exists()
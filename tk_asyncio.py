@@ -0,0 +1,122 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+import tkinter as tk
+from typing import Any, Callable, Coroutine, List, Tuple
+from config import logger
+
+
+class TkAsyncioBridge:
+    """Runs an asyncio event loop in a background thread alongside Tk's mainloop.
+
+    Tk keeps the main thread and blocks in its own event loop, and the asyncio
+    loop blocks in its selector, so the app is idle when nothing is happening.
+    Coroutines are handed to the loop with ``submit()``. Results and UI updates
+    go back through ``call_in_ui()``, which queues the callback and wakes Tk with
+    a virtual event. Callbacks queued before Tk has drained the previous batch
+    share one wakeup.
+
+    Waking Tk from another thread needs a thread-enabled Tcl, which all current
+    Python builds ship. Without one, the bridge falls back to checking the queue
+    every ``FALLBACK_POLL_MS`` milliseconds.
+    """
+
+    EVENT = '<<AsyncioCallbacks>>'
+    FALLBACK_POLL_MS = 50
+
+    def __init__(self, root: tk.Misc):
+        self.root = root
+        self.loop = asyncio.new_event_loop()
+        self._lock = threading.Lock()
+        self._callbacks: List[Tuple[Callable, tuple]] = []
+        self._wakeup_pending = False
+        self._closed = False
+        self._threaded = bool(int(root.tk.call('info', 'exists', 'tcl_platform(threaded)')))
+        self._thread = threading.Thread(target=self._run_loop, name='asyncio-loop', daemon=True)
+        root.bind(self.EVENT, self._drain, add='+')
+
+    def start(self) -> None:
+        self._thread.start()
+        # Anything queued before the mainloop started is picked up once it runs.
+        self.root.after_idle(self._drain)
+        if not self._threaded:
+            logger.warning("Tcl is not thread-enabled; polling for asyncio callbacks instead")
+            self.root.after(self.FALLBACK_POLL_MS, self._poll)
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Schedule ``coro`` on the asyncio loop; safe to call from any thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def submit_with_callback(self, coro: Coroutine,
+                             callback: Callable[[concurrent.futures.Future], Any]) -> concurrent.futures.Future:
+        """Like ``submit()``, and run ``callback(future)`` on the Tk thread once it is done."""
+        future = self.submit(coro)
+        future.add_done_callback(lambda done: self.call_in_ui(callback, done))
+        return future
+
+    def call_in_ui(self, callback: Callable, *args) -> None:
+        """Run ``callback(*args)`` on the Tk thread; safe to call from any thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._callbacks.append((callback, args))
+            if self._wakeup_pending or not self._threaded:
+                return
+            self._wakeup_pending = True
+        try:
+            self.root.event_generate(self.EVENT, when='tail')
+        except (tk.TclError, RuntimeError):
+            # The mainloop is not running (yet or any more); start() and the next
+            # call retry the wakeup.
+            with self._lock:
+                self._wakeup_pending = False
+
+    def _drain(self, event=None) -> None:
+        with self._lock:
+            callbacks, self._callbacks = self._callbacks, []
+            self._wakeup_pending = False
+        for callback, args in callbacks:
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.error(f"Error in UI callback {callback!r}: {str(e)}", exc_info=True)
+
+    def _poll(self) -> None:
+        self._drain()
+        if not self._closed:
+            self.root.after(self.FALLBACK_POLL_MS, self._poll)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the asyncio loop, cancelling whatever is still running on it.
+
+        Call this from the Tk thread before the root window is destroyed: Tk events
+        are serviced while waiting, so a loop thread that is in the middle of
+        waking Tk can finish.
+        """
+        with self._lock:
+            self._closed = True
+            self._callbacks = []
+        if not self._thread.is_alive():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        deadline = time.monotonic() + timeout
+        while self._thread.is_alive() and time.monotonic() < deadline:
+            try:
+                self.root.update()
+            except tk.TclError:
+                break
+            self._thread.join(0.02)
+        self._thread.join(max(0.0, deadline - time.monotonic()))